@@ -1,21 +1,41 @@
 import time
-from itertools import product
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import pandas as pd
 import seaborn as sns
 from icecream import ic
 from matplotlib import pyplot as plt
-from cachetools import cached, TTLCache
 
-from risk_calculation.mrt_calculation import calculate_mrt
+from risk_calculation.adaptive_grid import evaluate_grid
+from risk_calculation.batch_figures import generate_risk_grid_figures
+from risk_calculation.concurrent_cache import concurrent_cached
+from risk_calculation.deadline import DEFAULT_BUDGET_MS, evaluate_risk_with_deadline
+from risk_calculation.mrt_calculation import MRT_CACHE_SIZE, calculate_mrt
 from risk_calculation.new_risk_eq_v2 import (
     get_sports_heat_stress_curves,
     sports_dict,
 )
+from risk_calculation.snapshot import (
+    SNAPSHOT_FILE,
+    SNAPSHOT_FUNCTIONS,
+    restore_snapshot,
+    save_snapshot,
+)
+from risk_calculation.warmup import (
+    count_risk_entries,
+    expand_schedule,
+    load_schedule,
+    warm_up_mrt_cache,
+    warm_up_risk_cache,
+)
+
+# entries and lifetime (s) of the cache of calculate_risk_value
+RISK_CACHE_SIZE = 2000
+RISK_CACHE_TTL = 3600
 
 
-@cached(cache=TTLCache(maxsize=2000, ttl=3600))
+@concurrent_cached(maxsize=RISK_CACHE_SIZE, ttl=RISK_CACHE_TTL)
 def calculate_risk_value(
     lat: float,
     lon: float,
@@ -75,7 +95,9 @@ def calculate_risk_value(
     -----
     - The function calls calculate_mrt to obtain delta_mrt and combines it with tdb to form
       an operative/radiant temperature used by the sport-specific risk curve.
-    - Results may be cached (depending on function decorators) to speed repeated identical calls.
+    - Results are cached to speed repeated identical calls. The cache is thread-safe, so the
+      function can be called from a thread pool, and concurrent calls with the same arguments
+      compute the result once, see calculate_risk_value.cache.stats().
     - Adjust sport configuration or wind-category mapping if you need different assumptions.
 
     Examples
@@ -102,6 +124,84 @@ def calculate_risk_value(
     return risk
 
 
+def calculate_risk_value_within_budget(
+    lat: float,
+    lon: float,
+    tz: str,
+    time_stamp: str,
+    tdb: float,
+    rh: float,
+    sport_id: str,
+    wind: str = "low",
+    budget_ms: float = DEFAULT_BUDGET_MS,
+):
+    """
+    Latency-bounded variant of calculate_risk_value for the live API.
+
+    The budget covers the MRT and the risk. If the exact thresholds cannot be solved in
+    time, the risk comes from the threshold surrogate and is flagged as approximate, see
+    evaluate_risk_with_deadline and latency_histograms in risk_calculation/deadline.py.
+
+    Returns
+    -------
+    tuple
+        (risk, approximate)
+    """
+    start = time.perf_counter()
+    delta_mrt = calculate_mrt(
+        lat=round(lat, 2), lon=round(lon, 2), tz=tz, time_stamp=time_stamp
+    )
+    return evaluate_risk_with_deadline(
+        tdb=tdb,
+        rh=rh,
+        tr=tdb + delta_mrt,
+        v=sports_dict[sport_id][f"wind_{wind}"],
+        sport_id=sport_id,
+        budget_ms=budget_ms,
+        start=start,
+    )
+
+
+def calculate_risk_values_threaded(
+    requests: pd.DataFrame, workers: int = 8
+) -> np.ndarray:
+    """
+    calculate_risk_value for many requests from a pool of threads sharing its caches.
+
+    Parameters
+    ----------
+    requests : pandas.DataFrame
+        Columns lat, lon, tz, time_stamp, tdb, rh, sport_id and optionally wind (default "low").
+    workers : int, optional
+        Number of threads. Default is 8.
+
+    Returns
+    -------
+    numpy.ndarray
+        The risk of each request, NaN where it cannot be determined.
+    """
+    # numba's TBB threading layer hangs the interpreter at exit if it is first launched from
+    # a worker thread, so the PHS model is evaluated once on the calling thread beforehand
+    get_sports_heat_stress_curves.__wrapped__(
+        tdb=30, rh=50, tr=30, v=0.5, sport_id="soccer"
+    )
+
+    columns = ["lat", "lon", "tz", "time_stamp", "tdb", "rh", "sport_id"]
+    rows = requests.assign(wind=requests.get("wind", "low"))[
+        [*columns, "wind"]
+    ].itertuples(index=False)
+
+    def risk(row):
+        try:
+            # called with keywords to share the cache entries of warm_up_from_schedule
+            return calculate_risk_value(**row._asdict())
+        except ValueError:
+            return np.nan
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return np.fromiter(executor.map(risk, rows), dtype=float, count=len(requests))
+
+
 def check_calculate_risk_value(
     lat: float,
     lon: float,
@@ -133,22 +233,30 @@ def check_calculate_risk_value_grid(
     time_stamp: str,
     sport_id: str,
     wind: str = "low",
+    exact: bool = False,
 ):
-    results = []
-    for t, rh in product(np.arange(25, 45, 1), range(0, 101, 2)):
-        risk_value = calculate_risk_value(
-            lat=lat,
-            lon=lon,
-            tz=tz,
-            time_stamp=time_stamp,
-            tdb=t,
-            rh=rh,
-            sport_id=sport_id,
-            wind=wind,
-        )
-        results.append([t, rh, risk_value])
+    def evaluate(tdb_values, rh_values):
+        return [
+            calculate_risk_value(
+                lat=lat,
+                lon=lon,
+                tz=tz,
+                time_stamp=time_stamp,
+                tdb=t,
+                rh=rh,
+                sport_id=sport_id,
+                wind=wind,
+            )
+            for t, rh in zip(tdb_values, rh_values, strict=True)
+        ]
 
-    df_new = pd.DataFrame(results, columns=["tdb", "rh", "risk"])
+    # only the cells around the boundaries between risk levels are evaluated, about a third
+    # of the calls to calculate_risk_value, see evaluate_grid_adaptive. exact=True solves
+    # every point
+    tdb_values, rh_values = np.arange(25, 45, 1), np.arange(0, 101, 2)
+    risk, _ = evaluate_grid(evaluate, tdb_values, rh_values, exact=exact)
+    tdb, rh = np.meshgrid(tdb_values, rh_values, indexing="ij")
+    df_new = pd.DataFrame({"tdb": tdb.ravel(), "rh": rh.ravel(), "risk": risk.ravel()})
 
     f, ax = plt.subplots(figsize=(10, 8))
     df_pivot = df_new.pivot(index="rh", columns="tdb", values="risk")
@@ -161,6 +269,92 @@ def check_calculate_risk_value_grid(
     plt.show()
 
 
+def warm_up_from_schedule(
+    path: str,
+    tdb_range=(25, 40),
+    rh_range=(30, 80),
+    tdb_step: float = 0.1,
+    rh_step: float = 1,
+    workers: int | None = None,
+    ttl: float = 86_400,
+):
+    """
+    Pre-populate the caches of calculate_mrt and calculate_risk_value from an event schedule.
+
+    Run before the start of a tournament day in the process serving the live queries: the
+    MRT of every session hour and the risk over the expected tdb/rh envelope are solved in
+    bulk, so the first query of the day is a cache hit. Only keyword calls with tdb and rh
+    on the envelope grid hit the pre-populated entries.
+
+    Both caches are resized to hold the entries of the schedule on top of their current
+    entries and of their default size (MRT_CACHE_SIZE and RISK_CACHE_SIZE) left for the
+    other queries, and keep their entries for ttl seconds. The default envelope has about 15k risk
+    entries per session hour, see count_risk_entries, narrow it for long schedules.
+
+    Parameters
+    ----------
+    path : str
+        Schedule file (.csv, .json or .parquet) with one row per session, see load_schedule.
+    tdb_range, rh_range : tuple, optional
+        Envelope of the sessions without tdb_min, tdb_max, rh_min and rh_max columns.
+    tdb_step, rh_step : float, optional
+        Resolution of the tdb and rh of the live queries. Default 0.1 °C and 1 %.
+    workers : int, optional
+        Number of processes used to solve the risk.
+    ttl : float, optional
+        Time (s) the cache entries are kept. Default is one day.
+
+    Returns
+    -------
+    dict
+        Number of "mrt" and "risk" cache entries written.
+    """
+    sessions = expand_schedule(load_schedule(path))
+    envelope = {
+        "tdb_range": tdb_range,
+        "rh_range": rh_range,
+        "tdb_step": tdb_step,
+        "rh_step": rh_step,
+    }
+    calculate_mrt.cache.resize(
+        calculate_mrt.cache.currsize + MRT_CACHE_SIZE + len(sessions), ttl=ttl
+    )
+    calculate_risk_value.cache.resize(
+        calculate_risk_value.cache.currsize
+        + RISK_CACHE_SIZE
+        + count_risk_entries(sessions, **envelope),
+        ttl=ttl,
+    )
+    mrt_entries = calculate_mrt.cache.currsize
+    delta_mrt = warm_up_mrt_cache(sessions, calculate_mrt.cache)
+    risk_entries = warm_up_risk_cache(
+        sessions,
+        delta_mrt,
+        calculate_risk_value.cache,
+        **envelope,
+        workers=workers,
+    )
+    return {"mrt": calculate_mrt.cache.currsize - mrt_entries, "risk": risk_entries}
+
+
+def save_warm_state(path: str = SNAPSHOT_FILE) -> str:
+    """
+    Save the warm caches of calculate_mrt, get_sports_heat_stress_curves and
+    calculate_risk_value with the lookup tables to a snapshot, e.g. after
+    warm_up_from_schedule, see risk_calculation/snapshot.py.
+    """
+    return save_snapshot(
+        path, {**SNAPSHOT_FUNCTIONS, "calculate_risk_value": calculate_risk_value}
+    )
+
+
+def restore_warm_state(path: str = SNAPSHOT_FILE) -> dict:
+    """Restore the state saved by save_warm_state in a new worker process."""
+    return restore_snapshot(
+        path, {**SNAPSHOT_FUNCTIONS, "calculate_risk_value": calculate_risk_value}
+    )
+
+
 def time_function(runs: int = 1_000):
     # Warm-up (loads modules, caches, etc.)
     try:
@@ -222,15 +416,12 @@ if __name__ == "__main__":
         sport_id="equestrian",
     )
 
-    for sport in sports_dict.keys():
-        print(f"--- Sport: {sport} ---")
-        if sport == "fishing":
-            continue
-        check_calculate_risk_value_grid(
-            lat=-33.8688,
-            lon=151.2093,
-            tz="Australia/Sydney",
-            time_stamp="2024-02-01 12:00:00",
-            sport_id=sport,
-            wind="high",  # "high", "med", or "low"
-        )
+    # headless batch generation of the figures/matrix_*.png heatmaps, unchanged figures are skipped
+    generate_risk_grid_figures(
+        lat=-33.8688,
+        lon=151.2093,
+        tz="Australia/Sydney",
+        time_stamp="2024-02-01 12:00:00",
+        sport_ids=[sport for sport in sports_dict.keys() if sport != "fishing"],
+        winds=("high",),  # "high", "med", or "low"
+    )
@@ -0,0 +1,436 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from cachetools import LRUCache
+from cachetools.keys import hashkey
+
+from risk_calculation.batch import (
+    STATION_DECIMALS,
+    calculate_delta_mrt,
+    calculate_risk_arrow,
+    calculate_risk_batch,
+)
+from risk_calculation.deadline import evaluate_risk_with_deadline
+from risk_calculation.harness import check_limits, fixed_offset_zones
+from risk_calculation.incremental import IncrementalRiskSession
+from risk_calculation.mrt_calculation import MRT_INTERPOLATION_ERROR, calculate_mrt
+from risk_calculation.new_risk_eq_v2 import (
+    get_heat_stress_risk_batch,
+    get_heat_stress_thresholds_batch,
+    get_sports_heat_stress_curves,
+    sports_dict,
+)
+from risk_calculation.sport_registry import WIND_CATEGORIES, sport_registry
+from risk_calculation.threshold_surrogate import (
+    RH_RANGE,
+    TR_RANGE,
+    get_heat_stress_risk_surrogate,
+    get_heat_stress_thresholds_surrogate,
+)
+from risk_calculation.warmup import warm_up_mrt_cache, warm_up_risk_cache
+
+LATITUDE_BANDS = ((-45, -23.5), (-23.5, 0), (0, 23.5), (23.5, 60))
+SEASONS = ((12, 1, 2), (3, 4, 5), (6, 7, 8), (9, 10, 11))
+HOUR_BANDS = ((0, 6), (6, 12), (12, 18), (18, 24))
+
+# maximum values of the report columns accepted by check_accuracy_gates
+DEFAULT_GATES = {
+    "batch": {"mismatch_rate": 0},
+    "pipeline": {"mismatch_rate": 0, "max_mrt_error": 1e-6},
+    "quantized": {"mismatch_rate_determined": 0.01, "max_mrt_error": 1e-6},
+    # the resolution of float32 is about 4e-6 °C at 40 °C
+    "float32": {"mismatch_rate_determined": 0.01, "max_mrt_error": 1e-4},
+    # the surrogate always classifies, it is only gated on the determined reference risks
+    "surrogate": {"mismatch_rate_determined": 0.03, "max_threshold_error": 2},
+    "arrow": {"mismatch_rate": 0, "max_mrt_error": 1e-6},
+    # with a budget of a second the exact solver always finishes
+    "deadline": {"mismatch_rate": 0},
+    # the thresholds are reused for tdb within the tolerance of the solved ones
+    "incremental": {"mismatch_rate_determined": 0.01, "max_mrt_error": 1e-6},
+    "warm_up": {"mismatch_rate": 0, "max_mrt_error": 1e-6},
+    "interpolated_mrt": {
+        "mismatch_rate_determined": 0.02,
+        "max_mrt_error": MRT_INTERPOLATION_ERROR[15],
+    },
+}
+
+
+def draw_accuracy_samples(n_samples: int = 660, seed: int = 0) -> pd.DataFrame:
+    """
+    Stratified random inputs over the sports, wind tiers, latitude bands, seasons and hours.
+
+    Every stratum of each dimension gets the same number of samples (up to one), the
+    strata of the different dimensions are combined at random and the values within a
+    stratum are drawn uniformly. tz is the fixed-offset zone of the longitude.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Columns lat, lon, tz, time_stamp, tdb, rh, sport_id and wind.
+    """
+    rng = np.random.default_rng(seed)
+
+    def strata(n_strata):
+        return rng.permutation(np.resize(np.arange(n_strata), n_samples))
+
+    sport_codes = strata(len(sport_registry))
+    winds = np.array(WIND_CATEGORIES)[strata(len(WIND_CATEGORIES))]
+    lat_bands = np.array(LATITUDE_BANDS)[strata(len(LATITUDE_BANDS))]
+    hour_bands = np.array(HOUR_BANDS)[strata(len(HOUR_BANDS))]
+    seasons = strata(len(SEASONS))
+
+    lon = rng.uniform(-180, 180, n_samples)
+    months = [
+        SEASONS[season][month]
+        for season, month in zip(seasons, rng.integers(0, 3, n_samples), strict=True)
+    ]
+    time_stamps = pd.to_datetime(
+        {
+            "year": 2024,
+            "month": months,
+            "day": rng.integers(1, 29, n_samples),
+            "hour": rng.integers(hour_bands[:, 0], hour_bands[:, 1]),
+            "minute": rng.integers(0, 60, n_samples),
+        }
+    )
+    return pd.DataFrame(
+        {
+            "lat": np.round(rng.uniform(lat_bands[:, 0], lat_bands[:, 1]), 2),
+            "lon": np.round(lon, 2),
+            "tz": fixed_offset_zones(lon),
+            "time_stamp": time_stamps.dt.strftime("%Y-%m-%d %H:%M:%S"),
+            "tdb": np.round(rng.uniform(21, 45, n_samples), 1),
+            "rh": np.round(rng.uniform(0, 100, n_samples)),
+            "sport_id": sport_registry.sport_ids[sport_codes],
+            "wind": winds,
+        }
+    )
+
+
+def reference_risk(samples: pd.DataFrame) -> pd.DataFrame:
+    """
+    Reference solution: the scalar calculate_mrt (without its cache) and
+    get_sports_heat_stress_curves, row by row as in calculate_risk_value.
+    """
+    delta_mrt, risk = [], []
+    for row in samples.itertuples():
+        delta = calculate_mrt.__wrapped__(
+            lat=row.lat, lon=row.lon, tz=row.tz, time_stamp=row.time_stamp
+        )
+        try:
+            value = get_sports_heat_stress_curves(
+                tdb=row.tdb,
+                rh=row.rh,
+                tr=row.tdb + delta,
+                v=sports_dict[row.sport_id][f"wind_{row.wind}"],
+                sport_id=row.sport_id,
+            )
+        except ValueError:
+            value = np.nan
+        delta_mrt.append(delta)
+        risk.append(value)
+    return pd.DataFrame(
+        {"delta_mrt": delta_mrt, "risk": np.array(risk, dtype=float)},
+        index=samples.index,
+    )
+
+
+def _solver_inputs(samples, reference):
+    codes = sport_registry.codes(samples["sport_id"].to_numpy())
+    tdb = samples["tdb"].to_numpy(dtype=float)
+    return {
+        "tdb": tdb,
+        "rh": samples["rh"].to_numpy(dtype=float),
+        "tr": tdb + reference["delta_mrt"].to_numpy(dtype=float),
+        "v": sport_registry.wind_speed(codes, samples["wind"].to_numpy()),
+        "sport_codes": codes,
+    }
+
+
+def _batch_mode(samples, reference):
+    return {"risk": get_heat_stress_risk_batch(**_solver_inputs(samples, reference))}
+
+
+def _pipeline_mode(samples, reference, decimals=None, dtype=np.float64):
+    df_results = calculate_risk_batch(samples, decimals=decimals, dtype=dtype)
+    return {
+        "risk": df_results["risk"].to_numpy(),
+        "delta_mrt": df_results["delta_mrt"].to_numpy(),
+        "dedup_ratio": df_results.attrs["dedup_ratio"],
+    }
+
+
+def _quantized_mode(samples, reference):
+    return _pipeline_mode(samples, reference, decimals=STATION_DECIMALS)
+
+
+def _float32_mode(samples, reference):
+    return _pipeline_mode(samples, reference, dtype=np.float32)
+
+
+def _surrogate_mode(samples, reference):
+    inputs = _solver_inputs(samples, reference)
+    thresholds = get_heat_stress_thresholds_surrogate(
+        inputs["rh"], inputs["tr"], inputs["v"], inputs["sport_codes"]
+    )
+    return {
+        "risk": get_heat_stress_risk_surrogate(**inputs),
+        "thresholds": thresholds,
+        "domain": (inputs["tr"] >= TR_RANGE[0])
+        & (inputs["tr"] <= TR_RANGE[1])
+        & (inputs["rh"] >= RH_RANGE[0])
+        & (inputs["rh"] <= RH_RANGE[1]),
+    }
+
+
+def _arrow_mode(samples, reference):
+    table = calculate_risk_arrow(pa.Table.from_pandas(samples, preserve_index=False))
+    return {
+        "risk": table["risk"].to_numpy(),
+        "delta_mrt": table["delta_mrt"].to_numpy(),
+        "dedup_ratio": float(table.schema.metadata[b"dedup_ratio"]),
+    }
+
+
+def _deadline_mode(samples, reference, budget_ms=1000):
+    inputs = _solver_inputs(samples, reference)
+    risk = []
+    for tdb, rh, tr, v, sport_id in zip(
+        inputs["tdb"],
+        inputs["rh"],
+        inputs["tr"],
+        inputs["v"],
+        samples["sport_id"],
+        strict=True,
+    ):
+        try:
+            value, _ = evaluate_risk_with_deadline(
+                tdb, rh, tr, v, sport_id, budget_ms=budget_ms
+            )
+        except ValueError:
+            value = np.nan
+        risk.append(value)
+    return {"risk": np.array(risk, dtype=float)}
+
+
+def _incremental_mode(samples, reference, tdb_change=0.04):
+    # every sample is a venue, the second forecast reuses the MRT and the thresholds
+    # solved for the first one since tdb moved by less than the tolerance
+    session = IncrementalRiskSession(samples[["lat", "lon", "tz", "sport_id", "wind"]])
+    forecast = pd.DataFrame(
+        {
+            "venue": samples.index,
+            "time_stamp": samples["time_stamp"].to_numpy(),
+            "tdb": samples["tdb"].to_numpy(dtype=float),
+            "rh": samples["rh"].to_numpy(dtype=float),
+        }
+    )
+    session.update(forecast.assign(tdb=forecast["tdb"] - tdb_change))
+    result = session.update(forecast)
+    return {
+        "risk": result["risk"].to_numpy(),
+        "delta_mrt": (result["tr"] - result["tdb"]).to_numpy(),
+    }
+
+
+def _warm_up_mode(samples, reference):
+    # one session hour per sample with an envelope of a single point, read back with the
+    # keys of the calls made by calculate_risk_value
+    sessions = samples.assign(
+        tdb_min=samples["tdb"],
+        tdb_max=samples["tdb"],
+        rh_min=samples["rh"],
+        rh_max=samples["rh"],
+    )
+    mrt_cache = LRUCache(maxsize=len(samples))
+    risk_cache = LRUCache(maxsize=2 * len(samples))
+    warm_up_risk_cache(
+        sessions, warm_up_mrt_cache(sessions, mrt_cache), risk_cache, workers=1
+    )
+    delta_mrt, risk = [], []
+    for row in samples.itertuples():
+        delta_mrt.append(
+            mrt_cache.get(
+                hashkey(
+                    lat=round(row.lat, 2),
+                    lon=round(row.lon, 2),
+                    tz=row.tz,
+                    time_stamp=row.time_stamp,
+                ),
+                np.nan,
+            )
+        )
+        risk.append(
+            risk_cache.get(
+                hashkey(
+                    lat=row.lat,
+                    lon=row.lon,
+                    tz=row.tz,
+                    time_stamp=row.time_stamp,
+                    tdb=row.tdb,
+                    rh=row.rh,
+                    sport_id=row.sport_id,
+                    wind=row.wind,
+                ),
+                np.nan,
+            )
+        )
+    return {"risk": np.array(risk, dtype=float), "delta_mrt": np.array(delta_mrt)}
+
+
+def _interpolated_mrt_mode(samples, reference, anchor_minutes=15, half_window=30):
+    # every sample is the middle of a series of one-minute time stamps, so that the
+    # delta_mrt is interpolated between anchors rather than solved at the sample
+    offsets = pd.to_timedelta(np.arange(-half_window, half_window + 1), unit="min")
+    time_stamps = pd.to_datetime(samples["time_stamp"]).to_numpy()
+    series = samples.loc[samples.index.repeat(len(offsets))].assign(
+        time_stamp=(
+            np.repeat(time_stamps, len(offsets)) + np.tile(offsets, len(samples))
+        )
+    )
+    delta_mrt = calculate_delta_mrt(series, anchor_minutes=anchor_minutes)[
+        half_window :: len(offsets)
+    ]
+    inputs = _solver_inputs(samples, reference)
+    inputs["tr"] = inputs["tdb"] + delta_mrt
+    return {"risk": get_heat_stress_risk_batch(**inputs), "delta_mrt": delta_mrt}
+
+
+# accelerated modes compared with the reference, each returns the risk and optionally
+# delta_mrt, the thresholds (t_medium, t_high, t_extreme) of the samples, the domain
+# (boolean mask of the samples within the fitted range of an approximation) and the
+# dedup_ratio (rows per unique input solved)
+FAST_PATHS = {
+    "batch": _batch_mode,
+    "pipeline": _pipeline_mode,
+    "quantized": _quantized_mode,
+    "float32": _float32_mode,
+    "surrogate": _surrogate_mode,
+    "arrow": _arrow_mode,
+    "deadline": _deadline_mode,
+    "incremental": _incremental_mode,
+    "warm_up": _warm_up_mode,
+    "interpolated_mrt": _interpolated_mrt_mode,
+}
+
+
+def run_accuracy_harness(
+    samples: pd.DataFrame = None, modes=None, n_samples: int = 660, seed: int = 0
+):
+    """
+    Compare each accelerated mode with the scalar reference on the same samples.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per mode with mismatch_rate (all the samples, NaN risks compare equal),
+        mismatch_rate_determined (samples with a determined reference risk), mismatch_rate_level_0 ... 3 (samples of each reference risk level) and
+        mismatch_rate_undetermined, max_mrt_error (°C), max_threshold_error (°C, against
+        the exact brentq thresholds, where they are defined and not above tr and within the
+        domain of the mode), dedup_ratio, seconds and speedup (reference time / mode time).
+    """
+    if samples is None:
+        samples = draw_accuracy_samples(n_samples, seed)
+    if modes is None:
+        modes = list(FAST_PATHS)
+
+    start = time.perf_counter()
+    reference = reference_risk(samples)
+    reference_seconds = time.perf_counter() - start
+    reference_risk_values = reference["risk"].to_numpy()
+    levels = pd.Series(reference_risk_values).fillna(-1).to_numpy()
+
+    exact_thresholds = None
+    report = []
+    for mode in modes:
+        start = time.perf_counter()
+        result = FAST_PATHS[mode](samples, reference)
+        seconds = time.perf_counter() - start
+
+        mismatch = ~(
+            (result["risk"] == reference_risk_values)
+            | (np.isnan(result["risk"]) & np.isnan(reference_risk_values))
+        )
+        row = {
+            "mode": mode,
+            "samples": len(samples),
+            "mismatch_rate": mismatch.mean(),
+            "mismatch_rate_determined": mismatch[levels >= 0].mean(),
+        }
+        for level in range(4):
+            row[f"mismatch_rate_level_{level}"] = (
+                mismatch[levels == level].mean() if (levels == level).any() else np.nan
+            )
+        row["mismatch_rate_undetermined"] = (
+            mismatch[levels == -1].mean() if (levels == -1).any() else np.nan
+        )
+        row["max_mrt_error"] = (
+            np.abs(result["delta_mrt"] - reference["delta_mrt"].to_numpy()).max()
+            if "delta_mrt" in result
+            else np.nan
+        )
+        if "thresholds" in result:
+            inputs = _solver_inputs(samples, reference)
+            if exact_thresholds is None:
+                exact_thresholds = get_heat_stress_thresholds_batch(
+                    inputs["rh"], inputs["tr"], inputs["v"], inputs["sport_codes"]
+                )
+            domain = result.get("domain", np.ones(len(samples), dtype=bool))
+            errors = [
+                np.abs(approximate - exact)[(exact <= inputs["tr"]) & domain]
+                for approximate, exact in zip(
+                    result["thresholds"], exact_thresholds, strict=True
+                )
+            ]
+            row["max_threshold_error"] = max(
+                (error.max() for error in errors if error.size), default=np.nan
+            )
+        else:
+            row["max_threshold_error"] = np.nan
+        row["dedup_ratio"] = result.get("dedup_ratio", np.nan)
+        row["seconds"] = seconds
+        row["speedup"] = reference_seconds / seconds
+        report.append(row)
+
+    df_report = pd.DataFrame(report).set_index("mode")
+    df_report.attrs["reference_seconds"] = reference_seconds
+    return df_report
+
+
+def check_accuracy_gates(report: pd.DataFrame, gates: dict | None = None) -> list:
+    """Messages of the gates failed by the report, an empty list if all of them pass."""
+    return check_limits(report, DEFAULT_GATES if gates is None else gates)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Check the accelerated risk paths against the scalar reference."
+    )
+    parser.add_argument(
+        "--samples", type=int, default=660, help="number of stratified samples"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--modes", nargs="+", choices=list(FAST_PATHS), default=None)
+    args = parser.parse_args(argv)
+
+    report = run_accuracy_harness(
+        modes=args.modes, n_samples=args.samples, seed=args.seed
+    )
+    with pd.option_context("display.max_columns", None, "display.width", 200):
+        print(report.T.to_string())
+    print(f"reference: {report.attrs['reference_seconds']:.1f} s")
+
+    failures = check_accuracy_gates(report)
+    for failure in failures:
+        print(f"FAILED {failure}")
+    if not failures:
+        print("All accuracy gates passed.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+import numpy as np
+import pandas as pd
+from icecream import ic
+
+from risk_calculation.new_risk_eq_v2 import (
+    MAX_T_HIGH,
+    MIN_T_MEDIUM,
+    get_heat_stress_risk_batch,
+)
+from risk_calculation.sport_registry import sport_registry
+
+STATISTICS = ("max", "hours_per_level", "hours_at_or_above", "first_exceedance")
+
+# maximum number of (evaluated hour, hour) pairs compared at once when propagating bounds
+BOUNDS_CHUNK_SIZE = 1_000_000
+
+
+class _DominanceBounds:
+    """
+    Lower and upper bounds of the risk level of each hour.
+
+    The risk does not decrease when tdb, rh and tr increase (same sport and wind speed),
+    hence evaluating one hour bounds from below every hour that dominates it and bounds
+    from above every hour it dominates. Hours resolved by the tdb limits are exact from
+    the start and are never evaluated.
+    """
+
+    def __init__(self, tdb, rh, tr, v, sport_codes):
+        self.tdb, self.rh, self.tr, self.v, self.sport_codes = (
+            tdb,
+            rh,
+            tr,
+            v,
+            sport_codes,
+        )
+        self.lower = np.zeros(tdb.size)
+        self.upper = np.full(tdb.size, 3.0)
+        self.upper[tdb < MIN_T_MEDIUM] = 0
+        self.lower[tdb > MAX_T_HIGH] = 3
+        self.evaluated = np.zeros(tdb.size, dtype=bool)
+        # evaluated hours whose risk could not be determined
+        self.undetermined = np.zeros(tdb.size, dtype=bool)
+        # hours sharing sport and wind speed, the only ones that can be compared
+        _, self.model = np.unique(
+            np.column_stack([sport_codes, v]), axis=0, return_inverse=True
+        )
+        self.model = self.model.ravel()
+        # hours of each model, the rows compared with an evaluated hour of that model
+        order = np.argsort(self.model, kind="stable")
+        self.model_hours = np.split(
+            order, np.flatnonzero(np.diff(self.model[order])) + 1
+        )
+
+    @property
+    def exact(self):
+        return (self.lower == self.upper) | self.undetermined
+
+    def evaluate(self, rows):
+        rows = np.flatnonzero(rows)
+        rows = rows[~self.exact[rows]]
+        if rows.size == 0:
+            return
+        risk = get_heat_stress_risk_batch(
+            tdb=self.tdb[rows],
+            rh=self.rh[rows],
+            tr=self.tr[rows],
+            v=self.v[rows],
+            sport_codes=self.sport_codes[rows],
+        )
+        self.evaluated[rows] = True
+        self.undetermined[rows[np.isnan(risk)]] = True
+        rows, risk = rows[~np.isnan(risk)], risk[~np.isnan(risk)]
+        self.lower[rows] = self.upper[rows] = risk
+
+        for model in np.unique(self.model[rows]):
+            same = self.model[rows] == model
+            self._propagate(rows[same], risk[same], self.model_hours[model])
+
+    def _propagate(self, rows, levels, hours):
+        """Bound the hours (of one model) by the levels of the evaluated rows."""
+        tdb, rh, tr = self.tdb[hours], self.rh[hours], self.tr[hours]
+        lower, upper = self.lower[hours], self.upper[hours]
+        chunk = max(1, BOUNDS_CHUNK_SIZE // hours.size)
+        for start in range(0, rows.size, chunk):
+            row = rows[start : start + chunk, None]
+            level = levels[start : start + chunk, None]
+            dominates = (
+                (tdb >= self.tdb[row]) & (rh >= self.rh[row]) & (tr >= self.tr[row])
+            )
+            dominated = (
+                (tdb <= self.tdb[row]) & (rh <= self.rh[row]) & (tr <= self.tr[row])
+            )
+            # 0 and 3 leave the bounds of the hours that are not compared unchanged
+            lower = np.maximum(lower, np.where(dominates, level, 0).max(axis=0))
+            upper = np.minimum(upper, np.where(dominated, level, 3).min(axis=0))
+        self.lower[hours], self.upper[hours] = lower, upper
+
+
+def _pick_per_group(candidates, groups, order):
+    """Row with the highest order among the candidates of each group."""
+    idx = np.flatnonzero(candidates)
+    if idx.size == 0:
+        return np.zeros(candidates.size, dtype=bool)
+    idx = idx[np.lexsort((-order[idx], groups[idx]))]
+    first = np.r_[True, groups[idx][1:] != groups[idx][:-1]]
+    picked = np.zeros(candidates.size, dtype=bool)
+    picked[idx[first]] = True
+    return picked
+
+
+def _resolve_max(bounds, groups):
+    while True:
+        best = pd.Series(bounds.lower).groupby(groups).transform("max").to_numpy()
+        candidates = ~bounds.exact & (bounds.upper > best)
+        if not candidates.any():
+            return
+        bounds.evaluate(_pick_per_group(candidates, groups, bounds.tdb))
+
+
+def _resolve_exact(bounds, groups, ambiguous):
+    """Evaluate, per group, the warmest and the coolest ambiguous hour until none is left."""
+    while True:
+        candidates = ambiguous(bounds)
+        if not candidates.any():
+            return
+        bounds.evaluate(
+            _pick_per_group(candidates, groups, bounds.tdb)
+            | _pick_per_group(candidates, groups, -bounds.tdb)
+        )
+
+
+def _resolve_first_exceedance(bounds, groups, order, level):
+    while True:
+        below = (bounds.upper < level) | bounds.undetermined
+        ambiguous = ~bounds.exact & ~below & (bounds.lower < level)
+        # only the earliest hour of a group not known to be below the level matters
+        earliest = _pick_per_group(~below, groups, -order)
+        candidates = earliest & ambiguous
+        if not candidates.any():
+            return
+        bounds.evaluate(candidates)
+
+
+def aggregate_risk(
+    hourly: pd.DataFrame,
+    level: int = 2,
+    freq: str = "D",
+    group_by=("sport_id",),
+    statistics=STATISTICS,
+) -> pd.DataFrame:
+    """
+    Aggregate the heat-stress risk per period without evaluating every hour in full.
+
+    Parameters
+    ----------
+    hourly : pandas.DataFrame
+        One row per hour with columns time_stamp (local time), tdb (°C), rh (%), tr (°C),
+        sport_id, v (m/s) and the columns in group_by. tr can be obtained from tdb and
+        calculate_mrt_series.
+    level : int, optional
+        Risk level used by hours_at_or_above and first_exceedance. Default is 2.
+    freq : str, optional
+        Pandas period frequency of the aggregation, e.g. "D" (daily), "W" (weekly) or
+        "Q-NOV" (seasons). Default is "D".
+    group_by : tuple of str, optional
+        Columns identifying a series, e.g. ("venue", "sport_id"). Default is ("sport_id",).
+    statistics : tuple of str, optional
+        Subset of "max", "hours_per_level", "hours_at_or_above" and "first_exceedance".
+        Only the hours needed by the requested statistics are evaluated.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per group and period with the requested statistics: max_risk,
+        hours_level_0 ... hours_level_3, hours_at_or_above_{level}, first_exceedance_{level}
+        (NaT if never reached) and hours_undetermined (hours whose risk could not be
+        determined because of NaN thresholds). df.attrs["evaluated_hours"] and
+        df.attrs["total_hours"] report how many hours were actually evaluated.
+
+    Notes
+    -----
+    The risk does not decrease when tdb, rh and tr increase. Every evaluated hour bounds
+    the hours it dominates or is dominated by, for the same sport and wind speed, so these
+    are not evaluated when their bounds already answer the requested statistics. The
+    warmest candidate hours are evaluated first and the maximum stops as soon as it is known.
+    """
+    unknown = set(statistics) - set(STATISTICS)
+    if unknown:
+        raise ValueError(f"Unknown statistics: {sorted(unknown)}")
+
+    group_by = list(group_by)
+    time_stamp = pd.to_datetime(hourly["time_stamp"])
+    keys = [hourly[column] for column in group_by] + [
+        time_stamp.dt.to_period(freq).rename("period")
+    ]
+    groups = hourly.groupby(keys, sort=True).ngroup().to_numpy()
+    order = time_stamp.to_numpy().astype("datetime64[ns]").astype(np.int64)
+
+    bounds = _DominanceBounds(
+        tdb=hourly["tdb"].to_numpy(dtype=float),
+        rh=hourly["rh"].to_numpy(dtype=float),
+        tr=hourly["tr"].to_numpy(dtype=float),
+        v=hourly["v"].to_numpy(dtype=float),
+        sport_codes=sport_registry.codes(hourly["sport_id"].to_numpy()),
+    )
+
+    if "max" in statistics:
+        _resolve_max(bounds, groups)
+    if "first_exceedance" in statistics:
+        _resolve_first_exceedance(bounds, groups, order, level)
+    if "hours_at_or_above" in statistics:
+        _resolve_exact(
+            bounds, groups, lambda b: ~b.exact & (b.lower < level) & (b.upper >= level)
+        )
+    if "hours_per_level" in statistics:
+        _resolve_exact(bounds, groups, lambda b: ~b.exact)
+
+    df_hours = pd.DataFrame({column: hourly[column].to_numpy() for column in group_by})
+    df_hours["period"] = time_stamp.dt.to_period(freq).to_numpy()
+    df_hours["time_stamp"] = time_stamp.to_numpy()
+    df_hours["lower"] = bounds.lower
+    df_hours["upper"] = bounds.upper
+    df_hours["undetermined"] = bounds.undetermined
+    grouped = df_hours.groupby([*group_by, "period"], sort=True)
+
+    df_results = pd.DataFrame(index=grouped.size().index)
+    if "max" in statistics:
+        df_results["max_risk"] = grouped["lower"].max()
+    if "hours_per_level" in statistics:
+        determined = df_hours[~df_hours["undetermined"]]
+        for risk_level in range(4):
+            df_results[f"hours_level_{risk_level}"] = (
+                (determined["lower"] == risk_level)
+                .groupby([determined[c] for c in [*group_by, "period"]])
+                .sum()
+                .reindex(df_results.index, fill_value=0)
+            )
+    if "hours_at_or_above" in statistics:
+        df_results[f"hours_at_or_above_{level}"] = (
+            ((df_hours["lower"] >= level) & ~df_hours["undetermined"])
+            .groupby([df_hours[c] for c in [*group_by, "period"]])
+            .sum()
+        )
+    if "first_exceedance" in statistics:
+        exceeding = df_hours[(df_hours["lower"] >= level) & ~df_hours["undetermined"]]
+        df_results[f"first_exceedance_{level}"] = (
+            exceeding.groupby([*group_by, "period"])["time_stamp"]
+            .min()
+            .reindex(df_results.index)
+        )
+    df_results["hours_undetermined"] = grouped["undetermined"].sum()
+
+    df_results.attrs["evaluated_hours"] = int(bounds.evaluated.sum())
+    df_results.attrs["total_hours"] = len(hourly)
+    return df_results
+
+
+if __name__ == "__main__":
+    from risk_calculation.mrt_calculation import calculate_mrt_series
+
+    time_stamps = pd.date_range("2024-01-01 00:00:00", periods=24 * 7, freq="h")
+    hour = time_stamps.hour.to_numpy()
+    rng = np.random.default_rng(0)
+    tdb_example = (
+        27 + 7 * np.sin((hour - 9) / 24 * 2 * np.pi) + rng.normal(0, 0.5, hour.size)
+    )
+    hourly_example = pd.DataFrame(
+        {
+            "time_stamp": time_stamps,
+            "tdb": np.round(tdb_example, 1),
+            "rh": np.round(np.clip(70 - 1.5 * (tdb_example - 25), 0, 100)),
+            "sport_id": "soccer",
+            "v": 1.0,
+        }
+    )
+    hourly_example["tr"] = hourly_example["tdb"] + calculate_mrt_series(
+        lat=-33.87, lon=151.21, tz="Australia/Sydney", time_stamps=time_stamps
+    )
+    summary = aggregate_risk(hourly_example, level=2)
+    ic(summary)
+    ic(summary.attrs)
@@ -0,0 +1,358 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from icecream import ic
+
+from risk_calculation.mrt_calculation import calculate_mrt_series
+from risk_calculation.new_risk_eq_v2 import get_heat_stress_risk_batch
+from risk_calculation.sport_registry import sport_registry
+
+INPUT_COLUMNS = ["lat", "lon", "tz", "time_stamp", "tdb", "rh", "sport_id"]
+
+# decimals of tdb, rh and tr (°C, %) matching the resolution of the station data
+STATION_DECIMALS = {"tdb": 1, "rh": 0, "tr": 1}
+
+
+def _delta_mrt(
+    lat, lon, tz_codes, tz_names, time_stamps, dtype=np.float64, anchor_minutes=None
+) -> np.ndarray:
+    delta_mrt = np.zeros(len(lat), dtype=dtype)
+    locations = pd.DataFrame(
+        {"lat": np.round(lat, 2), "lon": np.round(lon, 2), "tz": tz_codes}
+    )
+    for (lat_location, lon_location, tz_code), rows in locations.groupby(
+        ["lat", "lon", "tz"], sort=False
+    ).indices.items():
+        inverse, unique_time_stamps = pd.factorize(time_stamps[rows])
+        delta_mrt[rows] = calculate_mrt_series(
+            lat=lat_location,
+            lon=lon_location,
+            tz=tz_names[tz_code],
+            time_stamps=unique_time_stamps,
+            dtype=dtype,
+            anchor_minutes=anchor_minutes,
+        )[inverse]
+    return delta_mrt
+
+
+def calculate_delta_mrt(
+    df: pd.DataFrame, dtype=np.float64, anchor_minutes: float | None = None
+) -> np.ndarray:
+    """
+    delta_mrt (°C) of each row, solved once per location and time stamp.
+
+    As in calculate_risk_value, lat and lon are rounded to 2 decimals. anchor_minutes is
+    passed to calculate_mrt_series to interpolate the delta_mrt of sub-hourly data.
+    """
+    tz_codes, tz_names = pd.factorize(df["tz"])
+    return _delta_mrt(
+        lat=df["lat"].to_numpy(dtype=float),
+        lon=df["lon"].to_numpy(dtype=float),
+        tz_codes=tz_codes,
+        tz_names=tz_names,
+        time_stamps=df["time_stamp"].to_numpy(),
+        dtype=dtype,
+        anchor_minutes=anchor_minutes,
+    )
+
+
+def unique_inputs(columns: dict, decimals: dict | None = None):
+    """
+    Quantize the input columns and find the rows with unique combinations of them.
+
+    Parameters
+    ----------
+    columns : dict
+        Numeric arrays of the same length by name.
+    decimals : dict, optional
+        Number of decimals each column is rounded to, the other columns are not rounded.
+
+    Returns
+    -------
+    quantized : dict
+        The rounded columns.
+    index : numpy.ndarray
+        Position of the first row of each unique combination.
+    inverse : numpy.ndarray
+        Position of the combination of each row in index, i.e. the values computed for
+        the rows index are scattered back to all the rows with values[inverse].
+    """
+    if decimals is None:
+        decimals = {}
+    quantized = {
+        name: np.round(values, decimals[name])
+        if name in decimals
+        else np.asarray(values)
+        for name, values in columns.items()
+    }
+    dtype = np.result_type(
+        *(values.dtype for values in quantized.values() if values.dtype.kind == "f")
+    )
+    # adding 0.0 turns -0.0 into 0.0, the rows are then compared as raw bytes, which is
+    # about three times faster than np.unique(axis=0)
+    rows = np.ascontiguousarray(
+        np.column_stack([values.astype(dtype) + 0.0 for values in quantized.values()])
+    )
+    _, index, inverse = np.unique(
+        rows.view(np.dtype((np.void, rows.dtype.itemsize * rows.shape[1]))).ravel(),
+        return_index=True,
+        return_inverse=True,
+    )
+    return quantized, index, inverse.ravel()
+
+
+def solve_unique_risk(
+    tdb,
+    rh,
+    delta_mrt,
+    sport_codes,
+    winds="low",
+    registry=sport_registry,
+    decimals: dict | None = None,
+    dtype=np.float64,
+):
+    """
+    Risk of each row, solved once per unique combination of the inputs as in
+    calculate_risk_batch, and the number of combinations solved.
+    """
+    v = np.clip(
+        registry.wind_speed(sport_codes, winds),
+        registry.wind_low[sport_codes],
+        registry.wind_high[sport_codes],
+    ).astype(dtype)
+    inputs, index, inverse = unique_inputs(
+        {
+            "tdb": tdb,
+            "rh": rh,
+            "tr": tdb + delta_mrt,
+            "v": v,
+            # the risk only depends on the sport through clo, met and duration
+            "param_code": registry.param_code[sport_codes],
+        },
+        decimals,
+    )
+    risk = get_heat_stress_risk_batch(
+        tdb=inputs["tdb"][index],
+        rh=inputs["rh"][index],
+        tr=inputs["tr"][index],
+        v=inputs["v"][index],
+        sport_codes=sport_codes[index],
+        registry=registry,
+    )
+    return risk[inverse].astype(dtype), len(index)
+
+
+def calculate_risk_batch(
+    df: pd.DataFrame,
+    registry=sport_registry,
+    decimals: dict | None = None,
+    dtype=np.float64,
+    mrt_anchor_minutes: float | None = None,
+) -> pd.DataFrame:
+    """
+    Heat-stress risk of many venues, times and sports at once.
+
+    Batch counterpart of calculate_risk_value in main.py: the MRT is computed with
+    calculate_mrt_series once per location and time stamp, and the risk is only solved
+    with get_heat_stress_risk_batch for the unique combinations of tdb, rh, tr, wind
+    speed (clipped to the range of the sport) and clo, met and duration, then scattered
+    back to the rows. Station data repeats the same conditions many times, sports share
+    the same parameters, and more so once tdb, rh and tr are quantized with decimals.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Columns lat, lon, tz, time_stamp (local time), tdb (°C), rh (%), sport_id and
+        optionally wind ("low", "med" or "high", default "low").
+    registry : SportRegistry, optional
+        Sport parameters used for the rows, default sport_registry.
+    decimals : dict, optional
+        Number of decimals tdb, rh and tr are rounded to before solving the risk, e.g.
+        STATION_DECIMALS. By default the inputs are not rounded and the risk is the same as
+        calculate_risk_value, rounding trades accuracy near the thresholds for fewer
+        unique combinations.
+    dtype : numpy dtype, optional
+        Precision in which the arrays of the rows (tdb, rh, tr, wind speed, delta_mrt,
+        risk) and the columns of the result are stored. np.float32 halves the memory of the
+        result, which is ample for inputs with 0.1 °C resolution. Only the storage changes:
+        the unique combinations are upcast to float64 for the PHS model and the root
+        finder, so the peak memory of the solve and the run time are about the same, see
+        risk_calculation.memory_benchmark. The `float32` mode of risk_calculation.accuracy
+        reports the resulting differences in the risk. Default is np.float64.
+    mrt_anchor_minutes : float, optional
+        For sub-hourly data, the delta_mrt of each location is solved every
+        mrt_anchor_minutes and interpolated in between, see the anchor_minutes parameter
+        of calculate_mrt_series. Default is None, every time stamp is solved.
+
+    Returns
+    -------
+    pandas.DataFrame
+        df with the additional columns delta_mrt, tr and risk. The risk is NaN where the
+        scalar calculate_risk_value would raise a ValueError. attrs["dedup_ratio"] is the
+        number of rows per unique combination solved.
+
+    Examples
+    --------
+    >>> df = pd.DataFrame({"lat": [-33.87], "lon": [151.21], "tz": ["Australia/Sydney"],
+    ...     "time_stamp": ["2024-02-01 15:00:00"], "tdb": [30.0], "rh": [60.0], "sport_id": ["soccer"]})
+    >>> calculate_risk_batch(df)["risk"].tolist()
+    [2.0]
+    """
+    missing = set(INPUT_COLUMNS) - set(df.columns)
+    if missing:
+        raise ValueError(f"The input is missing the columns: {sorted(missing)}")
+
+    sport_codes = registry.codes(df["sport_id"].to_numpy())
+    winds = df["wind"].fillna("low").to_numpy() if "wind" in df.columns else "low"
+    delta_mrt = calculate_delta_mrt(df, dtype=dtype, anchor_minutes=mrt_anchor_minutes)
+    tdb = df["tdb"].to_numpy(dtype=dtype)
+    rh = df["rh"].to_numpy(dtype=dtype)
+    risk, n_solved = solve_unique_risk(
+        tdb, rh, delta_mrt, sport_codes, winds, registry, decimals, dtype
+    )
+
+    df_results = df.copy()
+    df_results["tdb"] = tdb
+    df_results["rh"] = rh
+    df_results["delta_mrt"] = delta_mrt
+    df_results["tr"] = tdb + delta_mrt
+    df_results["risk"] = risk
+    df_results.attrs["dedup_ratio"] = len(df) / max(n_solved, 1)
+    return df_results
+
+
+def _arrow_array(table: pa.Table, name: str) -> pa.Array:
+    column = table.column(name)
+    # combine_chunks copies even a single chunk
+    return column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+
+
+def _arrow_numeric(array: pa.Array, dtype=np.float64) -> np.ndarray:
+    """NumPy view of a numeric Arrow array, copied only if it has nulls (NaN) or another dtype."""
+    if array.null_count:
+        array = pc.fill_null(array.cast(pa.float64()), np.nan)
+    return array.to_numpy(zero_copy_only=False).astype(dtype, copy=False)
+
+
+def _arrow_dictionary(array: pa.Array):
+    """Indices and dictionary values of an array, dictionary-encoded unless it already is."""
+    if not pa.types.is_dictionary(array.type):
+        array = pc.dictionary_encode(array)
+    return array.indices.to_numpy(zero_copy_only=False), array.dictionary.to_numpy(
+        zero_copy_only=False
+    )
+
+
+def _arrow_time_stamps(array: pa.Array) -> pd.DatetimeIndex:
+    if pa.types.is_timestamp(array.type):
+        time_stamps = pd.DatetimeIndex(array.to_numpy(zero_copy_only=False))
+        # Arrow stores time zone aware time stamps in UTC
+        return time_stamps if array.type.tz is None else time_stamps.tz_localize("UTC")
+    # strings are only parsed once per distinct value
+    indices, dictionary = _arrow_dictionary(array)
+    return pd.DatetimeIndex(pd.to_datetime(dictionary)).take(indices)
+
+
+def calculate_risk_arrow(
+    table,
+    registry=sport_registry,
+    decimals: dict | None = None,
+    dtype=np.float64,
+    mrt_anchor_minutes: float | None = None,
+) -> pa.Table:
+    """
+    calculate_risk_batch for Arrow data, without converting the table to pandas.
+
+    The numeric columns are used as zero-copy NumPy views of the Arrow buffers (they are
+    only copied if they contain nulls, which are treated as NaN, or are not of dtype),
+    sport_id, wind and tz are read as dictionary indices (dictionary-encoded if they are
+    not already) and string time stamps are parsed once per distinct value. Arrow
+    timestamp columns are local times if they have no time zone.
+
+    Parameters
+    ----------
+    table : pyarrow.Table, pyarrow.RecordBatch or polars.DataFrame
+        Same columns as the input of calculate_risk_batch. A polars DataFrame (or any
+        object with a to_arrow method) is converted with to_arrow, which does not copy.
+    registry, decimals, dtype, mrt_anchor_minutes
+        See calculate_risk_batch.
+
+    Returns
+    -------
+    pyarrow.Table
+        table with the additional columns delta_mrt, tr and risk, built on the result
+        arrays without copying them (use polars.from_arrow to get a polars DataFrame).
+        The schema metadata dedup_ratio is the number of rows per unique combination solved.
+
+    Examples
+    --------
+    >>> table = pa.table({"lat": [-33.87], "lon": [151.21], "tz": ["Australia/Sydney"],
+    ...     "time_stamp": ["2024-02-01 15:00:00"], "tdb": [30.0], "rh": [60.0], "sport_id": ["soccer"]})
+    >>> calculate_risk_arrow(table).column("risk").to_pylist()
+    [2.0]
+    """
+    if hasattr(table, "to_arrow"):
+        table = table.to_arrow()
+    if isinstance(table, pa.RecordBatch):
+        table = pa.Table.from_batches([table])
+    missing = set(INPUT_COLUMNS) - set(table.column_names)
+    if missing:
+        raise ValueError(f"The input is missing the columns: {sorted(missing)}")
+
+    sport_array = _arrow_array(table, "sport_id")
+    if sport_array.null_count:
+        raise ValueError("The input has rows without sport_id.")
+    sport_indices, sport_ids = _arrow_dictionary(sport_array)
+    sport_codes = registry.codes(sport_ids)[sport_indices]
+    if "wind" in table.column_names:
+        wind_array = _arrow_array(table, "wind")
+        if wind_array.null_count:
+            wind_array = pc.fill_null(wind_array.cast(pa.string()), "low")
+        wind_indices, wind_categories = _arrow_dictionary(wind_array)
+        winds = wind_categories[wind_indices]
+    else:
+        winds = "low"
+
+    tz_codes, tz_names = _arrow_dictionary(_arrow_array(table, "tz"))
+    delta_mrt = _delta_mrt(
+        lat=_arrow_numeric(_arrow_array(table, "lat")),
+        lon=_arrow_numeric(_arrow_array(table, "lon")),
+        tz_codes=tz_codes,
+        tz_names=tz_names,
+        time_stamps=_arrow_time_stamps(_arrow_array(table, "time_stamp")),
+        dtype=dtype,
+        anchor_minutes=mrt_anchor_minutes,
+    )
+    tdb = _arrow_numeric(_arrow_array(table, "tdb"), dtype)
+    rh = _arrow_numeric(_arrow_array(table, "rh"), dtype)
+    tr = tdb + delta_mrt
+    risk, n_solved = solve_unique_risk(
+        tdb, rh, delta_mrt, sport_codes, winds, registry, decimals, dtype
+    )
+
+    for name, values in (("delta_mrt", delta_mrt), ("tr", tr), ("risk", risk)):
+        table = table.append_column(name, pa.array(values))
+    metadata = {
+        **(table.schema.metadata or {}),
+        b"dedup_ratio": str(table.num_rows / max(n_solved, 1)).encode(),
+    }
+    return table.replace_schema_metadata(metadata)
+
+
+if __name__ == "__main__":
+    time_stamps = pd.date_range("2024-02-01 00:00:00", periods=24, freq="h")
+    rng = np.random.default_rng(0)
+    df_example = pd.DataFrame(
+        {
+            "lat": -33.8688,
+            "lon": 151.2093,
+            "tz": "Australia/Sydney",
+            "time_stamp": time_stamps.astype(str),
+            "tdb": np.round(rng.uniform(22, 38, len(time_stamps)), 1),
+            "rh": np.round(rng.uniform(30, 80, len(time_stamps))),
+            "sport_id": "soccer",
+        }
+    )
+    df_example_results = calculate_risk_batch(df_example, decimals=STATION_DECIMALS)
+    ic(df_example_results, df_example_results.attrs["dedup_ratio"])
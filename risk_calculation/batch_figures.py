@@ -0,0 +1,294 @@
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+import numpy as np
+import pandas as pd
+import seaborn as sns
+from icecream import ic
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from risk_calculation.adaptive_grid import evaluate_grid
+from risk_calculation.manifest import load_manifest, save_manifest
+from risk_calculation.mrt_calculation import calculate_mrt
+from risk_calculation.new_risk_eq_v2 import (
+    get_sports_heat_stress_curves_array,
+    sports_dict,
+)
+
+# same grid as check_calculate_risk_value_grid in main.py
+GRID_TDB = np.arange(25, 45, 1)
+GRID_RH = np.arange(0, 101, 2)
+
+WINDS = ("low", "med", "high")
+
+MANIFEST_FILE = "risk_grid_figures.json"
+
+
+def _init_worker():
+    matplotlib.use("Agg")
+
+
+def figure_inputs_hash(
+    lat, lon, tz, time_stamp, sport_id, wind, location_name, dpi, exact=True
+):
+    """Hash of everything that determines the content of one risk-grid figure."""
+    inputs = {
+        "lat": round(lat, 2),
+        "lon": round(lon, 2),
+        "tz": tz,
+        "time_stamp": time_stamp,
+        "sport": sports_dict[sport_id],
+        "wind": wind,
+        "location_name": location_name,
+        "tdb": GRID_TDB.tolist(),
+        "rh": GRID_RH.tolist(),
+        "evaluation": "exact" if exact else "adaptive",
+        "dpi": dpi,
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+def calculate_sport_risk_grids(delta_mrt, sport_id, winds=WINDS, exact=True):
+    """
+    Risk levels over the tdb x rh grid for one sport and several wind categories.
+
+    The grid of each wind is solved with one vectorized call. With exact=False it is
+    evaluated with evaluate_grid_adaptive instead, which solves the points around the
+    boundaries between risk levels with one call per refinement level and fills the
+    rest of the grid, with rare differences at isolated non-monotone points.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Columns sport_id, wind, tdb, rh and risk.
+    """
+    tdb, rh = np.meshgrid(GRID_TDB, GRID_RH, indexing="ij")
+    tdb, rh = tdb.ravel(), rh.ravel()
+
+    risk = []
+    for wind in winds:
+        v = sports_dict[sport_id][f"wind_{wind}"]
+        risk_wind, _ = evaluate_grid(
+            lambda t, h, v=v: get_sports_heat_stress_curves_array(
+                tdb=t, rh=h, tr=t + delta_mrt, v=v, sport_id=sport_id
+            ),
+            GRID_TDB,
+            GRID_RH,
+            exact=exact,
+        )
+        risk.append(risk_wind.ravel())
+    risk = np.concatenate(risk) if risk else np.empty(0)
+
+    return pd.DataFrame(
+        {
+            "sport_id": sport_id,
+            "wind": np.repeat(winds, tdb.size),
+            "tdb": np.tile(tdb, len(winds)),
+            "rh": np.tile(rh, len(winds)),
+            "risk": risk,
+        }
+    )
+
+
+def calculate_risk_grids(
+    lat, lon, tz, time_stamp, sport_ids, winds=WINDS, workers=None, exact=True
+):
+    """
+    Risk grids of several sports and wind categories at one location and time.
+
+    The MRT is calculated once and the sports are distributed over a pool of
+    `workers` processes (sequential when workers is 1).
+    """
+    delta_mrt = calculate_mrt(
+        lat=round(lat, 2), lon=round(lon, 2), tz=tz, time_stamp=time_stamp
+    )
+
+    if workers == 1 or len(sport_ids) <= 1:
+        grids = [
+            calculate_sport_risk_grids(delta_mrt, sport_id, winds, exact)
+            for sport_id in sport_ids
+        ]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            grids = list(
+                executor.map(
+                    calculate_sport_risk_grids,
+                    [delta_mrt] * len(sport_ids),
+                    sport_ids,
+                    [winds] * len(sport_ids),
+                    [exact] * len(sport_ids),
+                )
+            )
+
+    return pd.concat(grids, ignore_index=True)
+
+
+def plot_risk_grid(
+    df_grid, sport_id, time_stamp, path, location_name="Sydney", dpi=300
+):
+    """
+    Save the heatmap of one risk grid, with the same layout as check_calculate_risk_value_grid.
+
+    The figure is created without pyplot and rendered with the Agg canvas, so it can be
+    called from worker processes and headless machines.
+    """
+    fig = Figure(figsize=(10, 8))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    df_pivot = df_grid.pivot(index="rh", columns="tdb", values="risk")
+    df_pivot.sort_index(ascending=False, inplace=True)
+    sns.heatmap(df_pivot, annot=False, cmap="viridis", ax=ax, vmin=0, vmax=3)
+    ax.set_title(f"Heat Stress Risk for {sport_id} at {time_stamp} in {location_name}")
+    ax.set_xlabel("Dry-Bulb Temperature (°C)")
+    ax.set_ylabel("Relative Humidity (%)")
+    fig.savefig(path, dpi=dpi)
+    return path
+
+
+def generate_risk_grid_figures(
+    lat: float,
+    lon: float,
+    tz: str,
+    time_stamp: str,
+    sport_ids=None,
+    winds=WINDS,
+    output_dir: str = "figures",
+    location_name: str = "Sydney",
+    workers: int | None = None,
+    dpi: int = 300,
+    force: bool = False,
+    exact: bool = True,
+):
+    """
+    Generate the matrix_{sport_id}_wind_{wind}.png figures of all sports without showing them.
+
+    Parameters
+    ----------
+    lat, lon, tz, time_stamp :
+        Location and local time, as in calculate_risk_value.
+    sport_ids : list of str, optional
+        Sports to plot. Default is all the sports in sports_dict.
+    winds : tuple of str, optional
+        Wind categories to plot. Default is ("low", "med", "high").
+    output_dir : str, optional
+        Folder where the figures and the manifest are saved. Default is "figures".
+    location_name : str, optional
+        Name of the location used in the figure title. Default is "Sydney".
+    workers : int, optional
+        Number of worker processes used to compute and render the figures.
+        Default is the number of CPUs.
+    dpi : int, optional
+        Resolution of the figures. Default is 300.
+    force : bool, optional
+        If True, figures are regenerated even if their inputs did not change.
+    exact : bool, optional
+        If True (default) every point of the grids is solved. If False the grids are
+        evaluated by quadtree refinement, see calculate_sport_risk_grids.
+
+    Returns
+    -------
+    dict
+        Lists of the "rendered" and "skipped" figure paths.
+
+    Notes
+    -----
+    The hash of the inputs of each figure is stored in a JSON manifest in output_dir as
+    soon as the figure is saved. Figures whose file exists and whose inputs hash matches
+    the manifest are skipped. If some figures fail to render, the others are still
+    rendered and recorded, and the first error is raised.
+    """
+    if sport_ids is None:
+        sport_ids = list(sports_dict.keys())
+    os.makedirs(output_dir, exist_ok=True)
+
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    manifest = load_manifest(manifest_path)
+
+    todo = {}
+    skipped = []
+    for sport_id in sport_ids:
+        for wind in winds:
+            file_name = f"matrix_{sport_id}_wind_{wind}.png"
+            path = os.path.join(output_dir, file_name)
+            inputs_hash = figure_inputs_hash(
+                lat, lon, tz, time_stamp, sport_id, wind, location_name, dpi, exact
+            )
+            if (
+                not force
+                and manifest.get(file_name) == inputs_hash
+                and os.path.exists(path)
+            ):
+                skipped.append(path)
+                continue
+            todo[(sport_id, wind)] = (file_name, path, inputs_hash)
+
+    rendered = []
+    if todo:
+        # only the sports and winds with at least one figure to render are computed
+        sports_todo = list(dict.fromkeys(sport_id for sport_id, _ in todo))
+        winds_todo = tuple(wind for wind in winds if any(w == wind for _, w in todo))
+        df_grids = calculate_risk_grids(
+            lat,
+            lon,
+            tz,
+            time_stamp,
+            sports_todo,
+            winds=winds_todo,
+            workers=workers,
+            exact=exact,
+        )
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as executor:
+            futures = {}
+            for (sport_id, wind), (file_name, path, inputs_hash) in todo.items():
+                df_grid = df_grids[
+                    (df_grids["sport_id"] == sport_id) & (df_grids["wind"] == wind)
+                ]
+                futures[file_name] = (
+                    executor.submit(
+                        plot_risk_grid,
+                        df_grid,
+                        sport_id,
+                        time_stamp,
+                        path,
+                        location_name,
+                        dpi,
+                    ),
+                    inputs_hash,
+                )
+            # the manifest is updated after each figure, so that the figures rendered
+            # before a failure are skipped by the next run
+            errors = []
+            for file_name, (future, inputs_hash) in futures.items():
+                try:
+                    rendered.append(future.result())
+                except Exception as error:  # noqa: BLE001, re-raised below
+                    errors.append(error)
+                    continue
+                manifest[file_name] = inputs_hash
+                save_manifest(manifest_path, manifest)
+        if errors:
+            raise errors[0]
+
+    return {"rendered": rendered, "skipped": skipped}
+
+
+if __name__ == "__main__":
+    results = generate_risk_grid_figures(
+        lat=-33.8688,
+        lon=151.2093,
+        tz="Australia/Sydney",
+        time_stamp="2024-02-01 12:00:00",
+        sport_ids=[sport for sport in sports_dict if sport != "fishing"],
+    )
+    ic(len(results["rendered"]), len(results["skipped"]))
@@ -0,0 +1,219 @@
+import copy
+import functools
+import threading
+
+from cachetools import LRUCache, TTLCache
+from cachetools.keys import hashkey
+
+
+class _Flight:
+    """Computation of a key in progress, awaited by the other callers of the same key."""
+
+    __slots__ = ("done", "error", "value")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class _Stripe:
+    __slots__ = ("cache", "coalesced", "hits", "in_flight", "lock", "misses")
+
+    def __init__(self, maxsize, ttl):
+        self.lock = threading.Lock()
+        self.cache = LRUCache(maxsize) if ttl is None else TTLCache(maxsize, ttl)
+        self.in_flight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+
+class ConcurrentCache:
+    """
+    Thread-safe cache split into lock-striped cachetools caches, with single-flight misses.
+
+    Each key belongs to one of stripes TTLCache (or LRUCache without ttl) protected by its
+    own lock, so threads working on different keys rarely wait for each other. When
+    several threads miss the same key at once, only the first computes it and the others
+    wait for its result (or a copy of its exception). The locks are only held to read and
+    write the caches, never during a computation.
+
+    Supports the mapping operations used on the cachetools caches (cache[key],
+    cache[key] = value, key in cache, len, items, maxsize and currsize), so the warm-up
+    and snapshot code fill it in the same way.
+    """
+
+    def __init__(self, maxsize: int, ttl: float | None = None, stripes: int = 16):
+        self.ttl = ttl
+        self._stripes = tuple(
+            _Stripe(-(-maxsize // stripes), ttl) for _ in range(stripes)
+        )
+
+    def _stripe(self, key) -> _Stripe:
+        return self._stripes[hash(key) % len(self._stripes)]
+
+    def get_or_compute(self, key, compute):
+        """Value of key, calling compute() once for all the concurrent callers if missing."""
+        stripe = self._stripe(key)
+        with stripe.lock:
+            try:
+                value = stripe.cache[key]
+                stripe.hits += 1
+                return value
+            except KeyError:
+                pass
+            flight = stripe.in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = stripe.in_flight[key] = _Flight()
+                stripe.misses += 1
+            else:
+                stripe.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is None:
+                return flight.value
+            # each waiter raises its own copy of the exception, chained to the one of the
+            # first caller: the same object raised in several threads would collect the
+            # frames of all of them in its traceback. An exception that cannot be copied
+            # is recomputed by the waiter.
+            try:
+                error = copy.copy(flight.error)
+            except TypeError:
+                return compute()
+            raise error from flight.error
+
+        try:
+            flight.value = compute()
+        except BaseException as error:
+            # exceptions are not cached, as with cachetools
+            flight.error = error
+            raise
+        else:
+            with stripe.lock:
+                stripe.cache[key] = flight.value
+            return flight.value
+        finally:
+            with stripe.lock:
+                del stripe.in_flight[key]
+            flight.done.set()
+
+    def __getitem__(self, key):
+        stripe = self._stripe(key)
+        with stripe.lock:
+            return stripe.cache[key]
+
+    def __setitem__(self, key, value):
+        stripe = self._stripe(key)
+        with stripe.lock:
+            stripe.cache[key] = value
+
+    def __contains__(self, key):
+        stripe = self._stripe(key)
+        with stripe.lock:
+            return key in stripe.cache
+
+    def __len__(self):
+        return self.currsize
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def items(self) -> list:
+        """Snapshot of the (key, value) pairs of all the stripes."""
+        items = []
+        for stripe in self._stripes:
+            with stripe.lock:
+                items.extend(stripe.cache.items())
+        return items
+
+    def clear(self):
+        for stripe in self._stripes:
+            with stripe.lock:
+                stripe.cache.clear()
+
+    def resize(self, maxsize: int, ttl: float | None = None):
+        """
+        Replace the caches of the stripes with larger or smaller ones, keeping the entries
+        that fit. The entries kept are valid for ttl seconds from now, the current ttl if
+        not given.
+        """
+        if ttl is None:
+            ttl = self.ttl
+        self.ttl = ttl
+        stripe_maxsize = -(-maxsize // len(self._stripes))
+        for stripe in self._stripes:
+            with stripe.lock:
+                cache = (
+                    LRUCache(stripe_maxsize)
+                    if ttl is None
+                    else TTLCache(stripe_maxsize, ttl)
+                )
+                for key, value in stripe.cache.items():
+                    cache[key] = value
+                stripe.cache = cache
+
+    @property
+    def maxsize(self) -> int:
+        return sum(stripe.cache.maxsize for stripe in self._stripes)
+
+    @property
+    def currsize(self) -> int:
+        total = 0
+        for stripe in self._stripes:
+            with stripe.lock:
+                total += stripe.cache.currsize
+        return total
+
+    def stats(self) -> dict:
+        """
+        Counters since the creation of the cache: hits, misses (computations), coalesced
+        (misses that waited for the computation of another thread), currsize and maxsize.
+        """
+        stats = {"hits": 0, "misses": 0, "coalesced": 0}
+        for stripe in self._stripes:
+            with stripe.lock:
+                stats["hits"] += stripe.hits
+                stats["misses"] += stripe.misses
+                stats["coalesced"] += stripe.coalesced
+        stats["currsize"] = self.currsize
+        stats["maxsize"] = self.maxsize
+        return stats
+
+
+def concurrent_cached(
+    maxsize: int, ttl: float | None = None, stripes: int = 16, key=hashkey
+):
+    """
+    Thread-safe replacement of cachetools.cached(cache=TTLCache(maxsize, ttl)).
+
+    The decorated function keeps the same keys (hashkey of the arguments), its cache is
+    a ConcurrentCache available as function.cache, see ConcurrentCache.stats, and the
+    undecorated function as function.__wrapped__.
+
+    Examples
+    --------
+    >>> @concurrent_cached(maxsize=10_000, ttl=86_400)
+    ... def calculate(lat, lon):
+    ...     ...
+    >>> calculate.cache.stats()
+    {'hits': 0, 'misses': 0, 'coalesced': 0, 'currsize': 0, 'maxsize': 10000}
+    """
+
+    def decorator(function):
+        cache = ConcurrentCache(maxsize, ttl=ttl, stripes=stripes)
+
+        def wrapper(*args, **kwargs):
+            return cache.get_or_compute(
+                key(*args, **kwargs), lambda: function(*args, **kwargs)
+            )
+
+        wrapper.cache = cache
+        return functools.update_wrapper(wrapper, function)
+
+    return decorator
@@ -0,0 +1,145 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from icecream import ic
+
+from risk_calculation.new_risk_eq_v2 import (
+    MAX_T_HIGH,
+    MIN_T_MEDIUM,
+    SolverDeadlineExceeded,
+    get_heat_stress_risk_batch,
+    solver_deadline,
+)
+from risk_calculation.sport_registry import sport_registry
+from risk_calculation.threshold_surrogate import get_heat_stress_risk_surrogate
+
+DEFAULT_BUDGET_MS = 50
+# upper edges (ms) of the buckets of the latency histograms
+LATENCY_BUCKETS_MS = (0.01, 0.03, 0.1, 0.3, 1, 3, 10, 30, 100, 300, 1000, np.inf)
+# limit: tdb outside the threshold limits, exact: solved within the budget,
+# fallback: the budget ran out and the surrogate answered
+LATENCY_PATHS = ("limit", "exact", "fallback")
+
+_histograms = {
+    path: np.zeros(len(LATENCY_BUCKETS_MS), dtype=np.int64) for path in LATENCY_PATHS
+}
+_lock = threading.Lock()
+
+
+def _record_latency(path: str, start: float):
+    bucket = np.searchsorted(LATENCY_BUCKETS_MS, (time.perf_counter() - start) * 1000)
+    with _lock:
+        _histograms[path][bucket] += 1
+
+
+def evaluate_risk_with_deadline(
+    tdb,
+    rh,
+    tr,
+    v,
+    sport_id,
+    budget_ms: float = DEFAULT_BUDGET_MS,
+    start: float | None = None,
+) -> tuple:
+    """
+    Risk level of get_sports_heat_stress_curves within a time budget.
+
+    The thresholds are solved exactly (same roots as the scalar brentq) unless the solver
+    is still running when the budget is spent, in which case it is aborted and the risk
+    is taken from the precomputed threshold surrogate and flagged as approximate. The
+    latency of each call is added to the histogram of its path, see latency_histograms.
+
+    Parameters
+    ----------
+    tdb, rh, tr, v : float
+        Air temperature (°C), relative humidity (%), mean radiant temperature (°C) and
+        air speed (m/s), as in get_sports_heat_stress_curves.
+    sport_id : str
+        Key of sports_dict.
+    budget_ms : float, optional
+        Time budget of the call in milliseconds. Default is DEFAULT_BUDGET_MS.
+    start : float, optional
+        time.perf_counter() value the budget is counted from, e.g. the arrival of the
+        request. Default is the start of the call.
+
+    Returns
+    -------
+    tuple
+        (risk, approximate): the risk level 0-3 and True if it comes from the surrogate.
+
+    Raises
+    ------
+    ValueError
+        If the exact risk cannot be determined, as get_sports_heat_stress_curves.
+    """
+    if start is None:
+        start = time.perf_counter()
+
+    if tdb < MIN_T_MEDIUM or tdb > MAX_T_HIGH:
+        _record_latency("limit", start)
+        return (0 if tdb < MIN_T_MEDIUM else 3), False
+
+    code = sport_registry.code(sport_id)
+    deadline = start + budget_ms / 1000
+    try:
+        if time.perf_counter() > deadline:
+            raise SolverDeadlineExceeded(
+                "The budget was spent before solving the thresholds."
+            )
+        with solver_deadline(deadline):
+            risk = get_heat_stress_risk_batch(
+                tdb=tdb, rh=rh, tr=tr, v=v, sport_codes=code
+            )[()]
+    except SolverDeadlineExceeded:
+        risk = get_heat_stress_risk_surrogate(
+            tdb=tdb, rh=rh, tr=tr, v=v, sport_codes=code
+        )[()]
+        _record_latency("fallback", start)
+        return int(risk), True
+
+    _record_latency("exact", start)
+    if np.isnan(risk):
+        raise ValueError("Risk level could not be determined due to NaN thresholds.")
+    return int(risk), False
+
+
+def latency_histograms() -> pd.DataFrame:
+    """
+    Number of calls of evaluate_risk_with_deadline per path (rows) and latency bucket
+    (columns, labelled by their upper edge in ms) since the last reset.
+    """
+    with _lock:
+        counts = np.array([_histograms[path] for path in LATENCY_PATHS])
+    columns = [f"<={edge:g}ms" for edge in LATENCY_BUCKETS_MS[:-1]] + [
+        f">{LATENCY_BUCKETS_MS[-2]:g}ms"
+    ]
+    return pd.DataFrame(
+        counts, index=pd.Index(LATENCY_PATHS, name="path"), columns=columns
+    )
+
+
+def reset_latency_histograms():
+    """Reset the latency histograms."""
+    with _lock:
+        for histogram in _histograms.values():
+            histogram[:] = 0
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        tdb = round(rng.uniform(20, 45), 1)
+        try:
+            evaluate_risk_with_deadline(
+                tdb=tdb,
+                rh=rng.uniform(0, 100),
+                tr=tdb + rng.uniform(0, 30),
+                v=0.5,
+                sport_id="soccer",
+                budget_ms=5,
+            )
+        except ValueError:
+            pass
+    ic(latency_histograms())
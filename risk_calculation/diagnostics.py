@@ -0,0 +1,83 @@
+import logging
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger("risk_calculation")
+
+# at most RATE_LIMIT messages of the same event are logged every RATE_INTERVAL seconds
+RATE_LIMIT = 10
+RATE_INTERVAL = 60.0
+
+_counts = Counter()
+# event -> [start of the current window, messages logged, messages suppressed]
+_windows = {}
+_lock = threading.Lock()
+
+
+def record(event: str, level: int, msg: str, *args, n: int = 1):
+    """
+    Count an event and log it if the level is enabled and the event is not rate limited.
+
+    The message is %-formatted with args by the logging module only when it is emitted,
+    hence a disabled level costs a counter increment and a level check under the lock of
+    the module, which also makes the counts exact across threads. The first message
+    logged after some were suppressed reports how many were dropped.
+
+    Parameters
+    ----------
+    event : str
+        Name of the event, e.g. "night_time_skip", used by the counters and the rate limiter.
+    level : int
+        Logging level of the message, e.g. logging.DEBUG.
+    msg : str
+        Message with %-style placeholders for args.
+    n : int, optional
+        Number of occurrences of the event represented by this call. Default is 1.
+
+    Examples
+    --------
+    >>> record("night_time_skip", logging.DEBUG, "The sun is below the horizon at %s", "2024-06-01 03:00:00")
+    >>> diagnostic_counts()["night_time_skip"]
+    1
+    """
+    with _lock:
+        _counts[event] += n
+        if not logger.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        window = _windows.get(event)
+        if window is None or now - window[0] >= RATE_INTERVAL:
+            suppressed = window[2] if window is not None else 0
+            window = _windows[event] = [now, 0, 0]
+        else:
+            suppressed = 0
+        if window[1] >= RATE_LIMIT:
+            window[2] += 1
+            return
+        window[1] += 1
+
+    if suppressed:
+        logger.log(level, msg + " (%d similar messages suppressed)", *args, suppressed)
+    else:
+        logger.log(level, msg, *args)
+
+
+def diagnostic_counts() -> dict:
+    """Number of occurrences of each event since the last reset."""
+    with _lock:
+        return dict(_counts)
+
+
+def reset_diagnostics():
+    """Reset the event counters and the rate limiter."""
+    with _lock:
+        _counts.clear()
+        _windows.clear()
+
+
+def log_diagnostic_summary(level: int = logging.INFO):
+    """Log one aggregated line per event, e.g. "8760 night_time_skip"."""
+    if logger.isEnabledFor(level):
+        for event, count in sorted(diagnostic_counts().items()):
+            logger.log(level, "%d %s", count, event)
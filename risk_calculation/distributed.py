@@ -0,0 +1,260 @@
+import dataclasses
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from icecream import ic
+
+from risk_calculation.batch import calculate_risk_batch
+from risk_calculation.manifest import load_manifest, save_manifest
+from risk_calculation.sport_registry import sport_registry
+
+# completed chunks of run_sharded, stored in its output directory
+MANIFEST_FILE = "manifest.json"
+
+# registry shipped to each worker of the local cluster by _init_worker
+_worker_registry = None
+
+
+def _init_worker(registry):
+    global _worker_registry
+    _worker_registry = registry
+
+
+def shard_inputs(df: pd.DataFrame, shard_by: str = "venue", freq: str = "Y") -> dict:
+    """
+    Split the input rows by venue and time range.
+
+    Returns
+    -------
+    dict
+        Maps (venue, period) to the positional indices of the rows of the shard, where
+        period is the pandas Period of freq (e.g. "Y" yearly, "M" monthly) of the rows.
+    """
+    periods = pd.to_datetime(df["time_stamp"]).dt.to_period(freq)
+    return (
+        pd.DataFrame({"venue": df[shard_by].to_numpy(), "period": periods.to_numpy()})
+        .groupby(["venue", "period"], sort=True)
+        .indices
+    )
+
+
+def _shard_file_name(venue, period) -> str:
+    # the hash of the raw key keeps apart the venues whose sanitized names collide, e.g.
+    # "St Kilda" and "St_Kilda", or 1 and "1"
+    key_hash = hashlib.sha256(f"{venue!r}/{period}".encode()).hexdigest()[:8]
+    return f"{re.sub(r'[^A-Za-z0-9_.-]', '_', str(venue))}_{period}_{key_hash}.parquet"
+
+
+def shard_input_hash(df_shard: pd.DataFrame) -> str:
+    """Hash of the input rows of a shard, independent of their index."""
+    return hashlib.sha256(
+        pd.util.hash_pandas_object(df_shard, index=False).to_numpy().tobytes()
+    ).hexdigest()
+
+
+def shard_model_hash(sport_ids, registry=sport_registry) -> str:
+    """Hash of the parameters of the sports of a shard, changes when any of them is updated."""
+    parameters = {
+        sport_id: dataclasses.asdict(registry.record(sport_id))
+        for sport_id in sorted(set(sport_ids))
+    }
+    return hashlib.sha256(json.dumps(parameters, sort_keys=True).encode()).hexdigest()
+
+
+def _load_manifest(output_dir: str) -> dict:
+    return load_manifest(os.path.join(output_dir, MANIFEST_FILE))
+
+
+def _save_manifest(output_dir: str, manifest: dict):
+    save_manifest(os.path.join(output_dir, MANIFEST_FILE), manifest)
+
+
+def _run_shard(df_shard: pd.DataFrame, path: str, registry=None):
+    """Solve one shard on a worker and write it atomically to a Parquet file."""
+    if registry is None:
+        registry = _worker_registry if _worker_registry is not None else sport_registry
+    df_results = calculate_risk_batch(df_shard, registry=registry)
+    df_results.to_parquet(f"{path}.tmp", index=False)
+    os.replace(f"{path}.tmp", path)
+    return path, len(df_results)
+
+
+def run_sharded(
+    df: pd.DataFrame,
+    output_dir: str,
+    executor=None,
+    workers: int | None = None,
+    shard_by: str = "venue",
+    freq: str = "Y",
+    registry=sport_registry,
+    resume: bool = True,
+) -> pd.DataFrame:
+    """
+    Run calculate_risk_batch over shards of the input on a cluster of workers.
+
+    The input is sharded by venue and time range, each shard is solved by a worker which
+    writes its results to output_dir/<venue>_<period>_<hash>.parquet, where the hash of
+    the raw venue and period tells apart venues with the same sanitized name, and the list
+    of the files is returned. Use read_sharded_output to gather them.
+
+    The job is checkpointed: the Parquet files are written to a temporary name and renamed
+    once complete, and output_dir/manifest.json records the completed shards with the hash
+    of their input rows and of the parameters of their sports. It is updated after every
+    shard, so a job interrupted by a worker failure or a preempted node is continued by
+    running it again: the shards whose file exists and whose hashes match the manifest are
+    skipped, while the shards whose inputs or sport parameters changed are solved again.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Input of calculate_risk_batch with an additional shard_by column.
+    output_dir : str
+        Directory of the Parquet outputs, which must be reachable by all the workers.
+    executor : optional
+        Executor running the shards through its submit method, e.g. a
+        concurrent.futures executor or a dask.distributed.Client connected to a
+        multi-node cluster. If None, a local cluster of worker processes is started.
+    workers : int, optional
+        Number of processes of the local cluster, ignored if executor is given.
+    shard_by : str, optional
+        Column identifying the venue. Default is "venue".
+    freq : str, optional
+        Time range of the shards as a pandas Period frequency. Default is "Y" (yearly).
+    registry : SportRegistry, optional
+        Sport parameters shipped once to each worker: through the process initializer of
+        the local cluster or with Client.scatter(broadcast=True) on Dask. Other executors
+        receive it with every shard.
+    resume : bool, optional
+        If False, all the shards are solved again. Default is True.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per shard with columns venue, period, path, rows and skipped (True for the
+        shards completed by a previous run).
+
+    Examples
+    --------
+    >>> manifest = run_sharded(df, "output/backfill", workers=4)
+    >>> df_risk = read_sharded_output(manifest)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    shards = shard_inputs(df, shard_by=shard_by, freq=freq)
+    manifest = _load_manifest(output_dir) if resume else {}
+
+    results, todo = {}, {}
+    for key, rows in shards.items():
+        file_name = _shard_file_name(*key)
+        hashes = {
+            "input_hash": shard_input_hash(df.iloc[rows]),
+            "model_hash": shard_model_hash(df["sport_id"].iloc[rows], registry),
+        }
+        entry = manifest.get(file_name, {})
+        path = os.path.join(output_dir, file_name)
+        if all(
+            entry.get(name) == value for name, value in hashes.items()
+        ) and os.path.exists(path):
+            results[key] = (path, entry["rows"], True)
+        else:
+            todo[key] = (rows, file_name, hashes)
+
+    if todo:
+        _solve_shards(
+            df, todo, output_dir, manifest, results, executor, workers, registry
+        )
+
+    return pd.DataFrame(
+        [
+            (venue, period, path, rows, skipped)
+            for (venue, period), (path, rows, skipped) in results.items()
+        ],
+        columns=["venue", "period", "path", "rows", "skipped"],
+    ).sort_values(["venue", "period"], ignore_index=True)
+
+
+def _solve_shards(df, todo, output_dir, manifest, results, executor, workers, registry):
+    local = executor is None
+    if local:
+        # spawned rather than forked, the numba-compiled PHS model is not fork-safe
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(registry,),
+        )
+        shipped_registry = None
+    elif hasattr(executor, "scatter"):
+        shipped_registry = executor.scatter(registry, broadcast=True)
+    else:
+        shipped_registry = registry
+
+    try:
+        futures = {
+            executor.submit(
+                _run_shard,
+                df.iloc[rows],
+                os.path.join(output_dir, file_name),
+                shipped_registry,
+            ): key
+            for key, (rows, file_name, _) in todo.items()
+        }
+        if hasattr(executor, "scatter"):
+            from distributed import as_completed as completed
+        else:
+            completed = as_completed
+        # the manifest is saved after each shard, the completed shards are kept if one fails
+        for future in completed(futures):
+            key = futures[future]
+            path, n_rows = future.result()
+            _, file_name, hashes = todo[key]
+            manifest[file_name] = {"rows": n_rows, **hashes}
+            _save_manifest(output_dir, manifest)
+            results[key] = (path, n_rows, False)
+    finally:
+        if local:
+            executor.shutdown(cancel_futures=True)
+
+
+def read_sharded_output(manifest) -> pd.DataFrame:
+    """Gather the Parquet outputs of run_sharded, given its manifest or the output directory."""
+    if isinstance(manifest, pd.DataFrame):
+        paths = manifest["path"].tolist()
+    else:
+        paths = sorted(
+            os.path.join(manifest, name)
+            for name in (_load_manifest(manifest) or os.listdir(manifest))
+            if name.endswith(".parquet")
+        )
+    if not paths:
+        return pd.DataFrame()
+    return pd.concat([pd.read_parquet(path) for path in paths], ignore_index=True)
+
+
+if __name__ == "__main__":
+    venues = pd.DataFrame(
+        {
+            "venue": ["sydney", "melbourne"],
+            "lat": [-33.8688, -37.8136],
+            "lon": [151.2093, 144.9631],
+            "tz": ["Australia/Sydney", "Australia/Melbourne"],
+            "sport_id": ["soccer", "tennis"],
+        }
+    )
+    time_stamps = pd.date_range("2023-12-30 00:00:00", periods=96, freq="h")
+    rng = np.random.default_rng(0)
+    df_example = venues.loc[venues.index.repeat(len(time_stamps))].reset_index(
+        drop=True
+    )
+    df_example["time_stamp"] = np.tile(time_stamps.astype(str), len(venues))
+    df_example["tdb"] = np.round(rng.uniform(20, 40, len(df_example)), 1)
+    df_example["rh"] = np.round(rng.uniform(20, 80, len(df_example)))
+
+    manifest_example = run_sharded(df_example, "output/sharded_example", workers=2)
+    ic(manifest_example)
+    ic(read_sharded_output(manifest_example)["risk"].value_counts())
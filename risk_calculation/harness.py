@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+
+
+def fixed_offset_zones(lon) -> np.ndarray:
+    """Etc/GMT time zone of the whole-hour offset nearest to each longitude."""
+    offsets = np.round(np.asarray(lon) / 15).astype(int)
+    # the sign of the Etc/GMT zones is inverted, Etc/GMT-10 is UTC+10
+    return np.array(
+        [f"Etc/GMT{-offset:+d}" if offset else "Etc/GMT" for offset in offsets]
+    )
+
+
+def check_limits(report: pd.DataFrame, limits: dict) -> list:
+    """
+    Messages of the limits exceeded in a report, an empty list if all of them hold.
+
+    limits maps the rows of the report (index) to the maximum value of its columns, e.g.
+    {"mrt": {"peak_mb": 20}}. The rows missing from the report are skipped.
+    """
+    failures = []
+    for row, row_limits in limits.items():
+        if row not in report.index:
+            continue
+        for column, limit in row_limits.items():
+            value = report.loc[row, column]
+            if not value <= limit:
+                failures.append(f"{row}: {column} = {value:.4g} > {limit:.4g}")
+    return failures
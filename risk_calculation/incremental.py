@@ -0,0 +1,207 @@
+import numpy as np
+import pandas as pd
+from icecream import ic
+
+from risk_calculation.mrt_calculation import calculate_mrt_series
+from risk_calculation.new_risk_eq_v2 import (
+    MAX_T_HIGH,
+    MIN_T_MEDIUM,
+    classify_heat_stress_risk,
+    get_heat_stress_thresholds_batch,
+    sports_dict,
+)
+from risk_calculation.sport_registry import sport_registry
+
+STATE_COLUMNS = [
+    "delta_mrt",
+    "tdb_solved",
+    "rh_solved",
+    "t_medium",
+    "t_high",
+    "t_extreme",
+]
+
+
+class IncrementalRiskSession:
+    """
+    Heat-stress risk for a set of venues over a forecast window, updated incrementally.
+
+    The session keeps the solar/MRT results and the solved thresholds of each
+    (venue, time_stamp) row. When a new forecast is passed to update, the MRT is
+    only calculated for time stamps not seen before and the thresholds are only
+    solved again for the rows whose tdb or rh moved by more than the tolerance
+    since they were last solved. Rows within the tolerance reuse the thresholds
+    but are always classified with their current tdb.
+
+    Parameters
+    ----------
+    venues : pandas.DataFrame
+        One row per venue, indexed by venue id, with columns lat, lon, tz, sport_id
+        and optionally wind ("low", "med" or "high", default "low").
+    tdb_tolerance : float, optional
+        Change in dry-bulb temperature (°C) below which the thresholds are reused. Default 0.05.
+    rh_tolerance : float, optional
+        Change in relative humidity (%) below which the thresholds are reused. Default 0.5.
+
+    Attributes
+    ----------
+    last_update : dict
+        Number of rows "recomputed" and "reused" and number of "mrt_computed" in the last update.
+
+    Examples
+    --------
+    >>> venues = pd.DataFrame(
+    ...     {"lat": [-33.87], "lon": [151.21], "tz": ["Australia/Sydney"], "sport_id": ["soccer"]},
+    ...     index=["sydney"],
+    ... )
+    >>> session = IncrementalRiskSession(venues)
+    >>> forecast = pd.DataFrame(
+    ...     {"venue": "sydney", "time_stamp": ["2024-02-01 15:00:00"], "tdb": [30.0], "rh": [60.0]}
+    ... )
+    >>> session.update(forecast)["risk"].tolist()
+    [2.0]
+    """
+
+    def __init__(
+        self,
+        venues: pd.DataFrame,
+        tdb_tolerance: float = 0.05,
+        rh_tolerance: float = 0.5,
+    ):
+        venues = venues.copy()
+        if "wind" not in venues.columns:
+            venues["wind"] = "low"
+        unknown = set(venues["sport_id"]) - set(sports_dict)
+        if unknown:
+            raise KeyError(f"Unknown sport_id: {sorted(unknown)}")
+
+        self.venues = venues
+        sport_codes = sport_registry.codes(venues["sport_id"])
+        self._sport_codes = pd.Series(sport_codes, index=venues.index)
+        self._wind_speed = pd.Series(
+            sport_registry.wind_speed(sport_codes, venues["wind"]), index=venues.index
+        )
+        self.tdb_tolerance = tdb_tolerance
+        self.rh_tolerance = rh_tolerance
+        self.last_update = {"recomputed": 0, "reused": 0, "mrt_computed": 0}
+
+        index = pd.MultiIndex.from_arrays(
+            [[], pd.DatetimeIndex([])], names=["venue", "time_stamp"]
+        )
+        self._state = pd.DataFrame(
+            np.empty((0, len(STATE_COLUMNS))), index=index, columns=STATE_COLUMNS
+        )
+
+    def update(self, forecast: pd.DataFrame) -> pd.DataFrame:
+        """
+        Evaluate a new forecast for the venues of the session.
+
+        Parameters
+        ----------
+        forecast : pandas.DataFrame
+            Columns venue, time_stamp (local time of the venue), tdb (°C) and rh (%).
+            Rows of the previous forecast that are not present any more are dropped.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Indexed by (venue, time_stamp) with columns tdb, rh, tr and risk. The risk is
+            NaN where it could not be determined because of NaN thresholds.
+        """
+        forecast = forecast.assign(time_stamp=pd.to_datetime(forecast["time_stamp"]))
+        forecast = forecast.set_index(["venue", "time_stamp"])
+        if not forecast.index.is_unique:
+            raise ValueError(
+                "The forecast contains duplicated (venue, time_stamp) rows."
+            )
+
+        state = self._state.reindex(forecast.index)
+        tdb = forecast["tdb"].to_numpy(dtype=float)
+        rh = forecast["rh"].to_numpy(dtype=float)
+        venue_ids = forecast.index.get_level_values("venue")
+
+        # solar/MRT only for the time stamps not seen before
+        missing_mrt = state["delta_mrt"].isna().to_numpy()
+        for venue_id in venue_ids[missing_mrt].unique():
+            venue = self.venues.loc[venue_id]
+            rows = missing_mrt & (venue_ids == venue_id)
+            state.loc[rows, "delta_mrt"] = calculate_mrt_series(
+                lat=round(venue["lat"], 2),
+                lon=round(venue["lon"], 2),
+                tz=venue["tz"],
+                time_stamps=forecast.index.get_level_values("time_stamp")[rows],
+            )
+
+        tr = tdb + state["delta_mrt"].to_numpy()
+        needs_thresholds = (tdb >= MIN_T_MEDIUM) & (tdb <= MAX_T_HIGH)
+        with np.errstate(invalid="ignore"):
+            moved = ~(
+                (np.abs(tdb - state["tdb_solved"].to_numpy()) <= self.tdb_tolerance)
+                & (np.abs(rh - state["rh_solved"].to_numpy()) <= self.rh_tolerance)
+            )
+        recompute = needs_thresholds & moved
+
+        if recompute.any():
+            venues_recompute = venue_ids[recompute]
+            state.loc[recompute, ["t_medium", "t_high", "t_extreme"]] = np.column_stack(
+                get_heat_stress_thresholds_batch(
+                    rh=rh[recompute],
+                    tr=tr[recompute],
+                    v=self._wind_speed.loc[venues_recompute].to_numpy(),
+                    sport_codes=self._sport_codes.loc[venues_recompute].to_numpy(),
+                )
+            )
+            state.loc[recompute, "tdb_solved"] = tdb[recompute]
+            state.loc[recompute, "rh_solved"] = rh[recompute]
+
+        risk = classify_heat_stress_risk(
+            tdb,
+            state["t_medium"].to_numpy(),
+            state["t_high"].to_numpy(),
+            state["t_extreme"].to_numpy(),
+        )
+        risk[tdb < MIN_T_MEDIUM] = 0
+        risk[tdb > MAX_T_HIGH] = 3
+
+        self._state = state
+        self.last_update = {
+            "recomputed": int(recompute.sum()),
+            "reused": int(len(forecast) - recompute.sum()),
+            "mrt_computed": int(missing_mrt.sum()),
+        }
+
+        return pd.DataFrame(
+            {"tdb": tdb, "rh": rh, "tr": tr, "risk": risk}, index=forecast.index
+        )
+
+
+if __name__ == "__main__":
+    venues_example = pd.DataFrame(
+        {
+            "lat": [-33.8688, -37.8136],
+            "lon": [151.2093, 144.9631],
+            "tz": ["Australia/Sydney", "Australia/Melbourne"],
+            "sport_id": ["soccer", "tennis"],
+            "wind": ["med", "low"],
+        },
+        index=["sydney", "melbourne"],
+    )
+    session = IncrementalRiskSession(venues_example)
+
+    time_stamps = pd.date_range("2024-02-01 00:00:00", periods=72, freq="h")
+    rng = np.random.default_rng(0)
+    forecast_example = pd.DataFrame(
+        {
+            "venue": np.repeat(venues_example.index, len(time_stamps)),
+            "time_stamp": np.tile(time_stamps, len(venues_example)),
+            "tdb": np.round(rng.uniform(22, 40, 2 * len(time_stamps)), 1),
+            "rh": np.round(rng.uniform(20, 80, 2 * len(time_stamps))),
+        }
+    )
+    session.update(forecast_example)
+    ic(session.last_update)
+
+    # next hourly update: a few rows change beyond the tolerance
+    forecast_example.loc[::10, "tdb"] += 0.5
+    session.update(forecast_example)
+    ic(session.last_update)
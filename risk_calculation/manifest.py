@@ -0,0 +1,17 @@
+import json
+import os
+
+
+def load_manifest(path: str) -> dict:
+    """JSON manifest stored at path, empty if it does not exist yet."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(path: str, manifest: dict):
+    """Write a JSON manifest next to path and rename it, a crash leaves the previous version."""
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
@@ -0,0 +1,283 @@
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from risk_calculation.batch import (
+    INPUT_COLUMNS,
+    STATION_DECIMALS,
+    calculate_delta_mrt,
+    solve_unique_risk,
+)
+from risk_calculation.harness import check_limits, fixed_offset_zones
+from risk_calculation.sport_registry import WIND_CATEGORIES, sport_registry
+
+# stages of the batch pipeline, in order
+STAGES = ("load", "mrt", "thresholds", "output")
+
+# maximum values of the report columns accepted by check_memory_budgets, per stage. A
+# budget is either a value or a pair (fixed MB, bytes per row) scaled to the rows of the
+# report, about 1.5 times the fixed overhead and the slope measured from 200 to 80k rows
+DEFAULT_BUDGETS = {
+    "load": {"peak_mb": (1.0, 10)},
+    "mrt": {"peak_mb": (1.5, 300)},
+    "thresholds": {"peak_mb": (1.0, 600)},
+    "output": {"peak_mb": (0.1, 30)},
+}
+
+RSS_SAMPLING_INTERVAL = 0.005
+
+
+def _rss_bytes() -> float:
+    """Resident set size of the process, NaN where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return np.nan
+
+
+class _RssSampler:
+    """Highest resident set size sampled by a background thread while running."""
+
+    def __init__(self, interval: float = RSS_SAMPLING_INTERVAL):
+        self.interval = interval
+        self.peak = _rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, _rss_bytes())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+
+
+def draw_benchmark_input(
+    n_rows: int = 10_000, n_venues: int = 20, seed: int = 0
+) -> pd.DataFrame:
+    """
+    Representative input of calculate_risk_batch: hourly station data of n_venues venues
+    with a daily cycle of tdb and rh at the resolution of STATION_DECIMALS, and random
+    sports and wind categories.
+    """
+    rng = np.random.default_rng(seed)
+    n_hours = -(-n_rows // n_venues)
+    time_stamps = pd.date_range("2024-01-01", periods=n_hours, freq="h")
+    venue = np.repeat(np.arange(n_venues), n_hours)[:n_rows]
+    hour = np.tile(time_stamps.hour.to_numpy(), n_venues)[:n_rows]
+
+    lon = rng.uniform(-180, 180, n_venues)
+    tdb = 30 + 8 * np.sin((hour - 9) / 24 * 2 * np.pi) + rng.normal(0, 1.5, n_rows)
+    return pd.DataFrame(
+        {
+            "venue": venue,
+            "lat": np.round(rng.uniform(-40, 60, n_venues), 2)[venue],
+            "lon": np.round(lon, 2)[venue],
+            "tz": fixed_offset_zones(lon)[venue],
+            "time_stamp": np.tile(
+                time_stamps.strftime("%Y-%m-%d %H:%M:%S").to_numpy(), n_venues
+            )[:n_rows],
+            "tdb": np.round(tdb, 1),
+            "rh": np.round(
+                np.clip(75 - 2 * (tdb - 25) + rng.normal(0, 5, n_rows), 5, 100)
+            ),
+            "sport_id": sport_registry.sport_ids[
+                rng.integers(0, len(sport_registry), n_rows)
+            ],
+            "wind": np.array(WIND_CATEGORIES)[
+                rng.integers(0, len(WIND_CATEGORIES), n_rows)
+            ],
+        }
+    )
+
+
+def run_memory_benchmark(
+    df: pd.DataFrame | None = None,
+    n_rows: int = 10_000,
+    seed: int = 0,
+    decimals: dict = STATION_DECIMALS,
+    dtype=np.float64,
+) -> pd.DataFrame:
+    """
+    Memory used by each stage of the batch pipeline (calculate_risk_batch) on one input.
+
+    The input is written to a Parquet file and the stages are run one after the other
+    under tracemalloc, which traces the Python and NumPy allocations, while a background
+    thread samples the resident set size (RSS, which also includes memory-mapped files
+    and the allocations of C libraries):
+
+    - load: read the Parquet file
+    - mrt: delta_mrt of each row, calculate_delta_mrt
+    - thresholds: risk of the unique combinations of the inputs, solve_unique_risk
+    - output: result DataFrame written to Parquet
+
+    Parameters
+    ----------
+    df : pandas.DataFrame, optional
+        Input of calculate_risk_batch. Default is draw_benchmark_input(n_rows, seed=seed).
+    decimals, dtype
+        See calculate_risk_batch. Default is STATION_DECIMALS and np.float64.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per stage with seconds (slowed down by tracemalloc), allocated_mb (memory
+        still allocated at the end of the stage), peak_mb (highest traced memory above the
+        start of the stage), peak_bytes_per_row, rss_mb (RSS at the start of the stage)
+        and rss_peak_mb (highest sampled RSS above the start of the stage).
+        attrs["rows"] is the number of input rows.
+    """
+    if df is None:
+        df = draw_benchmark_input(n_rows, seed=seed)
+    report = []
+    state = {}
+
+    def load(path):
+        state["df"] = pd.read_parquet(
+            path, columns=[c for c in df.columns if c in [*INPUT_COLUMNS, "wind"]]
+        )
+
+    def mrt(_):
+        state["delta_mrt"] = calculate_delta_mrt(state["df"], dtype=dtype)
+
+    def thresholds(_):
+        inputs = state["df"]
+        state["risk"], _ = solve_unique_risk(
+            tdb=inputs["tdb"].to_numpy(dtype=dtype),
+            rh=inputs["rh"].to_numpy(dtype=dtype),
+            delta_mrt=state["delta_mrt"],
+            sport_codes=sport_registry.codes(inputs["sport_id"].to_numpy()),
+            winds=inputs["wind"].to_numpy() if "wind" in inputs.columns else "low",
+            decimals=decimals,
+            dtype=dtype,
+        )
+
+    def output(path):
+        df_results = state.pop("df").assign(
+            delta_mrt=state.pop("delta_mrt"), risk=state.pop("risk")
+        )
+        df_results.to_parquet(path.replace(".parquet", "_results.parquet"), index=False)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "input.parquet")
+        df.to_parquet(path, index=False)
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start()
+        try:
+            for stage, function in zip(
+                STAGES, (load, mrt, thresholds, output), strict=True
+            ):
+                gc.collect()
+                tracemalloc.reset_peak()
+                traced_start, _ = tracemalloc.get_traced_memory()
+                rss_start = _rss_bytes()
+                start = time.perf_counter()
+                with _RssSampler() as sampler:
+                    function(path)
+                seconds = time.perf_counter() - start
+                traced_end, traced_peak = tracemalloc.get_traced_memory()
+                report.append(
+                    {
+                        "stage": stage,
+                        "seconds": seconds,
+                        "allocated_mb": (traced_end - traced_start) / 1e6,
+                        "peak_mb": (traced_peak - traced_start) / 1e6,
+                        "peak_bytes_per_row": (traced_peak - traced_start) / len(df),
+                        "rss_mb": rss_start / 1e6,
+                        "rss_peak_mb": (sampler.peak - rss_start) / 1e6,
+                    }
+                )
+        finally:
+            if not was_tracing:
+                tracemalloc.stop()
+
+    df_report = pd.DataFrame(report).set_index("stage")
+    df_report.attrs["rows"] = len(df)
+    return df_report
+
+
+def memory_limits(budgets: dict, n_rows: int) -> dict:
+    """Budgets with the pairs (fixed MB, bytes per row) evaluated for n_rows rows."""
+    return {
+        stage: {
+            column: budget[0] + budget[1] * n_rows / 1e6
+            if isinstance(budget, tuple)
+            else budget
+            for column, budget in stage_budgets.items()
+        }
+        for stage, stage_budgets in budgets.items()
+    }
+
+
+def check_memory_budgets(report: pd.DataFrame, budgets: dict | None = None) -> list:
+    """Messages of the budgets exceeded in the report, an empty list if all of them hold."""
+    if budgets is None:
+        budgets = DEFAULT_BUDGETS
+    return check_limits(report, memory_limits(budgets, report.attrs["rows"]))
+
+
+def _parse_budget(text: str):
+    stage_column, value = text.split("=")
+    stage, column = stage_column.split(":")
+    return stage, column, float(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Measure the memory of each stage of the batch risk pipeline."
+    )
+    parser.add_argument("--rows", type=int, default=10_000, help="number of input rows")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--float32", action="store_true", help="run the pipeline with dtype=np.float32"
+    )
+    parser.add_argument(
+        "--budget",
+        action="append",
+        type=_parse_budget,
+        default=[],
+        metavar="STAGE:COLUMN=VALUE",
+        help="budget replacing or added to DEFAULT_BUDGETS, e.g. mrt:rss_peak_mb=200, "
+        "not scaled to the rows",
+    )
+    args = parser.parse_args(argv)
+
+    budgets = {stage: dict(limits) for stage, limits in DEFAULT_BUDGETS.items()}
+    for stage, column, value in args.budget:
+        budgets.setdefault(stage, {})[column] = value
+
+    report = run_memory_benchmark(
+        n_rows=args.rows,
+        seed=args.seed,
+        dtype=np.float32 if args.float32 else np.float64,
+    )
+    with pd.option_context("display.max_columns", None, "display.width", 200):
+        print(report.round(3).to_string())
+    print(f"rows: {report.attrs['rows']}")
+
+    failures = check_memory_budgets(report, budgets)
+    for failure in failures:
+        print(f"FAILED {failure}")
+    if not failures:
+        print("All memory budgets held.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
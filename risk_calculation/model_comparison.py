@@ -0,0 +1,259 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import seaborn as sns
+from icecream import ic
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from pythermalcomfort.utilities import mean_radiant_tmp
+
+from risk_calculation.new_risk_eq_v2 import get_heat_stress_risk_batch
+from risk_calculation.sma_code_v2 import calculate_comfort_indices_array, sports_dict
+from risk_calculation.sport_registry import WIND_CATEGORIES, sport_registry
+
+# parameter space of the comparison, tg offsets (tg - tdb) are those of the SMA reference table
+COMPARISON_TDB = np.arange(23, 50, 1)
+COMPARISON_RH = np.arange(0, 101, 5)
+COMPARISON_TG_OFFSETS = np.arange(4, 13, 1)
+
+RISK_LEVELS = [0, 1, 2, 3]
+
+
+def compare_sport_models(
+    sport_id: str,
+    tdb=COMPARISON_TDB,
+    rh=COMPARISON_RH,
+    tg_offsets=COMPARISON_TG_OFFSETS,
+    winds=WIND_CATEGORIES,
+) -> pd.DataFrame:
+    """
+    Risk of the SMA reference table and of the PHS model over the full grid of one sport.
+
+    Vectorized counterpart of compare_sma_v2_with_new_risk_eq in new_risk_eq_v2.py: the PHS
+    risk of all the cells is solved with get_heat_stress_risk_batch, with tr derived from
+    tg = tdb + tg_offset as in get_sports_heat_stress_curves, and the SMA risk is looked
+    up with calculate_comfort_indices_array.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Columns sport_id, wind, tg_offset, tdb, rh, risk_phs and risk_sma (NaN where a
+        model does not determine the risk).
+    """
+    wind, tg_offset, tdb_cells, rh_cells = (
+        values.ravel()
+        for values in np.meshgrid(winds, tg_offsets, tdb, rh, indexing="ij")
+    )
+    tdb_cells = tdb_cells.astype(float)
+    rh_cells = rh_cells.astype(float)
+    code = sport_registry.code(sport_id)
+    v = sport_registry.wind_speed(np.full(wind.size, code), wind)
+
+    risk_phs = get_heat_stress_risk_batch(
+        tdb=tdb_cells,
+        rh=rh_cells,
+        tr=mean_radiant_tmp(tdb=tdb_cells, tg=tdb_cells + tg_offset, v=v),
+        v=v,
+        sport_codes=code,
+    )
+    risk_sma, _ = calculate_comfort_indices_array(
+        tdb=tdb_cells, rh=rh_cells, tg=tg_offset, v=v, sport_id=sport_id
+    )
+    return pd.DataFrame(
+        {
+            "sport_id": sport_id,
+            "wind": wind,
+            "tg_offset": tg_offset,
+            "tdb": tdb_cells,
+            "rh": rh_cells,
+            "risk_phs": risk_phs,
+            "risk_sma": risk_sma,
+        }
+    )
+
+
+def agreement_matrices(df_cells: pd.DataFrame) -> pd.DataFrame:
+    """
+    Number of cells of each sport per (SMA risk, PHS risk) pair, one 4 x 4 matrix per sport
+    in long format with columns sport_id, risk_sma, risk_phs and cells.
+    """
+    determined = df_cells.dropna(subset=["risk_sma", "risk_phs"])
+    counts = determined.groupby(["sport_id", "risk_sma", "risk_phs"]).size()
+    index = pd.MultiIndex.from_product(
+        [df_cells["sport_id"].unique(), RISK_LEVELS, RISK_LEVELS],
+        names=["sport_id", "risk_sma", "risk_phs"],
+    )
+    return counts.reindex(index, fill_value=0).rename("cells").reset_index()
+
+
+def _summarize(group: pd.DataFrame) -> pd.Series:
+    determined = group.dropna(subset=["risk_sma", "risk_phs"])
+    difference = determined["risk_sma"] - determined["risk_phs"]
+    agreement = (difference == 0).mean()
+    # Cohen's kappa, agreement corrected for the agreement expected by chance
+    expected = sum(
+        (determined["risk_sma"] == level).mean()
+        * (determined["risk_phs"] == level).mean()
+        for level in RISK_LEVELS
+    )
+    return pd.Series(
+        {
+            "cells": len(group),
+            "undetermined": 1 - len(determined) / len(group),
+            "agreement": agreement,
+            "kappa": (agreement - expected) / (1 - expected)
+            if expected < 1
+            else np.nan,
+            "mean_difference": difference.mean(),
+            "sma_higher": (difference > 0).mean(),
+            "phs_higher": (difference < 0).mean(),
+        }
+    )
+
+
+def summarize_comparison(df_cells: pd.DataFrame) -> pd.DataFrame:
+    """
+    Summary statistics of the comparison per sport and wind category.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Columns sport_id, wind, cells, undetermined (share of the cells where a model does
+        not determine the risk), agreement (share of the other cells with the same risk),
+        kappa (Cohen's kappa), mean_difference (SMA - PHS), sma_higher and phs_higher.
+    """
+    return (
+        df_cells.groupby(["sport_id", "wind"], sort=True)[["risk_sma", "risk_phs"]]
+        .apply(_summarize)
+        .reset_index()
+    )
+
+
+def plot_model_comparison(
+    df_cells: pd.DataFrame, sport_id: str, wind: str, tg_offset: int, path: str, dpi=300
+):
+    """
+    Save the heatmaps of the PHS risk, the SMA risk and their difference for one sport, wind
+    and tg offset, with the same layout as compare_sma_v2_with_new_risk_eq.
+    """
+    df = df_cells[
+        (df_cells["sport_id"] == sport_id)
+        & (df_cells["wind"] == wind)
+        & (df_cells["tg_offset"] == tg_offset)
+    ].assign(diff=lambda x: x["risk_sma"] - x["risk_phs"])
+
+    fig = Figure(figsize=(7, 7))
+    FigureCanvasAgg(fig)
+    axs = fig.subplots(3, 1, sharex=True, sharey=True)
+    name = sports_dict[sport_id]["sport"]
+    panels = [
+        (
+            "risk_phs",
+            f"{name} - Heat stress risk (PHS model)",
+            {"cmap": "viridis", "vmin": 0, "vmax": 3},
+        ),
+        (
+            "risk_sma",
+            f"{name} - Heat stress risk (SMA model)",
+            {"cmap": "viridis", "vmin": 0, "vmax": 3},
+        ),
+        (
+            "diff",
+            f"{name} - Difference in risk levels (SMA -PHS)",
+            {"cmap": "coolwarm", "center": 0, "vmin": -3, "vmax": 3},
+        ),
+    ]
+    for ax, (column, title, style) in zip(axs, panels, strict=True):
+        df_pivot = df.pivot(index="rh", columns="tdb", values=column)
+        df_pivot.sort_index(ascending=False, inplace=True)
+        sns.heatmap(df_pivot, annot=False, ax=ax, **style)
+        ax.set_title(title, fontsize=14)
+        ax.set_ylabel("Relative Humidity (%)", fontsize=12)
+        ax.set_xlabel("Air Temperature (°C)", fontsize=12)
+    fig.tight_layout()
+    fig.savefig(path, dpi=dpi)
+    return path
+
+
+def compare_models(
+    output_dir: str = "output/model_comparison",
+    sport_ids=None,
+    workers: int | None = None,
+    figures: bool = False,
+    figure_wind: str = "low",
+    figure_tg_offset: int = 8,
+) -> dict:
+    """
+    Compare the SMA and PHS models for every sport, wind category and tg offset.
+
+    The sports are compared in parallel by worker processes and the results are written
+    to output_dir as Parquet files: cells.parquet (the risk of both models in every cell),
+    agreement.parquet (agreement_matrices) and summary.parquet (summarize_comparison).
+
+    Parameters
+    ----------
+    output_dir : str, optional
+        Folder of the outputs. Default is "output/model_comparison".
+    sport_ids : list of str, optional
+        Sports to compare. Default is all the sports in sports_dict.
+    workers : int, optional
+        Number of worker processes. Default is the number of CPUs.
+    figures : bool, optional
+        If True, plot_model_comparison is also rendered for each sport, for figure_wind and
+        figure_tg_offset, as comparison_<sport_id>_wind_<wind>_tg_<tg_offset>.png. Default
+        is False.
+
+    Returns
+    -------
+    dict
+        Paths of the "cells", "agreement" and "summary" files and the list of "figures".
+    """
+    if sport_ids is None:
+        sport_ids = list(sports_dict.keys())
+    os.makedirs(output_dir, exist_ok=True)
+
+    # spawned rather than forked, the numba-compiled PHS model is not fork-safe
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        df_cells = pd.concat(
+            executor.map(compare_sport_models, sport_ids), ignore_index=True
+        )
+
+        paths = {
+            "cells": os.path.join(output_dir, "cells.parquet"),
+            "agreement": os.path.join(output_dir, "agreement.parquet"),
+            "summary": os.path.join(output_dir, "summary.parquet"),
+        }
+        df_cells.to_parquet(paths["cells"], index=False)
+        agreement_matrices(df_cells).to_parquet(paths["agreement"], index=False)
+        summarize_comparison(df_cells).to_parquet(paths["summary"], index=False)
+
+        paths["figures"] = []
+        if figures:
+            futures = [
+                executor.submit(
+                    plot_model_comparison,
+                    df_cells[df_cells["sport_id"] == sport_id],
+                    sport_id,
+                    figure_wind,
+                    figure_tg_offset,
+                    os.path.join(
+                        output_dir,
+                        f"comparison_{sport_id}_wind_{figure_wind}_tg_{figure_tg_offset}.png",
+                    ),
+                )
+                for sport_id in sport_ids
+            ]
+            paths["figures"] = [future.result() for future in futures]
+
+    return paths
+
+
+if __name__ == "__main__":
+    outputs = compare_models()
+    df_summary = pd.read_parquet(outputs["summary"])
+    ic(df_summary.groupby("sport_id")[["agreement", "kappa", "mean_difference"]].mean())
@@ -1,3 +1,6 @@
+import contextlib
+import contextvars
+import time
 from itertools import product
 
 import matplotlib.pyplot as plt
@@ -5,15 +8,45 @@ import numpy as np
 import pandas as pd
 import scipy
 import seaborn as sns
-from cachetools import cached, TTLCache
-
 from pythermalcomfort.models import phs
 from pythermalcomfort.utilities import mean_radiant_tmp
 
-from risk_calculation.sma_code_v2 import sports_dict, calculate_comfort_indices_v2
+from risk_calculation.adaptive_grid import evaluate_grid
+from risk_calculation.concurrent_cache import concurrent_cached
+from risk_calculation.sma_code_v2 import calculate_comfort_indices_array, sports_dict
+from risk_calculation.sport_registry import sport_registry
+
+# limits applied to the temperature thresholds (°C) separating the risk levels
+MAX_T_LOW = 34.5
+MAX_T_MEDIUM = 39
+MAX_T_HIGH = 43.5
+MIN_T_EXTREME = 26
+MIN_T_HIGH = 25
+MIN_T_MEDIUM = 23
+
+# core temperature (°C) above which the risk is extreme
+T_CR_EXTREME = 40
+
+# brackets tried, in order, by the root finder when solving for a threshold
+THRESHOLD_BRACKETS = [(0, 36), (20, 50)]
+
+# default relative tolerance of scipy.optimize.brentq
+BRENTQ_RTOL = 4 * np.finfo(float).eps
+
+# time.perf_counter() value after which the vectorized solver gives up, see solver_deadline
+_solver_deadline = contextvars.ContextVar("solver_deadline", default=None)
 
+# settings shared by every call to the PHS model
+PHS_KWARGS = {
+    "posture": "standing",
+    "round": False,
+    "limit_inputs": False,
+    "acclimatized": 100,
+    "i_mst": 0.4,
+}
 
-@cached(cache=TTLCache(maxsize=2000, ttl=3600))
+
+@concurrent_cached(maxsize=2000, ttl=3600)
 def get_sports_heat_stress_curves(
     tdb,
     rh,
@@ -32,20 +65,11 @@ def get_sports_heat_stress_curves(
     if tg is None and tr is None:
         raise ValueError("Either tg or tr must be provided.")
 
-    max_t_low = 34.5
-    max_t_medium = 39
-    max_t_high = 43.5
-    min_t_extreme = 26
-    min_t_high = 25
-    min_t_medium = 23
-
-    if tdb < min_t_medium:
+    if tdb < MIN_T_MEDIUM:
         return 0
-    if tdb > max_t_high:
+    if tdb > MAX_T_HIGH:
         return 3
 
-    t_cr_extreme = 40
-
     if clo is None:
         clo = sport_dict["clo"]
     if met is None:
@@ -65,13 +89,9 @@ def get_sports_heat_stress_curves(
                 rh=rh,
                 met=met,
                 clo=clo,
-                posture="standing",
                 duration=sport_dict["duration"],
                 # duration=60,
-                round=False,
-                limit_inputs=False,
-                acclimatized=100,
-                i_mst=0.4,
+                **PHS_KWARGS,
             )["sweat_loss_g"]
             / sport_dict["duration"]
             * 45
@@ -79,7 +99,7 @@ def get_sports_heat_stress_curves(
         )
 
     t_medium = np.nan
-    for min_t, max_t in [(0, 36), (20, 50)]:
+    for min_t, max_t in THRESHOLD_BRACKETS:
         try:
             t_medium = scipy.optimize.brentq(
                 calculate_threshold_water_loss, min_t, max_t
@@ -101,18 +121,14 @@ def get_sports_heat_stress_curves(
                 rh=rh,
                 met=met,
                 clo=clo,
-                posture="standing",
                 duration=sport_dict["duration"],
-                round=False,
-                limit_inputs=False,
-                acclimatized=100,
-                i_mst=0.4,
+                **PHS_KWARGS,
             )["t_cr"]
-            - t_cr_extreme
+            - T_CR_EXTREME
         )
 
     t_extreme = np.nan
-    for min_t, max_t in [(0, 36), (20, 50)]:
+    for min_t, max_t in THRESHOLD_BRACKETS:
         try:
             t_extreme = scipy.optimize.brentq(calculate_threshold_core, min_t, max_t)
             break
@@ -123,7 +139,7 @@ def get_sports_heat_stress_curves(
             # )
 
             if not np.isnan(t_medium):
-                t_extreme = max_t_high
+                t_extreme = MAX_T_HIGH
 
     t_high = (
         (t_medium + t_extreme) / 2
@@ -132,19 +148,19 @@ def get_sports_heat_stress_curves(
     )
     risk_level = np.nan
 
-    if t_medium > max_t_low:
-        t_medium = max_t_low
-    if t_high > max_t_medium:
-        t_high = max_t_medium
-    if t_extreme > max_t_high:
-        t_extreme = max_t_high
+    if t_medium > MAX_T_LOW:
+        t_medium = MAX_T_LOW
+    if t_high > MAX_T_MEDIUM:
+        t_high = MAX_T_MEDIUM
+    if t_extreme > MAX_T_HIGH:
+        t_extreme = MAX_T_HIGH
 
-    if t_extreme < min_t_extreme:
-        t_extreme = min_t_extreme
-    if t_high < min_t_high:
-        t_high = min_t_high
-    if t_medium < min_t_medium:
-        t_medium = min_t_medium
+    if t_extreme < MIN_T_EXTREME:
+        t_extreme = MIN_T_EXTREME
+    if t_high < MIN_T_HIGH:
+        t_high = MIN_T_HIGH
+    if t_medium < MIN_T_MEDIUM:
+        t_medium = MIN_T_MEDIUM
 
     if tdb < t_medium:
         risk_level = 0
@@ -161,6 +177,358 @@ def get_sports_heat_stress_curves(
     return risk_level
 
 
+class SolverDeadlineExceeded(TimeoutError):
+    """Raised by the vectorized solver when the deadline set with solver_deadline has passed."""
+
+
+@contextlib.contextmanager
+def solver_deadline(deadline: float):
+    """
+    Abort the vectorized threshold solver of the current thread or task once
+    time.perf_counter() exceeds deadline, by raising SolverDeadlineExceeded between two
+    iterations. The latency is bounded by the deadline plus two calls to the PHS model.
+    """
+    token = _solver_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _solver_deadline.reset(token)
+
+
+def _brentq_array(objective, xa, xb, args, xtol=2e-12, rtol=BRENTQ_RTOL, maxiter=100):
+    """
+    Element-wise port of scipy.optimize.brentq (scipy/optimize/Zeros/brentq.c).
+
+    Every element follows exactly the same sequence of iterates as the scalar
+    brentq, hence the roots are identical even where the objective has flat
+    steps (the PHS outputs are rounded to 0.1). The objective is only called
+    on the elements that have not converged yet. Elements without a sign
+    change, with a NaN objective or not converged after maxiter are NaN.
+    """
+    deadline = _solver_deadline.get()
+    if deadline is not None and time.perf_counter() > deadline:
+        raise SolverDeadlineExceeded("The threshold solver exceeded its deadline.")
+
+    xpre = np.array(xa, dtype=float)
+    xcur = np.array(xb, dtype=float)
+    fpre = np.asarray(objective(xpre, *args), dtype=float)
+    fcur = np.asarray(objective(xcur, *args), dtype=float)
+
+    root = np.full(xpre.shape, np.nan)
+    root = np.where(fcur == 0, xcur, root)
+    root = np.where(fpre == 0, xpre, root)
+    active = ~(fpre == 0) & ~(fcur == 0)
+    active &= np.signbit(fpre) != np.signbit(fcur)
+    active &= ~(np.isnan(fpre) | np.isnan(fcur))
+
+    xblk = np.zeros_like(xpre)
+    fblk = np.zeros_like(xpre)
+    spre = np.zeros_like(xpre)
+    scur = np.zeros_like(xpre)
+
+    for _ in range(maxiter):
+        if not active.any():
+            break
+        if deadline is not None and time.perf_counter() > deadline:
+            raise SolverDeadlineExceeded("The threshold solver exceeded its deadline.")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            m = (
+                active
+                & (fpre != 0)
+                & (fcur != 0)
+                & (np.signbit(fpre) != np.signbit(fcur))
+            )
+            xblk[m] = xpre[m]
+            fblk[m] = fpre[m]
+            spre[m] = scur[m] = xcur[m] - xpre[m]
+
+            m = active & (np.abs(fblk) < np.abs(fcur))
+            xpre[m], xcur[m], xblk[m] = xcur[m], xblk[m], xcur[m]
+            fpre[m], fcur[m], fblk[m] = fcur[m], fblk[m], fcur[m]
+
+            delta = (xtol + rtol * np.abs(xcur)) / 2
+            sbis = (xblk - xcur) / 2
+            m = active & ((fcur == 0) | (np.abs(sbis) < delta))
+            root[m] = xcur[m]
+            active &= ~m
+
+            interpolate = -fcur * (xcur - xpre) / (fcur - fpre)
+            dpre = (fpre - fcur) / (xpre - xcur)
+            dblk = (fblk - fcur) / (xblk - xcur)
+            extrapolate = (
+                -fcur * (fblk * dblk - fpre * dpre) / (dblk * dpre * (fblk - fpre))
+            )
+            stry = np.where(xpre == xblk, interpolate, extrapolate)
+            good = (np.abs(spre) > delta) & (np.abs(fcur) < np.abs(fpre))
+            good &= 2 * np.abs(stry) < np.minimum(
+                np.abs(spre), 3 * np.abs(sbis) - delta
+            )
+
+            spre = np.where(active, np.where(good, scur, sbis), spre)
+            scur = np.where(active, np.where(good, stry, sbis), scur)
+
+            xpre = np.where(active, xcur, xpre)
+            fpre = np.where(active, fcur, fpre)
+            step = np.where(
+                np.abs(scur) > delta, scur, np.where(sbis > 0, delta, -delta)
+            )
+            xcur = np.where(active, xcur + step, xcur)
+
+        idx = np.flatnonzero(active)
+        fcur[idx] = objective(xcur[idx], *(arg[idx] for arg in args))
+        active[idx[np.isnan(fcur[idx])]] = False
+
+    return root
+
+
+def _solve_threshold(objective, args):
+    """Vectorized equivalent of the brentq loops in get_sports_heat_stress_curves.
+
+    Each element is solved with the first bracket in THRESHOLD_BRACKETS that
+    contains a sign change; elements for which no bracket works are NaN.
+    """
+    args = [np.asarray(arg, dtype=float) for arg in np.broadcast_arrays(*args)]
+    shape = args[0].shape
+    args = [arg.ravel() for arg in args]
+    root = np.full(args[0].size, np.nan)
+    pending = np.ones(args[0].size, dtype=bool)
+    for min_t, max_t in THRESHOLD_BRACKETS:
+        idx = np.flatnonzero(pending)
+        if idx.size == 0:
+            break
+        root[idx] = _brentq_array(
+            objective,
+            np.full(idx.size, float(min_t)),
+            np.full(idx.size, float(max_t)),
+            args=[arg[idx] for arg in args],
+        )
+        pending[idx] = np.isnan(root[idx])
+    return root.reshape(shape)
+
+
+def solve_heat_stress_thresholds(rh, tr, v, clo, met, duration, sweat_loss_g=850):
+    """
+    Solve the medium and extreme temperature thresholds for arrays of conditions.
+
+    This is the vectorized counterpart of the two brentq loops in
+    get_sports_heat_stress_curves: all elements are solved together so that
+    each iteration makes one array call to the PHS model instead of one call
+    per element.
+
+    Parameters
+    ----------
+    rh, tr, v, clo, met : array_like
+        Relative humidity (%), mean radiant temperature (°C), air speed (m/s),
+        clothing insulation (clo) and metabolic rate (met). Broadcast together.
+    duration : int
+        Exposure duration in minutes. The PHS model only accepts a scalar here,
+        hence callers group their inputs by sport.
+    sweat_loss_g : float or array_like, optional
+        Sweat loss (g per 45 min) defining the medium threshold. Default is 850.
+
+    Returns
+    -------
+    tuple of numpy.ndarray
+        Unclipped (t_medium, t_extreme) in °C, NaN where no bracket contains a root.
+    """
+
+    def water_loss_excess(x, tr, v, rh, met, clo, sweat_loss_g):
+        return (
+            phs(
+                tdb=x,
+                tr=tr,
+                v=v,
+                rh=rh,
+                met=met,
+                clo=clo,
+                duration=duration,
+                **PHS_KWARGS,
+            )["sweat_loss_g"]
+            / duration
+            * 45
+            - sweat_loss_g
+        )
+
+    def core_temperature_excess(x, tr, v, rh, met, clo):
+        return (
+            phs(
+                tdb=x,
+                tr=tr,
+                v=v,
+                rh=rh,
+                met=met,
+                clo=clo,
+                duration=duration,
+                **PHS_KWARGS,
+            )["t_cr"]
+            - T_CR_EXTREME
+        )
+
+    t_medium = _solve_threshold(water_loss_excess, (tr, v, rh, met, clo, sweat_loss_g))
+    t_extreme = _solve_threshold(core_temperature_excess, (tr, v, rh, met, clo))
+    # same fallback as the scalar implementation when the core temperature never reaches 40 °C
+    t_extreme = np.where(
+        np.isnan(t_extreme) & ~np.isnan(t_medium), MAX_T_HIGH, t_extreme
+    )
+
+    return t_medium, t_extreme
+
+
+def limit_heat_stress_thresholds(t_medium, t_extreme):
+    """Derive t_high and clip the three thresholds to the allowed ranges, keeping NaNs."""
+    t_medium = np.asarray(t_medium, dtype=float)
+    t_extreme = np.asarray(t_extreme, dtype=float)
+    t_high = (t_medium + t_extreme) / 2
+
+    with np.errstate(invalid="ignore"):
+        t_medium = np.where(t_medium > MAX_T_LOW, MAX_T_LOW, t_medium)
+        t_high = np.where(t_high > MAX_T_MEDIUM, MAX_T_MEDIUM, t_high)
+        t_extreme = np.where(t_extreme > MAX_T_HIGH, MAX_T_HIGH, t_extreme)
+
+        t_extreme = np.where(t_extreme < MIN_T_EXTREME, MIN_T_EXTREME, t_extreme)
+        t_high = np.where(t_high < MIN_T_HIGH, MIN_T_HIGH, t_high)
+        t_medium = np.where(t_medium < MIN_T_MEDIUM, MIN_T_MEDIUM, t_medium)
+
+    return t_medium, t_high, t_extreme
+
+
+def classify_heat_stress_risk(tdb, t_medium, t_high, t_extreme):
+    """Map tdb onto the risk levels 0-3 given the thresholds, NaN where undetermined."""
+    tdb = np.asarray(tdb, dtype=float)
+    with np.errstate(invalid="ignore"):
+        return np.select(
+            [
+                tdb < t_medium,
+                (t_medium <= tdb) & (tdb < t_high),
+                (t_high <= tdb) & (tdb < t_extreme),
+                tdb >= t_extreme,
+            ],
+            [0, 1, 2, 3],
+            default=np.nan,
+        )
+
+
+def get_heat_stress_thresholds_batch(
+    rh,
+    tr,
+    v,
+    sport_codes,
+    clo=None,
+    met=None,
+    sweat_loss_g=850,
+    registry=sport_registry,
+):
+    """
+    Vectorized thresholds (t_medium, t_high, t_extreme) in °C for rows of different sports.
+
+    The sport parameters of each row are gathered from registry (sport_registry by default)
+    with the integer sport_codes. clo and met default to the sport values and v is clipped
+    to the wind range of each sport as in get_sports_heat_stress_curves. The rows are solved
+    in one group per exposure duration, the only parameter the PHS model needs as a scalar.
+    """
+    sport_codes = np.asarray(sport_codes, dtype=np.intp)
+    rh, tr, v, sport_codes, sweat_loss_g = np.broadcast_arrays(
+        rh, tr, v, sport_codes, sweat_loss_g
+    )
+    clo = registry.clo[sport_codes] if clo is None else np.broadcast_to(clo, rh.shape)
+    met = registry.met[sport_codes] if met is None else np.broadcast_to(met, rh.shape)
+    v = np.clip(v, registry.wind_low[sport_codes], registry.wind_high[sport_codes])
+    duration = registry.duration[sport_codes]
+
+    t_medium = np.full(rh.shape, np.nan)
+    t_extreme = np.full(rh.shape, np.nan)
+    for group_duration in np.unique(duration):
+        rows = duration == group_duration
+        t_medium[rows], t_extreme[rows] = solve_heat_stress_thresholds(
+            rh=rh[rows],
+            tr=tr[rows],
+            v=v[rows],
+            clo=clo[rows],
+            met=met[rows],
+            duration=int(group_duration),
+            sweat_loss_g=sweat_loss_g[rows],
+        )
+    return limit_heat_stress_thresholds(t_medium, t_extreme)
+
+
+def get_heat_stress_risk_batch(
+    tdb,
+    rh,
+    tr,
+    v,
+    sport_codes,
+    clo=None,
+    met=None,
+    sweat_loss_g=850,
+    registry=sport_registry,
+):
+    """
+    Vectorized version of get_sports_heat_stress_curves for rows of different sports.
+
+    Thresholds are only solved for the rows not resolved by the tdb limits.
+    Returns a float array of risk levels with NaN where the scalar function
+    would raise a ValueError.
+    """
+    tdb, rh, tr, v, sport_codes, sweat_loss_g = np.broadcast_arrays(
+        np.asarray(tdb, dtype=float),
+        rh,
+        tr,
+        v,
+        np.asarray(sport_codes, dtype=np.intp),
+        sweat_loss_g,
+    )
+    risk = np.full(tdb.shape, np.nan)
+    risk[tdb < MIN_T_MEDIUM] = 0
+    risk[tdb > MAX_T_HIGH] = 3
+
+    solve = np.isnan(risk)
+    if solve.any():
+        thresholds = get_heat_stress_thresholds_batch(
+            rh=rh[solve],
+            tr=tr[solve],
+            v=v[solve],
+            sport_codes=sport_codes[solve],
+            clo=None if clo is None else np.broadcast_to(clo, tdb.shape)[solve],
+            met=None if met is None else np.broadcast_to(met, tdb.shape)[solve],
+            sweat_loss_g=sweat_loss_g[solve],
+            registry=registry,
+        )
+        risk[solve] = classify_heat_stress_risk(tdb[solve], *thresholds)
+
+    return risk
+
+
+def get_sports_heat_stress_thresholds_array(
+    rh, tr, v=0.8, clo=None, met=None, sport_id="soccer", sweat_loss_g=850
+):
+    """Vectorized thresholds (t_medium, t_high, t_extreme) in °C for one sport."""
+    return get_heat_stress_thresholds_batch(
+        rh=rh,
+        tr=tr,
+        v=v,
+        sport_codes=sport_registry.code(sport_id),
+        clo=clo,
+        met=met,
+        sweat_loss_g=sweat_loss_g,
+    )
+
+
+def get_sports_heat_stress_curves_array(
+    tdb, rh, tr, v=0.8, clo=None, met=None, sport_id="soccer", sweat_loss_g=850
+):
+    """Vectorized version of get_sports_heat_stress_curves for one sport."""
+    return get_heat_stress_risk_batch(
+        tdb=tdb,
+        rh=rh,
+        tr=tr,
+        v=v,
+        sport_codes=sport_registry.code(sport_id),
+        clo=clo,
+        met=met,
+        sweat_loss_g=sweat_loss_g,
+    )
+
+
 def compare_sma_v2_with_new_risk_eq():
     # for sport in sports_dict.keys():
     sport = "rowing"
@@ -177,7 +545,14 @@ def compare_sma_v2_with_new_risk_eq():
 
     df_new = pd.DataFrame(results, columns=["tdb", "rh", "tg", "v", "risk"])
 
-    df_sma = calculate_comfort_indices_v2(data_for=df_new.copy(), sport_id=sport)
+    # vectorized lookup instead of a copy of df_new filled row by row
+    df_new["risk_sma"], _ = calculate_comfort_indices_array(
+        tdb=df_new["tdb"],
+        rh=df_new["rh"],
+        tg=df_new["tg"],
+        v=df_new["v"],
+        sport_id=sport,
+    )
 
     # plot side by side heatmaps
     f, axs = plt.subplots(3, 1, figsize=(7, 7), sharex=True, sharey=True)
@@ -186,11 +561,11 @@ def compare_sma_v2_with_new_risk_eq():
     df_pivot.sort_index(ascending=False, inplace=True)
     sns.heatmap(df_pivot, annot=False, cmap="viridis", ax=axs[0], vmin=0, vmax=3)
 
-    df_pivot_sma = df_sma.pivot(index="rh", columns="tdb", values="risk_value")
+    df_pivot_sma = df_new.pivot(index="rh", columns="tdb", values="risk_sma")
     df_pivot_sma.sort_index(ascending=False, inplace=True)
     sns.heatmap(df_pivot_sma, annot=False, cmap="viridis", ax=axs[1], vmin=0, vmax=3)
 
-    df_new["diff"] = df_sma["risk_value"] - df_new["risk"]
+    df_new["diff"] = df_new["risk_sma"] - df_new["risk"]
     df_diff_pivot = df_new.pivot(index="rh", columns="tdb", values="diff")
     df_diff_pivot.sort_index(ascending=False, inplace=True)
     sns.heatmap(
@@ -227,19 +602,31 @@ def compare_sma_v2_with_new_risk_eq():
     plt.show()
 
 
-def plot_one_sport_heat_stress_curve(sport="rowing"):
+def plot_one_sport_heat_stress_curve(sport="rowing", exact=True):
     tr_delta = 8  # tg - tdb
     v = sports_dict[sport]["wind_high"]
 
-    results = []
-
-    for t, rh in product(np.arange(26, 45, 0.5), range(0, 101, 1)):
-        # print(f"Calculating for {sport=} {t=} {rh=} {v=}")
-        tr = tr_delta + t
-        risk = get_sports_heat_stress_curves(tdb=t, tr=tr, rh=rh, v=v, sport_id=sport)
-        results.append([t, rh, tr_delta, v, risk])
-
-    df_new = pd.DataFrame(results, columns=["tdb", "rh", "tg", "v", "risk"])
+    # with exact=False only the cells around the boundaries between risk levels are
+    # solved, see evaluate_grid_adaptive
+    tdb_values, rh_values = np.arange(26, 45, 0.5), np.arange(0, 101, 1)
+    risk, _ = evaluate_grid(
+        lambda t, rh: get_sports_heat_stress_curves_array(
+            tdb=t, tr=tr_delta + t, rh=rh, v=v, sport_id=sport
+        ),
+        tdb_values,
+        rh_values,
+        exact=exact,
+    )
+    tdb, rh = np.meshgrid(tdb_values, rh_values, indexing="ij")
+    df_new = pd.DataFrame(
+        {
+            "tdb": tdb.ravel(),
+            "rh": rh.ravel(),
+            "tg": tr_delta,
+            "v": v,
+            "risk": risk.ravel(),
+        }
+    )
 
     f, axs = plt.subplots(1, 1, figsize=(7, 7), sharex=True, sharey=True)
 
@@ -0,0 +1,236 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+REFERENCE_TABLE_FILE = os.path.join(
+    os.path.dirname(__file__), "risk_reference_table.parquet"
+)
+# environment variable overriding the directory of the memory-mapped copies of the table
+CACHE_DIR_VARIABLE = "RISK_CALCULATION_CACHE_DIR"
+
+AXES = ("tdb", "rh", "tg", "wind_speed", "sport")
+THRESHOLD_COLUMNS = (
+    "rh_threshold_moderate",
+    "rh_threshold_high",
+    "rh_threshold_extreme",
+)
+
+
+def reference_table_dir(parquet_path: str = REFERENCE_TABLE_FILE) -> str:
+    """
+    Directory of the memory-mapped copy of a Parquet reference table.
+
+    The copies are stored in $RISK_CALCULATION_CACHE_DIR, by default in the user cache
+    directory ($XDG_CACHE_HOME or ~/.cache)/risk_calculation, and named after the hash
+    of the content of the Parquet file, so that an updated table gets a new copy while
+    the processes mapping the previous one keep using it.
+    """
+    cache_dir = os.environ.get(CACHE_DIR_VARIABLE) or os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+        "risk_calculation",
+    )
+    with open(parquet_path, "rb") as f:
+        content_hash = hashlib.sha256(f.read()).hexdigest()[:16]
+    return os.path.join(cache_dir, f"risk_reference_table_{content_hash}")
+
+
+def build_reference_table(
+    parquet_path: str = REFERENCE_TABLE_FILE, directory: str | None = None
+) -> str:
+    """
+    Convert the Parquet reference table into dense .npy arrays that can be memory-mapped.
+
+    The risk is stored as int8 over (tdb, rh, tg, wind_speed, sport) with -1 for the
+    combinations missing from the table. The rh thresholds do not depend on rh, hence
+    they are stored as float64 over (tdb, tg, wind_speed, sport).
+
+    The files are written to a uniquely named temporary directory which is published with
+    a single rename to directory (reference_table_dir(parquet_path) by default). If another
+    process published the table first, its copy is kept and this one is discarded, hence
+    processes building the table concurrently never read a partial copy and a table in
+    use is never deleted.
+
+    Returns
+    -------
+    str
+        The directory of the table.
+    """
+    if directory is None:
+        directory = reference_table_dir(parquet_path)
+    df = pd.read_parquet(parquet_path).reset_index()
+    axes = {axis: np.sort(df[axis].unique()) for axis in AXES}
+    positions = [np.searchsorted(axes[axis], df[axis].to_numpy()) for axis in AXES]
+
+    risk = np.full([len(axes[axis]) for axis in AXES], -1, dtype=np.int8)
+    risk[tuple(positions)] = df["risk"].to_numpy()
+
+    position_no_rh = tuple(positions[:1] + positions[2:])
+    shape_no_rh = [len(axes[axis]) for axis in AXES if axis != "rh"]
+    thresholds = {}
+    for column in THRESHOLD_COLUMNS:
+        values = df[column].to_numpy(dtype=float)
+        thresholds[column] = np.full(shape_no_rh, np.nan)
+        thresholds[column][position_no_rh] = values
+        if not np.array_equal(
+            thresholds[column][position_no_rh], values, equal_nan=True
+        ):
+            raise ValueError(
+                f"{column} depends on rh, it cannot be stored without the rh axis."
+            )
+
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=parent, prefix=".reference_table_")
+    try:
+        for axis in AXES:
+            values = axes[axis].astype(str) if axis == "sport" else axes[axis]
+            np.save(os.path.join(staging, f"axis_{axis}.npy"), values)
+        np.save(os.path.join(staging, "risk.npy"), risk)
+        for column, values in thresholds.items():
+            np.save(os.path.join(staging, f"{column}.npy"), values)
+        # fails if the directory exists and is not empty, i.e. was published already
+        os.rename(staging, directory)
+    except OSError:
+        if not os.path.isfile(os.path.join(directory, "risk.npy")):
+            raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return directory
+
+
+class ReferenceTable:
+    """
+    Read-only view of risk_reference_table.parquet backed by memory-mapped NumPy arrays.
+
+    The arrays are mapped with np.load(mmap_mode="r"), so the pages are loaded lazily and
+    shared through the OS page cache by all the processes using the table: the memory of
+    each worker does not grow with the number of workers, and opening the table does not
+    parse the Parquet file again. The arrays are built by build_reference_table the first
+    time a directory is opened, by default the reference_table_dir of parquet_path.
+
+    Examples
+    --------
+    >>> table = ReferenceTable()
+    >>> table.lookup(30.0, 50, 8, 1.0, "soccer")["risk"]
+    0.0
+    """
+
+    __slots__ = ("_positions", "axes", "directory", "risk", "thresholds")
+
+    def __init__(
+        self,
+        directory: str | None = None,
+        parquet_path: str = REFERENCE_TABLE_FILE,
+    ):
+        if directory is None:
+            directory = reference_table_dir(parquet_path)
+        if not os.path.isfile(os.path.join(directory, "risk.npy")):
+            build_reference_table(parquet_path, directory)
+
+        self.directory = directory
+        self.axes = {
+            axis: np.load(os.path.join(directory, f"axis_{axis}.npy")) for axis in AXES
+        }
+        self.risk = np.load(os.path.join(directory, "risk.npy"), mmap_mode="r")
+        self.thresholds = {
+            column: np.load(os.path.join(directory, f"{column}.npy"), mmap_mode="r")
+            for column in THRESHOLD_COLUMNS
+        }
+        self._positions = {
+            axis: {value: position for position, value in enumerate(values.tolist())}
+            for axis, values in self.axes.items()
+        }
+
+    @classmethod
+    def from_arrays(
+        cls, axes: dict, risk, thresholds: dict, directory: str | None = None
+    ):
+        """Table over arrays already in memory or mapped, e.g. restored from a snapshot."""
+        table = cls.__new__(cls)
+        table.directory = directory
+        table.axes = axes
+        table.risk = risk
+        table.thresholds = thresholds
+        table._positions = {
+            axis: {value: position for position, value in enumerate(values.tolist())}
+            for axis, values in axes.items()
+        }
+        return table
+
+    def lookup(self, tdb, rh, tg, wind_speed, sport_id) -> dict:
+        """
+        Row of the table as a dict with keys risk and the rh thresholds.
+
+        Same as df_risk_parquet.loc[(tdb, rh, tg, wind_speed, sport_id)].to_dict(), including
+        the float risk, and raises KeyError if the combination is not in the table.
+        """
+        key = (tdb, rh, tg, wind_speed, sport_id)
+        try:
+            position = tuple(
+                self._positions[axis][value]
+                for axis, value in zip(AXES, key, strict=True)
+            )
+        except KeyError:
+            raise KeyError(key) from None
+        risk = float(self.risk[position])
+        if risk < 0:
+            raise KeyError(key)
+
+        position_no_rh = position[:1] + position[2:]
+        row = {"risk": risk}
+        for column, values in self.thresholds.items():
+            row[column] = float(values[position_no_rh])
+        return row
+
+    def lookup_array(self, tdb, rh, tg, wind_speed, sport_ids) -> dict:
+        """
+        Vectorized lookup of many rows, as a dict of float arrays with keys risk and the rh
+        thresholds. The rows missing from the table are NaN instead of raising KeyError.
+        """
+        keys = np.broadcast_arrays(tdb, rh, tg, wind_speed, sport_ids)
+        found = np.ones(keys[0].shape, dtype=bool)
+        positions = []
+        for axis, values in zip(AXES, keys, strict=True):
+            if axis == "sport":
+                position = np.array(
+                    [
+                        self._positions[axis].get(value, -1)
+                        for value in values.ravel().tolist()
+                    ],
+                    dtype=np.intp,
+                ).reshape(values.shape)
+            else:
+                position = np.searchsorted(self.axes[axis], values)
+                position[position == len(self.axes[axis])] = 0
+                position[self.axes[axis][position] != values] = -1
+            found &= position >= 0
+            positions.append(position)
+        # the rows not found read the first cell and are masked below
+        positions = [np.where(found, position, 0) for position in positions]
+
+        risk = self.risk[tuple(positions)].astype(float)
+        found &= risk >= 0
+        rows = {"risk": np.where(found, risk, np.nan)}
+        for column, values in self.thresholds.items():
+            rows[column] = np.where(
+                found, values[tuple(positions[:1] + positions[2:])], np.nan
+            )
+        return rows
+
+    def to_frame(self) -> pd.DataFrame:
+        """The table as a DataFrame indexed like risk_reference_table.parquet."""
+        positions = np.nonzero(np.asarray(self.risk) >= 0)
+        df = pd.DataFrame(
+            {
+                axis: self.axes[axis][position]
+                for axis, position in zip(AXES, positions, strict=True)
+            }
+        )
+        df["risk"] = self.risk[positions].astype(np.int64)
+        for column, values in self.thresholds.items():
+            df[column] = values[positions[:1] + positions[2:]]
+        return df.set_index(list(AXES))
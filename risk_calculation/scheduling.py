@@ -0,0 +1,180 @@
+from itertools import pairwise
+
+import numpy as np
+import pandas as pd
+from icecream import ic
+
+from risk_calculation.batch import calculate_risk_batch
+from risk_calculation.sport_registry import sport_registry
+
+FORECAST_COLUMNS = ["venue", "lat", "lon", "tz", "time_stamp", "tdb", "rh"]
+
+
+def _range_max(values: np.ndarray, starts: np.ndarray, stops: np.ndarray) -> np.ndarray:
+    """
+    Maximum of values[start:stop] for each (start, stop), stop > start.
+
+    Sliding-window maxima of windows of any length with a sparse table: the maxima of the
+    windows of length 2**k are built level by level, and each range is covered by two
+    overlapping windows of the largest length it contains.
+    """
+    levels = [values]
+    while 2 ** len(levels) <= len(values):
+        half = 2 ** (len(levels) - 1)
+        levels.append(np.maximum(levels[-1][:-half], levels[-1][half:]))
+    k = np.floor(np.log2(stops - starts)).astype(int)
+    result = np.empty(len(starts), dtype=values.dtype)
+    for level in np.unique(k):
+        rows = k == level
+        table = levels[level]
+        result[rows] = np.maximum(table[starts[rows]], table[stops[rows] - 2**level])
+    return result
+
+
+def find_session_slots(
+    forecast: pd.DataFrame,
+    sport_id: str,
+    max_level: int = 1,
+    wind: str = "low",
+    duration: float | None = None,
+    start_between: tuple | None = None,
+    top: int | None = None,
+    decimals: dict | None = None,
+    registry=sport_registry,
+) -> pd.DataFrame:
+    """
+    Rank the start times of a session keeping the heat-stress risk at or below max_level.
+
+    The risk of every row of the forecast is solved in one vectorized pass with
+    calculate_risk_batch, then the maximum risk over the session starting at each forecast
+    time stamp is taken for all the candidate start times at once with sliding-window
+    maxima, per venue. The session covers the forecast time stamps in
+    [start, start + duration], both ends included: on hourly data a 60-minute session
+    starting at 10:00 takes the risk at 10:00 and 11:00.
+
+    Parameters
+    ----------
+    forecast : pandas.DataFrame
+        Columns venue, lat, lon, tz, time_stamp (local time), tdb (°C) and rh (%), one row
+        per venue and forecast time stamp, e.g. hourly for the next days.
+    sport_id : str
+        Key of sports_dict.
+    max_level : int, optional
+        Highest acceptable risk level during the session. Default is 1.
+    wind : str, optional
+        Wind category, "low", "med" or "high". Default is "low".
+    duration : float, optional
+        Length of the session in minutes. Default is the duration of the sport in
+        sports_dict.
+    start_between : tuple of str, optional
+        Earliest and latest local time of day of the start, e.g. ("08:00", "18:00").
+        Default is any time.
+    top : int, optional
+        Number of slots returned per venue. Default is all the feasible slots.
+    decimals : dict, optional
+        Rounding of tdb, rh and tr before solving the risk, see calculate_risk_batch.
+    registry : SportRegistry, optional
+        Sport parameters, default sport_registry.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The feasible slots with columns venue, start, end, max_risk and mean_risk (over the
+        forecast time stamps of the session), ranked per venue by max_risk, mean_risk and
+        start. Sessions extending past the end of the forecast, or including a time stamp
+        whose risk cannot be determined, are not feasible. attrs["candidates"] is the
+        number of start times evaluated.
+
+    Examples
+    --------
+    >>> find_session_slots(
+    ...     forecast, "soccer", max_level=1, start_between=("08:00", "20:00"), top=3
+    ... )  # doctest: +SKIP
+    """
+    missing = set(FORECAST_COLUMNS) - set(forecast.columns)
+    if missing:
+        raise ValueError(f"The forecast is missing the columns: {sorted(missing)}")
+    if duration is None:
+        duration = registry.record(sport_id).duration
+
+    df = forecast.assign(
+        time_stamp=pd.to_datetime(forecast["time_stamp"]), sport_id=sport_id, wind=wind
+    ).sort_values(["venue", "time_stamp"], ignore_index=True)
+    risk = calculate_risk_batch(df, registry=registry, decimals=decimals)[
+        "risk"
+    ].to_numpy()
+    determined = ~np.isnan(risk)
+
+    time_stamps = df["time_stamp"].to_numpy().astype("datetime64[ns]").astype(np.int64)
+    venues = df["venue"].to_numpy()
+    # first row of each venue and end of the rows
+    bounds = np.flatnonzero(np.r_[True, venues[1:] != venues[:-1], True])
+    last = np.repeat(bounds[1:], np.diff(bounds)) - 1
+
+    # the rows of the session are [start, stop), searched within the rows of the venue
+    ends = time_stamps + int(duration * 60e9)
+    stops = np.empty(len(df), dtype=np.intp)
+    for start_row, stop_row in pairwise(bounds):
+        stops[start_row:stop_row] = start_row + np.searchsorted(
+            time_stamps[start_row:stop_row], ends[start_row:stop_row], side="right"
+        )
+    starts = np.arange(len(df))
+    complete = ends <= time_stamps[last]
+    if start_between is not None:
+        time_of_day = df["time_stamp"].dt.strftime("%H:%M").to_numpy()
+        complete &= (time_of_day >= start_between[0]) & (
+            time_of_day <= start_between[1]
+        )
+
+    # undetermined rows make every session including them infeasible, they are left out of
+    # the running sum so that they do not turn the mean of the later sessions into NaN
+    max_risk = _range_max(np.where(determined, risk, np.inf), starts, stops)
+    cumulative = np.r_[0, np.cumsum(np.where(determined, risk, 0))]
+    mean_risk = (cumulative[stops] - cumulative[starts]) / (stops - starts)
+    feasible = complete & (max_risk <= max_level)
+
+    df_slots = pd.DataFrame(
+        {
+            "venue": venues[feasible],
+            "start": df["time_stamp"].to_numpy()[feasible],
+            "end": df["time_stamp"].to_numpy()[feasible]
+            + pd.Timedelta(minutes=duration),
+            "max_risk": max_risk[feasible],
+            "mean_risk": mean_risk[feasible],
+        }
+    ).sort_values(["venue", "max_risk", "mean_risk", "start"], ignore_index=True)
+    if top is not None:
+        df_slots = (
+            df_slots.groupby("venue", sort=False).head(top).reset_index(drop=True)
+        )
+    df_slots.attrs["candidates"] = int(complete.sum())
+    return df_slots
+
+
+if __name__ == "__main__":
+    time_stamps = pd.date_range("2024-02-01 00:00:00", periods=24 * 3, freq="h")
+    hour = time_stamps.hour.to_numpy()
+    rng = np.random.default_rng(0)
+    tdb_example = (
+        28 + 7 * np.sin((hour - 9) / 24 * 2 * np.pi) + rng.normal(0, 0.5, hour.size)
+    )
+    forecast_example = pd.DataFrame(
+        {
+            "venue": "sydney",
+            "lat": -33.87,
+            "lon": 151.21,
+            "tz": "Australia/Sydney",
+            "time_stamp": time_stamps,
+            "tdb": np.round(tdb_example, 1),
+            "rh": np.round(np.clip(70 - 1.5 * (tdb_example - 25), 0, 100)),
+        }
+    )
+    ic(
+        find_session_slots(
+            forecast_example,
+            "soccer",
+            max_level=1,
+            start_between=("08:00", "20:00"),
+            top=5,
+        )
+    )
@@ -0,0 +1,196 @@
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from cachetools import TTLCache
+from icecream import ic
+
+from risk_calculation.new_risk_eq_v2 import get_heat_stress_risk_batch
+from risk_calculation.sport_registry import sport_registry
+
+SWEEP_PARAMETERS = ("clo", "met", "v", "sweat_loss_g")
+
+RISK_COLUMNS = ["p_low", "p_moderate", "p_high", "p_extreme"]
+
+_samples_cache = TTLCache(maxsize=32, ttl=3600)
+_sweep_cache = TTLCache(maxsize=32, ttl=3600)
+
+
+def _distributions_key(distributions):
+    return tuple(sorted((name, tuple(spec)) for name, spec in distributions.items()))
+
+
+def draw_sweep_samples(distributions: dict, n_samples: int, seed: int = 0) -> dict:
+    """
+    Draw the multiplicative factors of the swept parameters.
+
+    Parameters
+    ----------
+    distributions : dict
+        Maps a parameter in SWEEP_PARAMETERS to a tuple (method, *params) where method is the
+        name of a numpy.random.Generator method, e.g. {"clo": ("normal", 1, 0.1),
+        "v": ("uniform", 0.5, 1.5)}. The values drawn multiply the nominal value of the parameter.
+    n_samples : int
+        Number of Monte Carlo samples.
+    seed : int, optional
+        Seed of the random generator. Default is 0.
+
+    Returns
+    -------
+    dict
+        One array of n_samples factors per parameter, 1 for the parameters not swept.
+
+    Notes
+    -----
+    The samples are cached by (distributions, n_samples, seed), so repeated runs of the same
+    seeded sweep reuse them. The returned arrays are read-only.
+    """
+    unknown = set(distributions) - set(SWEEP_PARAMETERS)
+    if unknown:
+        raise KeyError(f"Parameters that cannot be swept: {sorted(unknown)}")
+
+    key = (_distributions_key(distributions), n_samples, seed)
+    if key in _samples_cache:
+        return _samples_cache[key]
+
+    rng = np.random.default_rng(seed)
+    samples = {}
+    for name in SWEEP_PARAMETERS:
+        if name in distributions:
+            method, *params = distributions[name]
+            samples[name] = getattr(rng, method)(*params, size=n_samples).astype(float)
+        else:
+            samples[name] = np.ones(n_samples)
+        samples[name].flags.writeable = False
+
+    _samples_cache[key] = samples
+    return samples
+
+
+def _risk_counts(tdb, rh, tr, v, sport_codes, samples):
+    """Counts of the risk levels 0-3 and of undetermined risks for each condition."""
+    n_samples = samples["clo"].size
+    codes = np.repeat(sport_codes, n_samples)
+    risk = get_heat_stress_risk_batch(
+        tdb=np.repeat(tdb, n_samples),
+        rh=np.repeat(rh, n_samples),
+        tr=np.repeat(tr, n_samples),
+        v=np.repeat(v, n_samples) * np.tile(samples["v"], tdb.size),
+        sport_codes=codes,
+        clo=sport_registry.clo[codes] * np.tile(samples["clo"], tdb.size),
+        met=sport_registry.met[codes] * np.tile(samples["met"], tdb.size),
+        sweat_loss_g=850 * np.tile(samples["sweat_loss_g"], tdb.size),
+    ).reshape(tdb.size, n_samples)
+
+    counts = np.column_stack([(risk == level).sum(axis=1) for level in range(4)])
+    return np.column_stack([counts, np.isnan(risk).sum(axis=1)])
+
+
+def run_sensitivity_sweep(
+    conditions: pd.DataFrame,
+    distributions: dict,
+    n_samples: int = 500,
+    seed: int = 0,
+    workers: int = 1,
+    chunk_size: int = 50,
+) -> pd.DataFrame:
+    """
+    Monte Carlo sweep of the risk level over clo, met, wind speed and the sweat loss threshold.
+
+    For every condition the same n_samples parameter samples are evaluated (common random
+    numbers), and all the samples of a chunk of conditions are solved in a single call to
+    get_heat_stress_risk_batch.
+
+    Parameters
+    ----------
+    conditions : pandas.DataFrame
+        Columns tdb (°C), rh (%), tr (°C), v (m/s) and sport_id, one row per input condition.
+    distributions : dict
+        Multiplicative factors applied to the nominal clo and met of the sport, to v and to
+        sweat_loss_g=850, see draw_sweep_samples.
+    n_samples : int, optional
+        Number of Monte Carlo samples per condition. Default is 500.
+    seed : int, optional
+        Seed of the sweep. Default is 0.
+    workers : int, optional
+        Number of processes over which the chunks of conditions are distributed. Default is 1.
+    chunk_size : int, optional
+        Number of conditions evaluated together. Default is 50.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Indexed like conditions, with the probability of each risk level (p_low, p_moderate,
+        p_high, p_extreme), the probability that the risk could not be determined
+        (p_undetermined) and the mean risk level.
+
+    Examples
+    --------
+    >>> conditions = pd.DataFrame({"tdb": [33.0], "rh": [50.0], "tr": [40.0], "v": [1.0], "sport_id": ["soccer"]})
+    >>> df = run_sensitivity_sweep(conditions, {"met": ("normal", 1, 0.05)}, n_samples=100)
+    >>> df.columns.tolist()
+    ['p_low', 'p_moderate', 'p_high', 'p_extreme', 'p_undetermined', 'mean_risk']
+    """
+    samples = draw_sweep_samples(distributions, n_samples, seed)
+
+    columns = ["tdb", "rh", "tr", "v"]
+    values = conditions[columns].to_numpy(dtype=float)
+    sport_codes = sport_registry.codes(conditions["sport_id"].to_numpy())
+    key = (
+        _distributions_key(distributions),
+        n_samples,
+        seed,
+        hashlib.sha256(values.tobytes() + sport_codes.tobytes()).hexdigest(),
+    )
+    if key in _sweep_cache:
+        return _sweep_cache[key].set_axis(conditions.index)
+
+    chunks = [
+        (
+            *values[start : start + chunk_size].T,
+            sport_codes[start : start + chunk_size],
+            samples,
+        )
+        for start in range(0, len(values), chunk_size)
+    ]
+    if workers == 1 or len(chunks) <= 1:
+        counts = [_risk_counts(*chunk) for chunk in chunks]
+    else:
+        # spawned, the numba-compiled PHS model is not fork-safe once it has run
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            counts = list(executor.map(_risk_counts, *zip(*chunks, strict=True)))
+    counts = np.vstack(counts) if counts else np.zeros((0, 5))
+
+    probabilities = counts / n_samples
+    df_results = pd.DataFrame(
+        probabilities, columns=[*RISK_COLUMNS, "p_undetermined"], index=conditions.index
+    )
+    determined = counts[:, :4].sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        df_results["mean_risk"] = (counts[:, :4] @ np.arange(4)) / determined
+
+    _sweep_cache[key] = df_results
+    return df_results.copy()
+
+
+if __name__ == "__main__":
+    conditions_example = pd.DataFrame(
+        {
+            "tdb": [30.0, 33.0, 36.0],
+            "rh": [60.0, 50.0, 40.0],
+            "tr": [38.0, 41.0, 44.0],
+            "v": [1.0, 1.0, 1.0],
+            "sport_id": ["soccer", "soccer", "soccer"],
+        }
+    )
+    distributions_example = {
+        "clo": ("normal", 1, 0.1),
+        "met": ("normal", 1, 0.05),
+        "v": ("uniform", 0.5, 1.5),
+        "sweat_loss_g": ("normal", 1, 0.1),
+    }
+    ic(run_sensitivity_sweep(conditions_example, distributions_example, n_samples=200))
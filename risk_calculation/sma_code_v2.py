@@ -3,7 +3,29 @@ from dataclasses import dataclass
 import numpy as np
 import pandas as pd
 
-df_risk_parquet = pd.read_parquet("./risk_calculation/risk_reference_table.parquet")
+from risk_calculation.reference_table import REFERENCE_TABLE_FILE, ReferenceTable
+
+
+def get_reference_table() -> ReferenceTable:
+    """
+    The reference table, memory-mapped and shared by all the processes instead of one
+    DataFrame per process. It is opened, and built if needed, on first use rather than
+    at import, see reference_table_dir for its location.
+    """
+    table = globals().get("reference_table")
+    if table is None:
+        table = globals()["reference_table"] = ReferenceTable()
+    return table
+
+
+def __getattr__(name):
+    if name == "reference_table":
+        return get_reference_table()
+    # the DataFrame is only parsed by the code still using it
+    if name == "df_risk_parquet":
+        globals()["df_risk_parquet"] = pd.read_parquet(REFERENCE_TABLE_FILE)
+        return globals()["df_risk_parquet"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 sports_dict = {
@@ -340,7 +362,7 @@ sports_dict = {
 }
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Sport:
     clo: float
     met: float
@@ -352,20 +374,81 @@ class Sport:
     sport: str
 
 
+# one read-only record per sport, built once at import
+sports = {sport_id: Sport(**values) for sport_id, values in sports_dict.items()}
+
+
+def calculate_comfort_indices_array(tdb, rh, tg, v, sport_id):
+    """
+    Vectorized risk_value and risk_value_interpolated of calculate_comfort_indices_v2.
+
+    The inputs are clipped and rounded onto the grid of the reference table as in
+    calculate_comfort_indices_v2 and looked up all at once. Both outputs are NaN for the
+    conditions missing from the table.
+
+    Returns
+    -------
+    tuple of numpy.ndarray
+        (risk_value, risk_value_interpolated)
+    """
+    sport = sports[sport_id]
+    tdb, rh, tg, v = np.broadcast_arrays(
+        np.asarray(tdb, dtype=float), np.asarray(rh, dtype=float), tg, v
+    )
+
+    tg_table = np.round(np.clip(tg, 4, 12))
+    wind_table = np.clip(v, sport.wind_low, None)
+    wind_table = np.where(
+        wind_table > sport.wind_high - 0.5, sport.wind_high - 0.5, wind_table
+    )
+    wind_table = np.round(np.round(wind_table / 0.5) * 0.5, 2)
+    tdb_table = np.round(np.clip(tdb, 24, 43.5) * 2) / 2
+    rh_table = np.round(np.clip(rh, 0, 99))
+
+    rows = get_reference_table().lookup_array(
+        tdb_table, rh_table, tg_table, wind_table, sport_id
+    )
+
+    # np.interp(rh, [0, moderate, high, extreme, top], [0, 1, 2, 3, 4]) row by row
+    top = np.where(
+        rows["rh_threshold_extreme"] > 100, rows["rh_threshold_extreme"] + 10, 100
+    )
+    x = np.column_stack(
+        [
+            np.zeros(rh.size),
+            rows["rh_threshold_moderate"].ravel(),
+            rows["rh_threshold_high"].ravel(),
+            rows["rh_threshold_extreme"].ravel(),
+            top.ravel(),
+        ]
+    )
+    rh_flat = rh.ravel()
+    segment = np.clip((x[:, 1:-1] <= rh_flat[:, None]).sum(axis=1), 0, 3)
+    x0 = x[np.arange(rh.size), segment]
+    x1 = x[np.arange(rh.size), segment + 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fraction = np.where(x1 > x0, (rh_flat - x0) / (x1 - x0), 1)
+    risk_value_interp = segment + np.clip(fraction, 0, 1)
+    # some thresholds of the table are not increasing, np.interp is kept for those rows
+    y = np.arange(0, 5, 1)
+    for row in np.flatnonzero(~(np.diff(x, axis=1) >= 0).all(axis=1)):
+        risk_value_interp[row] = np.interp(rh_flat[row], x[row], y)
+    risk_value_interp = np.around(risk_value_interp, 1).reshape(rh.shape)
+    risk_value_interp[np.isnan(rows["risk"])] = np.nan
+
+    # same ramp as calculate_comfort_indices_v2 between 20 and 24 °C
+    factor = np.select(
+        [tdb < 20, tdb < 21, tdb < 22, tdb < 23, tdb < 24],
+        [0, 0.2, 0.4, 0.6, 0.8],
+        default=1,
+    )
+    return rows["risk"], np.round(risk_value_interp * factor, 2)
+
+
 def calculate_comfort_indices_v2(data_for, sport_id):
     array_risk_results = []
 
-    sport_dict = sports_dict[sport_id]
-    sport = Sport(
-        clo=sport_dict["clo"],
-        met=sport_dict["met"],
-        sport_cat=sport_dict["sport_cat"],
-        wind_low=sport_dict["wind_low"],
-        wind_med=sport_dict["wind_med"],
-        wind_high=sport_dict["wind_high"],
-        duration=sport_dict["duration"],
-        sport=sport_dict["sport"],
-    )
+    sport = sports[sport_id]
 
     # data_for = data_for.resample("60min").interpolate()
     for ix, row in data_for.iterrows():
@@ -399,8 +482,7 @@ def calculate_comfort_indices_v2(data_for, sport_id):
         rh = round(rh)
 
         try:
-            risk_value = df_risk_parquet.loc[(tdb, rh, tg, wind_speed, sport_id)]
-            risk_value = risk_value.to_dict()
+            risk_value = get_reference_table().lookup(tdb, rh, tg, wind_speed, sport_id)
         except KeyError as e:
             print(
                 f"Parquet file - Risk value not found for {tdb=}, {rh=}, {tg=}, {wind_speed=}, {sport_id=}: {e}"
@@ -0,0 +1,298 @@
+import hashlib
+import json
+import os
+import time
+from importlib.metadata import version
+
+import numpy as np
+from cachetools.keys import hashkey
+from icecream import ic
+
+from risk_calculation import new_risk_eq_v2, sma_code_v2
+from risk_calculation.mrt_calculation import calculate_mrt
+from risk_calculation.new_risk_eq_v2 import (
+    PHS_KWARGS,
+    THRESHOLD_BRACKETS,
+    get_sports_heat_stress_curves,
+    sports_dict,
+)
+from risk_calculation.reference_table import AXES, ReferenceTable
+from risk_calculation.threshold_surrogate import (
+    SURROGATE_FILE,
+    load_threshold_surrogate,
+)
+
+SNAPSHOT_FILE = os.path.join(os.path.dirname(__file__), "warm_state.snapshot")
+# incremented when the layout of the snapshot changes
+SNAPSHOT_VERSION = 2
+MAGIC = b"RISKSNAP"
+ALIGNMENT = 64
+
+# cached functions whose entries are stored by default, by name
+SNAPSHOT_FUNCTIONS = {
+    "calculate_mrt": calculate_mrt,
+    "get_sports_heat_stress_curves": get_sports_heat_stress_curves,
+}
+
+# separator of the positional and keyword arguments in the keys of cachetools
+_KWMARK = hashkey(_=None)[0]
+
+# constants of new_risk_eq_v2 the risk levels depend on
+RISK_CONSTANTS = (
+    "MAX_T_LOW",
+    "MAX_T_MEDIUM",
+    "MAX_T_HIGH",
+    "MIN_T_EXTREME",
+    "MIN_T_HIGH",
+    "MIN_T_MEDIUM",
+    "T_CR_EXTREME",
+)
+
+
+def state_fingerprint() -> str:
+    """
+    Hash of what the cached results and the restored tables depend on: the sport
+    parameters, the settings of the PHS model, the threshold limits and the core
+    temperature of the extreme risk, the coefficients of the threshold surrogate and the
+    versions of the libraries computing them.
+    """
+    with open(SURROGATE_FILE, "rb") as f:
+        surrogate_hash = hashlib.sha256(f.read()).hexdigest()
+    state = {
+        "sports": sports_dict,
+        "phs_kwargs": PHS_KWARGS,
+        "brackets": THRESHOLD_BRACKETS,
+        "constants": {name: getattr(new_risk_eq_v2, name) for name in RISK_CONSTANTS},
+        "surrogate": surrogate_hash,
+        "libraries": {
+            name: version(name)
+            for name in ("numpy", "pvlib", "pythermalcomfort", "scipy")
+        },
+    }
+    return hashlib.sha256(json.dumps(state, sort_keys=True).encode()).hexdigest()
+
+
+def _cache_columns(cache) -> list:
+    """
+    Entries of a cachetools cache as columns, one group per call signature (number of
+    positional arguments and names of the keyword arguments). Entries whose arguments or
+    value are not numbers, strings or booleans are left out.
+    """
+    groups = {}
+    for key, value in list(cache.items()):
+        key = tuple(key)
+        split = next((i for i, item in enumerate(key) if item is _KWMARK), len(key))
+        kwargs = key[split + 1 :]
+        signature = (split, tuple(name for name, _ in kwargs))
+        groups.setdefault(signature, []).append(
+            key[:split] + tuple(item for _, item in kwargs) + (value,)
+        )
+
+    columns = []
+    for (n_args, kwarg_names), rows in groups.items():
+        values = list(zip(*rows, strict=True))
+        arrays = [np.asarray(column) for column in values]
+        if any(
+            array.dtype.kind not in "biufU"
+            or (
+                array.dtype.kind == "U"
+                and not all(isinstance(item, str) for item in column)
+            )
+            for array, column in zip(arrays, values, strict=True)
+        ):
+            continue
+        columns.append(
+            {"n_args": n_args, "kwarg_names": list(kwarg_names), "arrays": arrays}
+        )
+    return columns
+
+
+def save_snapshot(path: str = SNAPSHOT_FILE, functions: dict | None = None) -> str:
+    """
+    Serialize the initialized read-only state to a single versioned file.
+
+    The file holds the reference table of the SMA model, the coefficients of the threshold
+    surrogate and the entries of the caches of functions (by default calculate_mrt and
+    get_sports_heat_stress_curves). It starts with a JSON header, followed by the raw
+    arrays aligned to 64 bytes, so that restore_snapshot maps them without parsing or
+    copying. The file is written to a temporary name and renamed.
+
+    Examples
+    --------
+    >>> save_snapshot()  # after warming up the caches
+    >>> restore_snapshot()  # in each new worker
+    """
+    if functions is None:
+        functions = SNAPSHOT_FUNCTIONS
+
+    arrays = {}
+    table = sma_code_v2.reference_table
+    for axis in AXES:
+        arrays[f"reference_table/axis_{axis}"] = np.asarray(table.axes[axis])
+    arrays["reference_table/risk"] = np.asarray(table.risk)
+    for column, values in table.thresholds.items():
+        arrays[f"reference_table/{column}"] = np.asarray(values)
+
+    surrogate = load_threshold_surrogate(SURROGATE_FILE)
+    arrays["surrogate/coefficients"] = np.stack(list(surrogate.values()))
+
+    caches = {}
+    for name, function in functions.items():
+        caches[name] = []
+        for group, columns in enumerate(_cache_columns(function.cache)):
+            for i, array in enumerate(columns["arrays"]):
+                arrays[f"cache/{name}/{group}/{i}"] = array
+            caches[name].append(
+                {
+                    "n_args": columns["n_args"],
+                    "kwarg_names": columns["kwarg_names"],
+                    "ttl": getattr(function.cache, "ttl", None),
+                }
+            )
+
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        layout[name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": offset,
+        }
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+
+    header = json.dumps(
+        {
+            "version": SNAPSHOT_VERSION,
+            "fingerprint": state_fingerprint(),
+            "created": time.time(),
+            "thresholds": list(table.thresholds),
+            "surrogate_sport_ids": list(surrogate),
+            "caches": caches,
+            "arrays": layout,
+        }
+    ).encode()
+    data_start = -(-(len(MAGIC) + 8 + len(header)) // ALIGNMENT) * ALIGNMENT
+
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(data_start + offset)
+    os.replace(f"{path}.tmp", path)
+    return path
+
+
+def load_snapshot(path: str = SNAPSHOT_FILE):
+    """
+    Header and memory-mapped arrays of a snapshot.
+
+    Raises ValueError if the file is not a snapshot or was written by another version of
+    the snapshot layout or of the model.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a warm-state snapshot.")
+        header_length = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_length))
+    if header["version"] != SNAPSHOT_VERSION:
+        raise ValueError(
+            f"{path} has version {header['version']}, expected {SNAPSHOT_VERSION}."
+        )
+    if header["fingerprint"] != state_fingerprint():
+        raise ValueError(
+            f"{path} was saved with other sport parameters, model constants, surrogate "
+            "coefficients or library versions."
+        )
+
+    data_start = -(-(len(MAGIC) + 8 + header_length) // ALIGNMENT) * ALIGNMENT
+    arrays = {}
+    for name, layout in header["arrays"].items():
+        shape = tuple(layout["shape"])
+        if 0 in shape:
+            arrays[name] = np.empty(shape, dtype=layout["dtype"])
+        else:
+            arrays[name] = np.memmap(
+                path,
+                dtype=layout["dtype"],
+                mode="r",
+                offset=data_start + layout["offset"],
+                shape=shape,
+            )
+    return header, arrays
+
+
+def restore_snapshot(path: str = SNAPSHOT_FILE, functions: dict | None = None) -> dict:
+    """
+    Restore the state saved by save_snapshot in a new process.
+
+    The reference table and the surrogate coefficients are memory-mapped from the file,
+    in a few milliseconds. The cache entries of functions (same names as when saving) are
+    inserted in their caches, keeping their existing entries: caches that can be resized
+    (ConcurrentCache) are grown by their number, with the ttl they were saved with. Unlike the
+    tables, the entries are not mapped: each key is rebuilt and inserted in the cache,
+    about 15 to 20 µs per entry, mostly spent in TTLCache.__setitem__, i.e. 3 to 4 s for
+    200k entries.
+
+    Returns
+    -------
+    dict
+        Number of cache entries restored per function name.
+    """
+    if functions is None:
+        functions = SNAPSHOT_FUNCTIONS
+    header, arrays = load_snapshot(path)
+
+    sma_code_v2.reference_table = ReferenceTable.from_arrays(
+        axes={
+            axis: np.asarray(arrays[f"reference_table/axis_{axis}"]) for axis in AXES
+        },
+        risk=arrays["reference_table/risk"],
+        thresholds={
+            column: arrays[f"reference_table/{column}"]
+            for column in header["thresholds"]
+        },
+    )
+
+    surrogate = dict(
+        zip(
+            header["surrogate_sport_ids"], arrays["surrogate/coefficients"], strict=True
+        )
+    )
+    load_threshold_surrogate.cache[hashkey(SURROGATE_FILE)] = surrogate
+    load_threshold_surrogate.cache[hashkey()] = surrogate
+
+    restored = {}
+    for name, function in functions.items():
+        restored[name] = 0
+        signatures = header["caches"].get(name, [])
+        n_entries = sum(
+            header["arrays"][f"cache/{name}/{group}/0"]["shape"][0]
+            for group in range(len(signatures))
+        )
+        cache = function.cache
+        if hasattr(cache, "resize") and signatures:
+            cache.resize(cache.maxsize + n_entries, ttl=signatures[0]["ttl"])
+        for group, signature in enumerate(signatures):
+            n_args, kwarg_names = signature["n_args"], signature["kwarg_names"]
+            n_columns = n_args + len(kwarg_names) + 1
+            columns = [
+                arrays[f"cache/{name}/{group}/{i}"].tolist() for i in range(n_columns)
+            ]
+            for row in zip(*columns, strict=True):
+                key = hashkey(
+                    *row[:n_args], **dict(zip(kwarg_names, row[n_args:-1], strict=True))
+                )
+                function.cache[key] = row[-1]
+            restored[name] += len(columns[0])
+    return restored
+
+
+if __name__ == "__main__":
+    calculate_mrt(
+        lat=-33.87, lon=151.21, tz="Australia/Sydney", time_stamp="2024-02-01 15:00:00"
+    )
+    save_snapshot()
+    start = time.perf_counter()
+    ic(restore_snapshot(), time.perf_counter() - start)
@@ -0,0 +1,107 @@
+import numpy as np
+
+from risk_calculation.sma_code_v2 import Sport, sports, sports_dict
+
+WIND_CATEGORIES = ("low", "med", "high")
+
+
+class SportRegistry:
+    """
+    The sport parameters of sports_dict stored as NumPy arrays indexed by an integer sport code.
+
+    Batch functions convert the sport ids of their rows to codes once, then gather the
+    per-row parameters with fancy indexing (e.g. ``registry.clo[codes]``) instead of
+    looking up sports_dict for every row. Scalar access goes through the slotted
+    Sport records of sma_code_v2.
+
+    Sports with identical physiological parameters (clo, met and duration) share the
+    same ``param_code``, hence thresholds solved for one of them can be reused for the
+    others (e.g. rugby league and rugby union).
+
+    Examples
+    --------
+    >>> codes = sport_registry.codes(["soccer", "tennis", "soccer"])
+    >>> sport_registry.met[codes]
+    array([7.5, 7. , 7.5])
+    >>> sport_registry.record("soccer").duration
+    45
+    """
+
+    __slots__ = (
+        "_codes",
+        "_records",
+        "clo",
+        "duration",
+        "met",
+        "param_code",
+        "params",
+        "sport_cat",
+        "sport_ids",
+        "wind",
+        "wind_high",
+        "wind_low",
+        "wind_med",
+    )
+
+    def __init__(self, sports_parameters=None):
+        if sports_parameters is None:
+            sports_parameters = sports_dict
+        self.sport_ids = np.array(list(sports_parameters))
+        self._codes = {sport_id: code for code, sport_id in enumerate(self.sport_ids)}
+        self._records = tuple(
+            sports[sport_id] if sports_parameters is sports_dict else Sport(**values)
+            for sport_id, values in sports_parameters.items()
+        )
+
+        values = list(sports_parameters.values())
+        self.clo = np.array([value["clo"] for value in values], dtype=float)
+        self.met = np.array([value["met"] for value in values], dtype=float)
+        self.sport_cat = np.array(
+            [value["sport_cat"] for value in values], dtype=np.int8
+        )
+        self.wind_low = np.array([value["wind_low"] for value in values], dtype=float)
+        self.wind_med = np.array([value["wind_med"] for value in values], dtype=float)
+        self.wind_high = np.array([value["wind_high"] for value in values], dtype=float)
+        self.duration = np.array(
+            [value["duration"] for value in values], dtype=np.int64
+        )
+        # wind speed by [sport code, wind category code]
+        self.wind = np.column_stack([self.wind_low, self.wind_med, self.wind_high])
+
+        self.params, self.param_code = np.unique(
+            np.column_stack([self.clo, self.met, self.duration]),
+            axis=0,
+            return_inverse=True,
+        )
+        self.param_code = self.param_code.ravel()
+
+    def __len__(self):
+        return len(self.sport_ids)
+
+    def code(self, sport_id: str) -> int:
+        """Integer code of a sport, raises KeyError if the sport is unknown."""
+        return self._codes[sport_id]
+
+    def codes(self, sport_ids) -> np.ndarray:
+        """Integer codes of an array of sport ids, raises KeyError if a sport is unknown."""
+        sport_ids = np.asarray(sport_ids)
+        unique_ids, inverse = np.unique(sport_ids, return_inverse=True)
+        return np.array(
+            [self._codes[sport_id] for sport_id in unique_ids], dtype=np.intp
+        )[inverse.reshape(sport_ids.shape)]
+
+    def record(self, sport_id: str):
+        """Slotted Sport record with the scalar parameters of a sport."""
+        return self._records[self._codes[sport_id]]
+
+    def wind_speed(self, codes, winds="low") -> np.ndarray:
+        """Wind speed (m/s) of each row given the sport codes and wind categories."""
+        winds = np.asarray(winds)
+        unique_winds, inverse = np.unique(winds, return_inverse=True)
+        wind_codes = np.array([WIND_CATEGORIES.index(wind) for wind in unique_winds])[
+            inverse.reshape(winds.shape)
+        ]
+        return self.wind[codes, wind_codes]
+
+
+sport_registry = SportRegistry()
@@ -0,0 +1,258 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from cachetools import cached
+from icecream import ic
+from numpy.polynomial import chebyshev
+
+from risk_calculation.new_risk_eq_v2 import (
+    MAX_T_HIGH,
+    MAX_T_LOW,
+    MIN_T_EXTREME,
+    MIN_T_MEDIUM,
+    classify_heat_stress_risk,
+    get_heat_stress_risk_batch,
+    get_heat_stress_thresholds_batch,
+    limit_heat_stress_thresholds,
+    solve_heat_stress_thresholds,
+)
+from risk_calculation.sport_registry import sport_registry
+
+SURROGATE_FILE = os.path.join(os.path.dirname(__file__), "threshold_surrogate.npz")
+
+# degrees of the Chebyshev polynomials in rh, tr and v
+DEGREES = (8, 8, 3)
+RH_RANGE = (0, 100)
+TR_RANGE = (MIN_T_MEDIUM, 85)
+# a threshold is only fitted within this margin (°C) of its clipping range
+MARGIN = 2
+
+
+def _scale(x, low, high):
+    return np.clip((np.asarray(x, dtype=float) - low) / (high - low) * 2 - 1, -1, 1)
+
+
+def _surrogate_inputs(rh, tr, v, wind_low, wind_high):
+    return (
+        _scale(rh, *RH_RANGE),
+        _scale(tr, *TR_RANGE),
+        _scale(v, wind_low, np.where(wind_high > wind_low, wind_high, wind_low + 1)),
+    )
+
+
+def fit_threshold_surrogate(
+    sport_id: str, n_rh: int = 26, n_tr: int = 32, n_v: int = 4
+) -> np.ndarray:
+    """
+    Fit the Chebyshev coefficients of t_medium and t_extreme of one sport.
+
+    The exact thresholds are solved on a regular (rh, tr, v) grid and fitted by least
+    squares. The thresholds are clipped to their range extended by MARGIN beforehand,
+    which removes the kinks the polynomials cannot follow without changing the
+    classification.
+
+    Returns
+    -------
+    numpy.ndarray
+        Coefficients with shape (2, *(degree + 1 for degree in DEGREES)), t_medium first.
+    """
+    code = sport_registry.code(sport_id)
+    wind_low, wind_high = sport_registry.wind_low[code], sport_registry.wind_high[code]
+    rh, tr, v = (
+        axis.ravel()
+        for axis in np.meshgrid(
+            np.linspace(*RH_RANGE, n_rh),
+            np.linspace(*TR_RANGE, n_tr),
+            np.linspace(wind_low, wind_high, n_v),
+            indexing="ij",
+        )
+    )
+    thresholds = solve_heat_stress_thresholds(
+        rh=rh,
+        tr=tr,
+        v=v,
+        clo=sport_registry.clo[code],
+        met=sport_registry.met[code],
+        duration=int(sport_registry.duration[code]),
+    )
+    matrix = chebyshev.chebvander3d(
+        *_surrogate_inputs(rh, tr, v, wind_low, wind_high), DEGREES
+    )
+
+    coefficients = []
+    for threshold, (low, high) in zip(
+        thresholds,
+        [(MIN_T_MEDIUM, MAX_T_LOW), (MIN_T_EXTREME, MAX_T_HIGH)],
+        strict=True,
+    ):
+        # no root means the threshold is above the bracket
+        target = np.clip(
+            np.nan_to_num(threshold, nan=high + MARGIN), low - MARGIN, high + MARGIN
+        )
+        coefficient, *_ = np.linalg.lstsq(matrix, target, rcond=None)
+        coefficients.append(coefficient.reshape([degree + 1 for degree in DEGREES]))
+
+    return np.stack(coefficients)
+
+
+def fit_all_threshold_surrogates(
+    path: str = SURROGATE_FILE, workers: int | None = None
+):
+    """
+    Fit the surrogate of every sport and save the coefficients to a compressed .npz file.
+
+    Sports with identical clo, met, duration and wind range share the same fit.
+    """
+    parameters = np.column_stack(
+        [
+            sport_registry.params[sport_registry.param_code],
+            sport_registry.wind_low,
+            sport_registry.wind_high,
+        ]
+    )
+    _, first, inverse = np.unique(
+        parameters, axis=0, return_index=True, return_inverse=True
+    )
+    # spawned, the numba-compiled PHS model is not fork-safe once it has run
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        fits = list(
+            executor.map(fit_threshold_surrogate, sport_registry.sport_ids[first])
+        )
+
+    np.savez_compressed(
+        path,
+        sport_ids=sport_registry.sport_ids,
+        coefficients=np.stack(fits)[inverse.ravel()],
+        degrees=np.array(DEGREES),
+        rh_range=np.array(RH_RANGE),
+        tr_range=np.array(TR_RANGE),
+    )
+    return path
+
+
+@cached(cache={})
+def load_threshold_surrogate(path: str = SURROGATE_FILE) -> dict:
+    """Coefficients of the surrogate of each sport, keyed by sport_id."""
+    with np.load(path) as data:
+        if tuple(data["degrees"]) != DEGREES:
+            raise ValueError(
+                f"The surrogate in {path} was fitted with different degrees."
+            )
+        return dict(zip(data["sport_ids"].tolist(), data["coefficients"], strict=True))
+
+
+def get_heat_stress_thresholds_surrogate(
+    rh, tr, v, sport_codes, path: str = SURROGATE_FILE
+):
+    """
+    Approximate thresholds (t_medium, t_high, t_extreme) in °C from the fitted surrogate.
+
+    Drop-in replacement of get_heat_stress_thresholds_batch: each threshold is a
+    polynomial in (rh, tr, v), so the evaluation is a handful of vectorized
+    multiply-adds instead of a root search. Inputs outside the fitted domain are
+    clipped to it.
+    """
+    coefficients = load_threshold_surrogate(path)
+    rh, tr, v, sport_codes = np.broadcast_arrays(
+        rh, tr, v, np.asarray(sport_codes, dtype=np.intp)
+    )
+    v = np.clip(
+        v, sport_registry.wind_low[sport_codes], sport_registry.wind_high[sport_codes]
+    )
+
+    t_medium = np.full(rh.shape, np.nan)
+    t_extreme = np.full(rh.shape, np.nan)
+    for code in np.unique(sport_codes):
+        rows = sport_codes == code
+        x = _surrogate_inputs(
+            rh[rows],
+            tr[rows],
+            v[rows],
+            sport_registry.wind_low[code],
+            sport_registry.wind_high[code],
+        )
+        sport_coefficients = coefficients[sport_registry.sport_ids[code]]
+        t_medium[rows] = chebyshev.chebval3d(*x, sport_coefficients[0])
+        t_extreme[rows] = chebyshev.chebval3d(*x, sport_coefficients[1])
+
+    return limit_heat_stress_thresholds(t_medium, t_extreme)
+
+
+def get_heat_stress_risk_surrogate(
+    tdb, rh, tr, v, sport_codes, path: str = SURROGATE_FILE
+):
+    """Approximate risk levels, same interface as get_heat_stress_risk_batch."""
+    tdb, rh, tr, v, sport_codes = np.broadcast_arrays(
+        np.asarray(tdb, dtype=float), rh, tr, v, np.asarray(sport_codes, dtype=np.intp)
+    )
+    risk = classify_heat_stress_risk(
+        tdb, *get_heat_stress_thresholds_surrogate(rh, tr, v, sport_codes, path)
+    )
+    risk[tdb < MIN_T_MEDIUM] = 0
+    risk[tdb > MAX_T_HIGH] = 3
+    return risk
+
+
+def validate_threshold_surrogate(
+    n_samples: int = 2_000, seed: int = 0, path: str = SURROGATE_FILE
+) -> pd.DataFrame:
+    """
+    Compare the surrogate with the exact brentq solution on random conditions.
+
+    For each sport, tdb (23-43.5 °C), rh (0-100 %), delta_mrt (0-40 °C) and v (within the
+    sport wind range) are drawn uniformly.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Per sport: max_error_t_medium, max_error_t_high and max_error_t_extreme (°C, only
+        where the exact threshold is not above tr, since tdb never exceeds tr and higher
+        thresholds are never crossed), misclassification_rate (share of the conditions
+        with a determined exact risk classified differently) and undetermined_rate (share
+        of the conditions whose exact risk could not be determined).
+    """
+    rng = np.random.default_rng(seed)
+    report = []
+    for code, sport_id in enumerate(sport_registry.sport_ids):
+        tdb = rng.uniform(MIN_T_MEDIUM, MAX_T_HIGH, n_samples)
+        rh = rng.uniform(*RH_RANGE, n_samples)
+        tr = tdb + rng.uniform(0, 40, n_samples)
+        v = rng.uniform(
+            sport_registry.wind_low[code], sport_registry.wind_high[code], n_samples
+        )
+
+        exact = get_heat_stress_thresholds_batch(rh, tr, v, code)
+        approximate = get_heat_stress_thresholds_surrogate(rh, tr, v, code, path)
+        risk_exact = get_heat_stress_risk_batch(tdb, rh, tr, v, code)
+        risk_approximate = get_heat_stress_risk_surrogate(tdb, rh, tr, v, code, path)
+        determined = ~np.isnan(risk_exact)
+
+        row = {"sport_id": sport_id}
+        for name, t_exact, t_approximate in zip(
+            ["t_medium", "t_high", "t_extreme"], exact, approximate, strict=True
+        ):
+            reachable = t_exact <= tr
+            row[f"max_error_{name}"] = (
+                np.abs(t_approximate - t_exact)[reachable].max()
+                if reachable.any()
+                else np.nan
+            )
+        row["misclassification_rate"] = np.mean(
+            risk_exact[determined] != risk_approximate[determined]
+        )
+        row["undetermined_rate"] = 1 - determined.mean()
+        report.append(row)
+
+    return pd.DataFrame(report).set_index("sport_id")
+
+
+if __name__ == "__main__":
+    # fit_all_threshold_surrogates()
+    df_report = validate_threshold_surrogate(n_samples=500)
+    ic(df_report)
+    ic(df_report.max())
@@ -0,0 +1,266 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from cachetools.keys import hashkey
+
+from risk_calculation.mrt_calculation import calculate_mrt, calculate_mrt_series
+from risk_calculation.new_risk_eq_v2 import get_heat_stress_risk_batch
+from risk_calculation.sport_registry import sport_registry
+
+SCHEDULE_COLUMNS = ["venue", "lat", "lon", "tz", "sport_id", "start", "end"]
+# optional columns of the schedule overriding the tdb/rh envelope of a session
+ENVELOPE_COLUMNS = ["tdb_min", "tdb_max", "rh_min", "rh_max"]
+
+
+def load_schedule(path: str) -> pd.DataFrame:
+    """
+    Read an event schedule from a .csv, .json or .parquet file.
+
+    The schedule has one row per session with columns venue, lat, lon, tz, sport_id,
+    start and end (local times), optionally wind ("low", "med" or "high", default "low")
+    and the envelope columns tdb_min, tdb_max (°C), rh_min and rh_max (%).
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        schedule = pd.read_csv(path)
+    elif extension == ".json":
+        schedule = pd.read_json(path)
+    elif extension == ".parquet":
+        schedule = pd.read_parquet(path)
+    else:
+        raise ValueError(f"Unsupported schedule file extension: {extension}")
+
+    missing = set(SCHEDULE_COLUMNS) - set(schedule.columns)
+    if missing:
+        raise ValueError(f"The schedule is missing the columns: {sorted(missing)}")
+    sport_registry.codes(schedule["sport_id"])
+    if "wind" not in schedule.columns:
+        schedule["wind"] = "low"
+    schedule["wind"] = schedule["wind"].fillna("low")
+    schedule["start"] = pd.to_datetime(schedule["start"])
+    schedule["end"] = pd.to_datetime(schedule["end"])
+    return schedule
+
+
+def expand_schedule(schedule: pd.DataFrame, freq: str = "h") -> pd.DataFrame:
+    """One row per session and hour, from the hour of the start to the hour of the end."""
+    time_stamps = [
+        pd.date_range(start.floor(freq), end.floor(freq), freq=freq)
+        for start, end in zip(schedule["start"], schedule["end"], strict=True)
+    ]
+    sessions = schedule.drop(columns=["start", "end"]).loc[
+        schedule.index.repeat([len(t) for t in time_stamps])
+    ]
+    sessions = sessions.reset_index(drop=True)
+    sessions["time_stamp"] = [
+        t.strftime("%Y-%m-%d %H:%M:%S") for ts in time_stamps for t in ts
+    ]
+    return sessions
+
+
+def warm_up_mrt_cache(sessions: pd.DataFrame, cache=calculate_mrt.cache) -> pd.Series:
+    """
+    Calculate the MRT of every session hour and store it in the cache of calculate_mrt.
+
+    The keys match the keyword call made by calculate_risk_value, i.e. with lat and lon
+    rounded to 2 decimals by the built-in round, which can differ from the rounding of
+    NumPy and pandas in the last decimal.
+
+    Returns
+    -------
+    pandas.Series
+        The delta_mrt of each row of sessions.
+    """
+    delta_mrt = pd.Series(np.nan, index=sessions.index)
+    for (lat, lon, tz), rows in sessions.groupby(
+        [
+            [float(round(lat, 2)) for lat in sessions["lat"].astype(float)],
+            [float(round(lon, 2)) for lon in sessions["lon"].astype(float)],
+            "tz",
+        ]
+    ):
+        time_stamps = rows["time_stamp"].unique()
+        values = calculate_mrt_series(lat=lat, lon=lon, tz=tz, time_stamps=time_stamps)
+        for time_stamp, value in zip(time_stamps, values, strict=True):
+            cache[hashkey(lat=lat, lon=lon, tz=tz, time_stamp=time_stamp)] = float(
+                value
+            )
+        delta_mrt[rows.index] = pd.Series(values, index=time_stamps)[
+            rows["time_stamp"]
+        ].to_numpy()
+    return delta_mrt
+
+
+def _envelope_risk(tdb, rh, delta_mrt, v, sport_code):
+    """Risk level of each (tdb, rh) pair of the envelope of one session hour."""
+    return get_heat_stress_risk_batch(
+        tdb=tdb, rh=rh, tr=tdb + delta_mrt, v=v, sport_codes=sport_code
+    )
+
+
+def _unique_session_hours(sessions: pd.DataFrame) -> pd.DataFrame:
+    return sessions.drop_duplicates(
+        ["lat", "lon", "tz", "time_stamp", "sport_id", "wind"]
+    )
+
+
+def _envelope_grids(sessions, tdb_range, rh_range, tdb_step, rh_step) -> list:
+    """(tdb, rh) points of the envelope of each session hour."""
+    tdb_decimals = max(0, -int(np.floor(np.log10(tdb_step))))
+    rh_decimals = max(0, -int(np.floor(np.log10(rh_step))))
+
+    grids = []
+    for _, session in sessions.iterrows():
+        tdb_min, tdb_max = (session.get(c, np.nan) for c in ENVELOPE_COLUMNS[:2])
+        rh_min, rh_max = (session.get(c, np.nan) for c in ENVELOPE_COLUMNS[2:])
+        tdb = np.round(
+            np.arange(
+                tdb_range[0] if pd.isna(tdb_min) else tdb_min,
+                (tdb_range[1] if pd.isna(tdb_max) else tdb_max) + tdb_step / 2,
+                tdb_step,
+            ),
+            tdb_decimals,
+        )
+        rh = np.round(
+            np.arange(
+                rh_range[0] if pd.isna(rh_min) else rh_min,
+                (rh_range[1] if pd.isna(rh_max) else rh_max) + rh_step / 2,
+                rh_step,
+            ),
+            rh_decimals,
+        )
+        tdb, rh = (axis.ravel() for axis in np.meshgrid(tdb, rh, indexing="ij"))
+        grids.append((tdb, rh))
+    return grids
+
+
+def _entries(grids, winds) -> int:
+    # the "low" wind is also stored under the key without wind, its default
+    return sum(
+        tdb.size * (2 if wind == "low" else 1)
+        for (tdb, _), wind in zip(grids, winds, strict=True)
+    )
+
+
+def count_risk_entries(
+    sessions: pd.DataFrame,
+    tdb_range=(25, 40),
+    rh_range=(30, 80),
+    tdb_step: float = 0.1,
+    rh_step: float = 1,
+) -> int:
+    """
+    Number of cache entries warm_up_risk_cache stores at most for the sessions, e.g. to size
+    the cache beforehand. The default envelope has 151 x 51 points, about 15k entries per
+    session hour with the "low" wind.
+    """
+    sessions = _unique_session_hours(sessions)
+    return _entries(
+        _envelope_grids(sessions, tdb_range, rh_range, tdb_step, rh_step),
+        sessions["wind"],
+    )
+
+
+def warm_up_risk_cache(
+    sessions: pd.DataFrame,
+    delta_mrt: pd.Series,
+    cache,
+    tdb_range=(25, 40),
+    rh_range=(30, 80),
+    tdb_step: float = 0.1,
+    rh_step: float = 1,
+    workers: int | None = None,
+) -> int:
+    """
+    Solve the risk over the tdb/rh envelope of every session hour and store it in a cache.
+
+    The keys match the keyword call calculate_risk_value(lat=..., lon=..., tz=...,
+    time_stamp=..., tdb=..., rh=..., sport_id=..., wind=...), with tdb and rh on the
+    envelope grid (tdb rounded to 0.1 °C and integer rh by default). For the "low" wind
+    the key without wind is also stored, since it is the default. Conditions whose risk
+    cannot be determined are not stored, calculate_risk_value raises a ValueError for them.
+
+    Parameters
+    ----------
+    sessions : pandas.DataFrame
+        Output of expand_schedule.
+    delta_mrt : pandas.Series
+        Output of warm_up_mrt_cache.
+    cache : cachetools.Cache
+        Cache of calculate_risk_value.
+    tdb_range, rh_range : tuple, optional
+        Default envelope, overridden per session by the columns tdb_min, tdb_max, rh_min and rh_max.
+    tdb_step, rh_step : float, optional
+        Resolution of the envelope, which should match the one of the live queries.
+    workers : int, optional
+        Number of processes over which the session hours are distributed.
+
+    Returns
+    -------
+    int
+        Number of entries stored in the cache.
+
+    Raises
+    ------
+    ValueError
+        If the cache cannot hold the entries of the envelope (see count_risk_entries)
+        besides the ones it already holds, since they would evict each other.
+    """
+    sessions = _unique_session_hours(sessions.assign(delta_mrt=delta_mrt))
+    grids = _envelope_grids(sessions, tdb_range, rh_range, tdb_step, rh_step)
+
+    n_entries = _entries(grids, sessions["wind"])
+    if n_entries > cache.maxsize - cache.currsize:
+        raise ValueError(
+            f"The warm-up envelope has {n_entries} entries but the cache can only hold "
+            f"{cache.maxsize - cache.currsize} more, resize the cache or narrow the "
+            "envelope."
+        )
+
+    codes = sport_registry.codes(sessions["sport_id"])
+    speeds = sport_registry.wind_speed(codes, sessions["wind"])
+    arguments = [
+        (tdb, rh, delta, v, code)
+        for (tdb, rh), delta, v, code in zip(
+            grids, sessions["delta_mrt"], speeds, codes, strict=True
+        )
+    ]
+    if workers == 1 or len(arguments) <= 1:
+        risks = [_envelope_risk(*argument) for argument in arguments]
+    else:
+        # the serving process has usually run the numba-compiled PHS model already, which
+        # is not fork-safe, hence the workers are spawned
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            risks = list(executor.map(_envelope_risk, *zip(*arguments, strict=True)))
+
+    stored = 0
+    for (_, session), (tdb, rh), risk in zip(
+        sessions.iterrows(), grids, risks, strict=True
+    ):
+        determined = ~np.isnan(risk)
+        for t, h, value in zip(
+            tdb[determined].tolist(),
+            rh[determined].tolist(),
+            risk[determined].astype(int).tolist(),
+            strict=True,
+        ):
+            keywords = {
+                "lat": session["lat"],
+                "lon": session["lon"],
+                "tz": session["tz"],
+                "time_stamp": session["time_stamp"],
+                "tdb": t,
+                "rh": h,
+                "sport_id": session["sport_id"],
+            }
+            cache[hashkey(**keywords, wind=session["wind"])] = value
+            stored += 1
+            if session["wind"] == "low":
+                cache[hashkey(**keywords)] = value
+                stored += 1
+    return stored
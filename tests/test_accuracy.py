@@ -0,0 +1,16 @@
+from risk_calculation.accuracy import (
+    DEFAULT_GATES,
+    FAST_PATHS,
+    check_accuracy_gates,
+    run_accuracy_harness,
+)
+
+
+def test_every_fast_path_has_gates():
+    assert set(FAST_PATHS) == set(DEFAULT_GATES)
+
+
+def test_accuracy_gates_hold_on_a_small_sample():
+    report = run_accuracy_harness(n_samples=200, seed=0)
+    assert set(report.index) == set(FAST_PATHS)
+    assert check_accuracy_gates(report) == []
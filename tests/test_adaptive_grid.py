@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from risk_calculation.adaptive_grid import evaluate_grid, evaluate_grid_adaptive
+from risk_calculation.new_risk_eq_v2 import (
+    get_sports_heat_stress_curves,
+    get_sports_heat_stress_curves_array,
+    sports_dict,
+)
+
+# grid of the figures of check_calculate_risk_value_grid
+TDB = np.arange(25, 45, 1.0)
+RH = np.arange(0, 101, 2.0)
+
+
+def _brute_force(evaluate, x, y):
+    return np.array([[evaluate(np.array([a]), np.array([b]))[0] for b in y] for a in x])
+
+
+def _levels(t, h):
+    # monotone in both coordinates, with NaN in one corner
+    values = np.digitize(t + h / 10, [35, 40, 45]).astype(float)
+    values[(t > 43) & (h > 95)] = np.nan
+    return values
+
+
+def test_adaptive_matches_brute_force_on_monotone_function():
+    values, n_evaluated = evaluate_grid_adaptive(_levels, TDB, RH)
+    np.testing.assert_array_equal(values, _brute_force(_levels, TDB, RH))
+    assert n_evaluated < TDB.size * RH.size
+
+
+def test_exact_matches_brute_force_on_non_monotone_function():
+    def isolated(t, h):
+        # a single point differs from its neighbours, the quadtree does not see it
+        return ((t == 30) & (h == 50)).astype(float)
+
+    values, n_evaluated = evaluate_grid(isolated, TDB, RH, exact=True)
+    np.testing.assert_array_equal(values, _brute_force(isolated, TDB, RH))
+    assert n_evaluated == TDB.size * RH.size
+
+
+def _scalar_risk(tdb, rh, delta_mrt, sport_id):
+    try:
+        return get_sports_heat_stress_curves(
+            tdb=tdb,
+            rh=rh,
+            tr=tdb + delta_mrt,
+            v=sports_dict[sport_id]["wind_low"],
+            sport_id=sport_id,
+        )
+    except ValueError:
+        return np.nan
+
+
+# golf has undetermined risks at night, without delta_mrt
+@pytest.mark.parametrize("sport_id, delta_mrt", [("soccer", 15.0), ("golf", 0.0)])
+@pytest.mark.parametrize("exact", [True, False])
+def test_risk_grid_matches_the_scalar_solution(sport_id, delta_mrt, exact):
+    def risk(t, h):
+        return get_sports_heat_stress_curves_array(
+            tdb=t,
+            rh=h,
+            tr=t + delta_mrt,
+            v=sports_dict[sport_id]["wind_low"],
+            sport_id=sport_id,
+        )
+
+    values, _ = evaluate_grid(risk, TDB, RH, exact=exact)
+
+    expected = [[_scalar_risk(t, h, delta_mrt, sport_id) for h in RH] for t in TDB]
+    np.testing.assert_array_equal(values, expected)
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from risk_calculation import aggregation
+from risk_calculation.aggregation import aggregate_risk
+from risk_calculation.new_risk_eq_v2 import get_heat_stress_risk_batch
+from risk_calculation.sport_registry import sport_registry
+
+
+@pytest.fixture(scope="module")
+def hourly():
+    rng = np.random.default_rng(0)
+    time_stamps = pd.date_range("2024-01-01", periods=24 * 4, freq="h")
+    hour = time_stamps.hour.to_numpy()
+    frames = []
+    for venue, (sport_id, v) in enumerate([("soccer", 1.0), ("tennis", 0.75)] * 2):
+        tdb = 30 + 8 * np.sin((hour - 9) / 24 * 2 * np.pi) + rng.normal(0, 1, hour.size)
+        frames.append(
+            pd.DataFrame(
+                {
+                    "venue": venue,
+                    "time_stamp": time_stamps,
+                    "tdb": np.round(tdb, 1),
+                    "rh": np.round(np.clip(70 - 2 * (tdb - 25), 5, 100)),
+                    "tr": np.round(
+                        tdb + np.clip(20 * np.sin((hour - 6) / 12 * np.pi), 0, None), 1
+                    ),
+                    "sport_id": sport_id,
+                    "v": v,
+                }
+            )
+        )
+    return pd.concat(frames, ignore_index=True)
+
+
+def _brute_force(hourly, level):
+    risk = get_heat_stress_risk_batch(
+        tdb=hourly["tdb"].to_numpy(),
+        rh=hourly["rh"].to_numpy(),
+        tr=hourly["tr"].to_numpy(),
+        v=hourly["v"].to_numpy(),
+        sport_codes=sport_registry.codes(hourly["sport_id"].to_numpy()),
+    )
+    df = hourly.assign(risk=risk, period=hourly["time_stamp"].dt.to_period("D"))
+    grouped = df.groupby(["venue", "period"])
+    expected = pd.DataFrame({"max_risk": grouped["risk"].max()})
+    for risk_level in range(4):
+        expected[f"hours_level_{risk_level}"] = grouped["risk"].agg(
+            lambda r, risk_level=risk_level: (r == risk_level).sum()
+        )
+    expected[f"hours_at_or_above_{level}"] = grouped["risk"].agg(
+        lambda r: (r >= level).sum()
+    )
+    expected[f"first_exceedance_{level}"] = (
+        df[df["risk"] >= level].groupby(["venue", "period"])["time_stamp"].min()
+    )
+    expected["hours_undetermined"] = grouped["risk"].agg(lambda r: r.isna().sum())
+    return expected
+
+
+@pytest.mark.parametrize("chunk_size", [aggregation.BOUNDS_CHUNK_SIZE, 7])
+def test_aggregation_matches_brute_force(hourly, monkeypatch, chunk_size):
+    monkeypatch.setattr(aggregation, "BOUNDS_CHUNK_SIZE", chunk_size)
+    summary = aggregate_risk(hourly, level=2, group_by=("venue",))
+
+    expected = _brute_force(hourly, level=2)
+    pd.testing.assert_frame_equal(
+        summary, expected, check_dtype=False, check_names=False
+    )
+    assert summary.attrs["evaluated_hours"] < summary.attrs["total_hours"]
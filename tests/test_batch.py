@@ -0,0 +1,41 @@
+import numpy as np
+
+from risk_calculation.batch import solve_unique_risk, unique_inputs
+from risk_calculation.new_risk_eq_v2 import get_heat_stress_risk_batch
+from risk_calculation.sport_registry import sport_registry
+
+
+def test_unique_inputs_scatter_back_to_every_row():
+    columns = {
+        "tdb": np.array([30.04, 30.0, -0.0, 0.0, 30.0]),
+        "code": np.array([1, 1, 2, 2, 2]),
+    }
+    quantized, index, inverse = unique_inputs(columns, {"tdb": 1})
+
+    # 30.04 rounds to 30.0 and -0.0 equals 0.0
+    assert len(index) == 3
+    for values in quantized.values():
+        np.testing.assert_array_equal(values[index][inverse], values)
+    np.testing.assert_array_equal(quantized["tdb"], [30.0, 30.0, -0.0, 0.0, 30.0])
+
+
+def test_sports_with_the_same_parameters_are_solved_once():
+    # same clo, met, duration and wind speeds, different sports
+    sport_codes = sport_registry.codes(["baseball", "cricket", "baseball", "tennis"])
+    assert len(set(sport_registry.param_code[sport_codes[:2]])) == 1
+    tdb = np.array([32.0, 32.0, 32.0, 32.0])
+    rh = np.array([60.0, 60.0, 40.0, 60.0])
+    delta_mrt = np.full(4, 10.0)
+
+    risk, n_solved = solve_unique_risk(tdb, rh, delta_mrt, sport_codes)
+
+    expected = get_heat_stress_risk_batch(
+        tdb=tdb,
+        rh=rh,
+        tr=tdb + delta_mrt,
+        v=sport_registry.wind_speed(sport_codes),
+        sport_codes=sport_codes,
+    )
+    np.testing.assert_array_equal(risk, expected)
+    # baseball and cricket at rh 60, baseball at rh 40 and tennis
+    assert n_solved == 3
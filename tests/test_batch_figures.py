@@ -0,0 +1,89 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from risk_calculation import batch_figures
+from risk_calculation.batch_figures import (
+    GRID_RH,
+    GRID_TDB,
+    MANIFEST_FILE,
+    figure_inputs_hash,
+    generate_risk_grid_figures,
+)
+
+LOCATION = {
+    "lat": -33.87,
+    "lon": 151.21,
+    "tz": "Australia/Sydney",
+    "time_stamp": "2024-02-01 12:00:00",
+}
+
+
+@pytest.fixture(autouse=True)
+def synthetic_grids(monkeypatch):
+    """Skip the risk solver, the figures are rendered from a synthetic grid."""
+
+    def calculate_risk_grids(lat, lon, tz, time_stamp, sport_ids, winds, **kwargs):
+        tdb, rh = np.meshgrid(GRID_TDB, GRID_RH, indexing="ij")
+        return pd.concat(
+            [
+                pd.DataFrame(
+                    {
+                        "sport_id": sport_id,
+                        "wind": wind,
+                        "tdb": tdb.ravel(),
+                        "rh": rh.ravel(),
+                        "risk": np.digitize(tdb + rh / 10, [35, 40, 45]).ravel(),
+                    }
+                )
+                for sport_id in sport_ids
+                for wind in winds
+            ],
+            ignore_index=True,
+        )
+
+    monkeypatch.setattr(batch_figures, "calculate_risk_grids", calculate_risk_grids)
+
+
+def _generate(output_dir, **kwargs):
+    return generate_risk_grid_figures(
+        **LOCATION,
+        sport_ids=["soccer"],
+        winds=("low", "med"),
+        output_dir=str(output_dir),
+        workers=1,
+        dpi=20,
+        **kwargs,
+    )
+
+
+def test_location_name_is_part_of_the_inputs_hash():
+    hashes = {
+        figure_inputs_hash(*LOCATION.values(), "soccer", "low", name, 300)
+        for name in ("Sydney", "Melbourne")
+    }
+    assert len(hashes) == 2
+
+
+def test_unchanged_figures_are_skipped(tmp_path):
+    assert len(_generate(tmp_path)["rendered"]) == 2
+    assert len(_generate(tmp_path)["skipped"]) == 2
+    assert len(_generate(tmp_path, location_name="Melbourne")["rendered"]) == 2
+
+
+def test_manifest_records_the_figures_rendered_before_a_failure(tmp_path):
+    # a directory in place of the figure makes its rendering fail
+    os.makedirs(tmp_path / "matrix_soccer_wind_med.png")
+    with pytest.raises(OSError):
+        _generate(tmp_path)
+
+    with open(tmp_path / MANIFEST_FILE) as f:
+        assert list(json.load(f)) == ["matrix_soccer_wind_low.png"]
+    os.rmdir(tmp_path / "matrix_soccer_wind_med.png")
+    results = _generate(tmp_path)
+    assert [os.path.basename(path) for path in results["rendered"]] == [
+        "matrix_soccer_wind_med.png"
+    ]
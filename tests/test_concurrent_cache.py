@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+
+from risk_calculation.concurrent_cache import ConcurrentCache
+
+N_THREADS = 8
+
+
+def _call_concurrently(cache, compute):
+    """Results (or exceptions) of N_THREADS callers of the same key, the first one first."""
+    results = [None] * N_THREADS
+
+    def call(i):
+        try:
+            results[i] = cache.get_or_compute("key", compute)
+        except (ValueError, _UncopyableError) as error:
+            results[i] = error
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(N_THREADS)]
+    threads[0].start()
+    while cache.stats()["misses"] == 0:
+        time.sleep(0.001)
+    for thread in threads[1:]:
+        thread.start()
+    return threads, results
+
+
+def _blocking(release, calls, error=None):
+    def compute():
+        calls.append(threading.get_ident())
+        release.wait()
+        if error is not None:
+            raise error
+        return 42
+
+    return compute
+
+
+def _wait_for_waiters(cache, threads, release):
+    while cache.stats()["coalesced"] < N_THREADS - 1:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+
+def test_concurrent_misses_are_computed_once():
+    cache, release, calls = ConcurrentCache(maxsize=16), threading.Event(), []
+    threads, results = _call_concurrently(cache, _blocking(release, calls))
+    _wait_for_waiters(cache, threads, release)
+
+    assert results == [42] * N_THREADS
+    assert len(calls) == 1
+    assert cache.stats()["coalesced"] == N_THREADS - 1
+    assert cache["key"] == 42
+
+
+def test_each_waiter_raises_its_own_exception():
+    cache, release, calls = ConcurrentCache(maxsize=16), threading.Event(), []
+    error = ValueError("no convergence")
+    threads, results = _call_concurrently(cache, _blocking(release, calls, error))
+    _wait_for_waiters(cache, threads, release)
+
+    assert len(calls) == 1
+    assert results[0] is error
+    assert len({id(result) for result in results}) == N_THREADS
+    for result in results[1:]:
+        assert type(result) is ValueError
+        assert result.args == error.args
+        assert result.__cause__ is error
+    # exceptions are not cached
+    assert "key" not in cache
+    assert cache.get_or_compute("key", lambda: 1) == 1
+
+
+class _UncopyableError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+def test_waiters_recompute_an_exception_that_cannot_be_copied():
+    cache, release, calls = ConcurrentCache(maxsize=16), threading.Event(), []
+    error = _UncopyableError(1, "failed")
+    compute = _blocking(release, calls, error)
+    threads, results = _call_concurrently(cache, compute)
+    _wait_for_waiters(cache, threads, release)
+
+    assert len(calls) == N_THREADS
+    assert all(isinstance(result, _UncopyableError) for result in results)
+
+
+def test_failure_of_the_first_caller_is_raised_to_it_unchanged():
+    cache = ConcurrentCache(maxsize=16)
+    with pytest.raises(KeyError, match="missing"):
+        cache.get_or_compute("key", lambda: {}["missing"])
@@ -0,0 +1,45 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from risk_calculation import diagnostics
+from risk_calculation.diagnostics import diagnostic_counts, record, reset_diagnostics
+
+
+@pytest.fixture(autouse=True)
+def reset():
+    reset_diagnostics()
+    yield
+    reset_diagnostics()
+
+
+@pytest.mark.parametrize("level", [logging.DEBUG, logging.WARNING])
+def test_counts_are_exact_across_threads(caplog, level):
+    caplog.set_level(logging.INFO, logger="risk_calculation")
+
+    def record_many(_):
+        for _ in range(2000):
+            record("event", level, "message %s", 1)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(record_many, range(8)))
+
+    assert diagnostic_counts() == {"event": 16_000}
+    emitted = [r for r in caplog.records if r.name == "risk_calculation"]
+    assert len(emitted) == (diagnostics.RATE_LIMIT if level >= logging.INFO else 0)
+
+
+def test_suppressed_messages_are_reported(caplog, monkeypatch):
+    caplog.set_level(logging.DEBUG, logger="risk_calculation")
+    now = [0.0]
+    monkeypatch.setattr(diagnostics.time, "monotonic", lambda: now[0])
+
+    for _ in range(diagnostics.RATE_LIMIT + 5):
+        record("event", logging.DEBUG, "message")
+    now[0] = diagnostics.RATE_INTERVAL
+    record("event", logging.DEBUG, "message")
+
+    messages = [r.getMessage() for r in caplog.records]
+    assert len(messages) == diagnostics.RATE_LIMIT + 1
+    assert messages[-1] == "message (5 similar messages suppressed)"
@@ -0,0 +1,50 @@
+from concurrent.futures import Future
+
+import numpy as np
+import pandas as pd
+
+from risk_calculation.distributed import read_sharded_output, run_sharded
+
+
+class _SerialExecutor:
+    """Executor running each shard in the calling process as soon as it is submitted."""
+
+    def submit(self, function, *args):
+        future = Future()
+        future.set_result(function(*args))
+        return future
+
+
+def _inputs():
+    # the venues have the same sanitized name
+    venues = pd.DataFrame(
+        {
+            "venue": ["St Kilda", "St_Kilda"],
+            "lat": [-37.86, -33.87],
+            "lon": [144.98, 151.21],
+            "tz": ["Australia/Melbourne", "Australia/Sydney"],
+            "sport_id": ["soccer", "tennis"],
+        }
+    )
+    time_stamps = pd.date_range("2023-12-31 20:00:00", periods=8, freq="h")
+    df = venues.loc[venues.index.repeat(len(time_stamps))].reset_index(drop=True)
+    df["time_stamp"] = np.tile(time_stamps.astype(str), len(venues))
+    df["tdb"] = np.linspace(24, 38, len(df)).round(1)
+    df["rh"] = 50.0
+    return df
+
+
+def test_colliding_venue_names_get_their_own_shards(tmp_path):
+    df = _inputs()
+    manifest = run_sharded(df, str(tmp_path), executor=_SerialExecutor())
+
+    assert len(manifest) == 4
+    assert manifest["path"].nunique() == 4
+    assert not manifest["skipped"].any()
+    df_risk = read_sharded_output(manifest)
+    assert len(df_risk) == len(df)
+    assert df_risk.groupby("lat")["tz"].nunique().eq(1).all()
+
+    resumed = run_sharded(df, str(tmp_path), executor=_SerialExecutor())
+    assert resumed["skipped"].all()
+    assert len(read_sharded_output(str(tmp_path))) == len(df)
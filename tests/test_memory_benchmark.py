@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from risk_calculation.harness import check_limits, fixed_offset_zones
+from risk_calculation.memory_benchmark import (
+    DEFAULT_BUDGETS,
+    STAGES,
+    check_memory_budgets,
+    memory_limits,
+    run_memory_benchmark,
+)
+
+
+def test_the_default_budgets_hold_for_a_small_workload():
+    report = run_memory_benchmark(n_rows=500)
+
+    assert list(report.index) == list(STAGES)
+    assert check_memory_budgets(report) == []
+
+
+def test_the_budgets_scale_with_the_rows():
+    limits = memory_limits({"mrt": {"peak_mb": (1.5, 300), "rss_peak_mb": 50}}, 10_000)
+
+    assert limits == {"mrt": {"peak_mb": pytest.approx(4.5), "rss_peak_mb": 50}}
+    assert set(memory_limits(DEFAULT_BUDGETS, 1)) == set(STAGES)
+
+
+def test_check_limits_reports_the_exceeded_limits():
+    report = pd.DataFrame({"peak_mb": [1.0, 3.0]}, index=["load", "mrt"])
+    limits = {"load": {"peak_mb": 2}, "mrt": {"peak_mb": 2}, "output": {"peak_mb": 0}}
+
+    assert check_limits(report, limits) == ["mrt: peak_mb = 3 > 2"]
+
+
+def test_fixed_offset_zones():
+    np.testing.assert_array_equal(
+        fixed_offset_zones([151.21, -0.13, -74.0, 180]),
+        ["Etc/GMT-10", "Etc/GMT", "Etc/GMT+5", "Etc/GMT-12"],
+    )
@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from risk_calculation.mrt_calculation import (
+    MRT_INTERPOLATION_ERROR,
+    calculate_mrt_series,
+)
+
+
+@pytest.mark.parametrize(
+    "lat, lon, tz, day",
+    [
+        (52.52, 13.405, "Europe/Berlin", "2024-06-01"),
+        (-33.87, 151.21, "Australia/Sydney", "2024-01-15"),
+        (1.35, 103.82, "Asia/Singapore", "2024-03-20"),
+    ],
+)
+@pytest.mark.parametrize("anchor_minutes", sorted(MRT_INTERPOLATION_ERROR))
+def test_interpolation_error_over_a_day(lat, lon, tz, day, anchor_minutes):
+    time_stamps = pd.date_range(day, periods=24 * 60, freq="min")
+    exact = calculate_mrt_series(lat, lon, tz, time_stamps)
+    interpolated = calculate_mrt_series(
+        lat, lon, tz, time_stamps, anchor_minutes=anchor_minutes
+    )
+
+    # the day includes the sunrise and the sunset
+    assert (exact == 0).any()
+    assert (exact > 0).any()
+    np.testing.assert_array_equal(interpolated[exact == 0], 0)
+    assert np.abs(interpolated - exact).max() <= MRT_INTERPOLATION_ERROR[anchor_minutes]
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+import scipy
+from pythermalcomfort.models import phs
+
+from risk_calculation.new_risk_eq_v2 import (
+    MAX_T_HIGH,
+    PHS_KWARGS,
+    T_CR_EXTREME,
+    THRESHOLD_BRACKETS,
+    _brentq_array,
+    solve_heat_stress_thresholds,
+)
+
+
+def _stepped(x, a, b):
+    # monotonic with flat steps, like the PHS outputs rounded to 0.1
+    return np.round(np.tanh((x - a) * b) * 10, 1) + 0.05
+
+
+def test_brentq_array_follows_the_scalar_iterates():
+    rng = np.random.default_rng(0)
+    a = rng.uniform(5, 30, 200)
+    b = rng.uniform(0.05, 2, 200)
+
+    roots = _brentq_array(_stepped, np.zeros(200), np.full(200, 36.0), args=(a, b))
+
+    expected = [scipy.optimize.brentq(_stepped, 0, 36, args=args) for args in zip(a, b)]
+    np.testing.assert_array_equal(roots, expected)
+
+
+def test_brentq_array_nan_without_sign_change():
+    roots = _brentq_array(
+        _stepped,
+        np.zeros(2),
+        np.full(2, 36.0),
+        args=(np.array([50.0, 10.0]), np.ones(2)),
+    )
+    assert np.isnan(roots[0])
+    assert roots[1] == scipy.optimize.brentq(_stepped, 0, 36, args=(10.0, 1.0))
+
+
+def _scalar_threshold(output, target, tr, v, rh, met, clo, duration):
+    def objective(x):
+        value = phs(
+            tdb=x,
+            tr=tr,
+            v=v,
+            rh=rh,
+            met=met,
+            clo=clo,
+            duration=duration,
+            **PHS_KWARGS,
+        )[output]
+        if output == "sweat_loss_g":
+            value = value / duration * 45
+        return value - target
+
+    for min_t, max_t in THRESHOLD_BRACKETS:
+        try:
+            return scipy.optimize.brentq(objective, min_t, max_t)
+        except ValueError:
+            pass
+    return np.nan
+
+
+@pytest.mark.parametrize("duration", [45, 60])
+def test_thresholds_match_the_scalar_brentq(duration):
+    rng = np.random.default_rng(duration)
+    rh = np.round(rng.uniform(10, 90, 8))
+    tr = np.round(rng.uniform(25, 70, 8), 1)
+    v, met, clo = 0.8, 7.5, 0.6
+
+    t_medium, t_extreme = solve_heat_stress_thresholds(
+        rh=rh, tr=tr, v=v, clo=clo, met=met, duration=duration
+    )
+
+    for i in range(len(rh)):
+        args = (tr[i], v, rh[i], met, clo, duration)
+        expected_medium = _scalar_threshold("sweat_loss_g", 850, *args)
+        expected_extreme = _scalar_threshold("t_cr", T_CR_EXTREME, *args)
+        if np.isnan(expected_extreme) and not np.isnan(expected_medium):
+            # fallback of get_sports_heat_stress_curves
+            expected_extreme = MAX_T_HIGH
+        np.testing.assert_array_equal(t_medium[i], expected_medium)
+        np.testing.assert_array_equal(t_extreme[i], expected_extreme)
@@ -0,0 +1,62 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from risk_calculation.reference_table import (
+    CACHE_DIR_VARIABLE,
+    REFERENCE_TABLE_FILE,
+    ReferenceTable,
+    build_reference_table,
+    reference_table_dir,
+)
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv(CACHE_DIR_VARIABLE, str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def small_table(tmp_path_factory):
+    """Parquet file with the rows of two sports, quicker to convert than the full table."""
+    df = pd.read_parquet(REFERENCE_TABLE_FILE)
+    path = tmp_path_factory.mktemp("input") / "small_table.parquet"
+    df[df.index.get_level_values("sport").isin(["soccer", "tennis"])].to_parquet(path)
+    return str(path)
+
+
+def test_the_table_is_built_in_the_cache_directory(cache_dir):
+    directory = reference_table_dir()
+    assert os.path.dirname(directory) == str(cache_dir)
+
+    table = ReferenceTable()
+    assert table.directory == directory
+    df = pd.read_parquet(REFERENCE_TABLE_FILE)
+    sample = df.sample(200, random_state=0)
+    for key, row in sample.iterrows():
+        assert table.lookup(*key) == pytest.approx(row.to_dict(), nan_ok=True)
+
+
+def test_concurrent_builds_publish_one_table(cache_dir, small_table):
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        directories = list(
+            executor.map(lambda _: build_reference_table(small_table), range(4))
+        )
+
+    assert len(set(directories)) == 1
+    # the copies of the processes that lost the race are discarded
+    assert os.listdir(cache_dir) == [os.path.basename(directories[0])]
+
+
+def test_a_published_table_is_kept(cache_dir, small_table):
+    table = ReferenceTable(parquet_path=small_table)
+    risk_file = os.path.join(table.directory, "risk.npy")
+    inode = os.stat(risk_file).st_ino
+
+    assert build_reference_table(small_table) == table.directory
+    assert os.stat(risk_file).st_ino == inode
+    assert np.array_equal(ReferenceTable(parquet_path=small_table).risk, table.risk)
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from risk_calculation import scheduling
+from risk_calculation.scheduling import _range_max, find_session_slots
+
+
+def _forecast(n_hours, venues=("a",)):
+    time_stamps = pd.date_range("2024-02-01 00:00", periods=n_hours, freq="h")
+    return pd.concat(
+        [
+            pd.DataFrame(
+                {
+                    "venue": venue,
+                    "lat": -33.87,
+                    "lon": 151.21,
+                    "tz": "Australia/Sydney",
+                    "time_stamp": time_stamps,
+                    "tdb": 25.0,
+                    "rh": 50.0,
+                }
+            )
+            for venue in venues
+        ],
+        ignore_index=True,
+    )
+
+
+@pytest.fixture
+def risk_of(monkeypatch):
+    """Replace the risk solved by calculate_risk_batch with given values, row by row."""
+
+    def set_risk(risk):
+        def calculate_risk_batch(df, **kwargs):
+            return df.assign(risk=np.asarray(risk, dtype=float))
+
+        monkeypatch.setattr(scheduling, "calculate_risk_batch", calculate_risk_batch)
+
+    return set_risk
+
+
+def _brute_force(risk, duration_hours, max_level):
+    slots = {}
+    for start in range(len(risk) - duration_hours):
+        window = risk[start : start + duration_hours + 1]
+        if np.isnan(window).any() or window.max() > max_level:
+            continue
+        slots[start] = (window.max(), window.mean())
+    return slots
+
+
+def test_range_max_matches_brute_force():
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=50)
+    starts = rng.integers(0, 49, 200)
+    stops = starts + rng.integers(1, 50 - starts)
+    expected = [
+        values[start:stop].max() for start, stop in zip(starts, stops, strict=True)
+    ]
+    np.testing.assert_array_equal(_range_max(values, starts, stops), expected)
+
+
+def test_slots_match_brute_force(risk_of):
+    risk = np.array([0, 1, 2, 1, 0, 0, 1, 3, 1, 0, 0, 1], dtype=float)
+    risk_of(risk)
+    slots = find_session_slots(
+        _forecast(len(risk)), "soccer", max_level=1, duration=120
+    )
+
+    expected = _brute_force(risk, 2, max_level=1)
+    assert slots.attrs["candidates"] == len(risk) - 2
+    assert {time_stamp.hour for time_stamp in slots["start"]} == set(expected)
+    for _, slot in slots.iterrows():
+        max_risk, mean_risk = expected[slot["start"].hour]
+        assert slot["max_risk"] == max_risk
+        assert slot["mean_risk"] == pytest.approx(mean_risk)
+        assert slot["end"] - slot["start"] == pd.Timedelta(minutes=120)
+    ranking = slots[["max_risk", "mean_risk"]].to_numpy()
+    assert (np.diff(ranking[:, 0]) >= 0).all()
+
+
+def test_undetermined_risk_only_excludes_the_sessions_including_it(risk_of):
+    risk = np.array([0, 0, np.nan, 0, 1, 0, 0, 1, 0, 0] * 2, dtype=float)
+    risk_of(risk)
+    with np.errstate(invalid="raise"):
+        slots = find_session_slots(
+            _forecast(10, venues=("a", "b")), "soccer", max_level=3, duration=60
+        )
+
+    assert slots["mean_risk"].notna().all()
+    expected = _brute_force(risk[:10], 1, max_level=3)
+    for venue in ("a", "b"):
+        venue_slots = slots[slots["venue"] == venue]
+        assert {time_stamp.hour for time_stamp in venue_slots["start"]} == set(expected)
+        for _, slot in venue_slots.iterrows():
+            assert slot["mean_risk"] == pytest.approx(expected[slot["start"].hour][1])
+
+
+def test_top_and_start_between(risk_of):
+    risk_of(np.zeros(48))
+    slots = find_session_slots(
+        _forecast(24, venues=("a", "b")),
+        "soccer",
+        duration=60,
+        start_between=("08:00", "12:00"),
+        top=2,
+    )
+    assert slots.groupby("venue").size().to_dict() == {"a": 2, "b": 2}
+    assert slots["start"].dt.hour.between(8, 12).all()
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+from risk_calculation import sensitivity
+from risk_calculation.new_risk_eq_v2 import get_heat_stress_risk_batch
+from risk_calculation.sensitivity import run_sensitivity_sweep
+
+CONDITIONS = pd.DataFrame(
+    {
+        "tdb": [28.0, 31.0, 34.0, 37.0],
+        "rh": [60.0, 50.0, 40.0, 30.0],
+        "tr": [35.0, 38.0, 41.0, 44.0],
+        "v": [1.0, 1.0, 1.0, 1.0],
+        "sport_id": ["soccer", "soccer", "tennis", "tennis"],
+    }
+)
+DISTRIBUTIONS = {"met": ("normal", 1, 0.05), "v": ("uniform", 0.5, 1.5)}
+
+
+def test_parallel_sweep_after_the_model_ran_in_the_parent():
+    # the PHS model runs in this process first, a forked pool would deadlock
+    get_heat_stress_risk_batch(
+        tdb=np.array([30.0]),
+        rh=np.array([50.0]),
+        tr=np.array([35.0]),
+        v=np.array([1.0]),
+        sport_codes=np.array([0]),
+    )
+    sensitivity._sweep_cache.clear()
+    parallel = run_sensitivity_sweep(
+        CONDITIONS, DISTRIBUTIONS, n_samples=20, workers=2, chunk_size=2
+    )
+    sensitivity._sweep_cache.clear()
+    serial = run_sensitivity_sweep(CONDITIONS, DISTRIBUTIONS, n_samples=20)
+
+    pd.testing.assert_frame_equal(parallel, serial)
+    probabilities = parallel[[*sensitivity.RISK_COLUMNS, "p_undetermined"]]
+    np.testing.assert_allclose(probabilities.sum(axis=1), 1)
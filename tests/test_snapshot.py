@@ -0,0 +1,85 @@
+import pandas as pd
+import pytest
+
+from risk_calculation import new_risk_eq_v2, sma_code_v2, snapshot
+from risk_calculation.concurrent_cache import concurrent_cached
+from risk_calculation.reference_table import REFERENCE_TABLE_FILE, ReferenceTable
+from risk_calculation.snapshot import (
+    restore_snapshot,
+    save_snapshot,
+    state_fingerprint,
+)
+from risk_calculation.threshold_surrogate import load_threshold_surrogate
+
+
+@concurrent_cached(maxsize=4, ttl=60)
+def _scaled(x, factor=1.0):
+    return x * factor
+
+
+@pytest.fixture
+def small_state(tmp_path, monkeypatch):
+    """Reference table of one sport, quicker to build than the full table."""
+    df = pd.read_parquet(REFERENCE_TABLE_FILE)
+    path = tmp_path / "small_table.parquet"
+    df[df.index.get_level_values("sport") == "soccer"].to_parquet(path)
+    table = ReferenceTable(str(tmp_path / "table"), parquet_path=str(path))
+    monkeypatch.setattr(sma_code_v2, "reference_table", table, raising=False)
+    yield table
+    _scaled.cache.clear()
+    _scaled.cache.resize(4, ttl=60)
+    load_threshold_surrogate.cache.clear()
+
+
+def test_round_trip_restores_the_tables_and_the_cache_entries(tmp_path, small_state):
+    for x in range(6):
+        _scaled(float(x), factor=2.0)
+    _scaled.cache.resize(64, ttl=600)
+    for x in range(6):
+        _scaled(float(x), factor=2.0)
+    path = save_snapshot(str(tmp_path / "warm.snapshot"), {"scaled": _scaled})
+
+    _scaled.cache.clear()
+    _scaled.cache.resize(4, ttl=60)
+    restored = restore_snapshot(path, {"scaled": _scaled})
+
+    # the cache is grown to hold the entries, with the ttl it was saved with
+    assert restored == {"scaled": 6}
+    assert _scaled.cache.maxsize >= 4 + 6
+    assert _scaled.cache.ttl == 600
+    misses = _scaled.cache.stats()["misses"]
+    assert [_scaled(float(x), factor=2.0) for x in range(6)] == [
+        2.0 * x for x in range(6)
+    ]
+    assert _scaled.cache.stats()["misses"] == misses
+
+    table = sma_code_v2.reference_table
+    assert table is not small_state
+    df = pd.read_parquet(REFERENCE_TABLE_FILE)
+    for key in df[df.index.get_level_values("sport") == "soccer"].index[::997]:
+        assert table.lookup(*key) == pytest.approx(
+            small_state.lookup(*key), nan_ok=True
+        )
+
+
+@pytest.mark.parametrize("constant", snapshot.RISK_CONSTANTS)
+def test_a_snapshot_of_other_model_constants_is_rejected(
+    tmp_path, small_state, monkeypatch, constant
+):
+    path = save_snapshot(str(tmp_path / "warm.snapshot"), {})
+    monkeypatch.setattr(
+        new_risk_eq_v2, constant, getattr(new_risk_eq_v2, constant) + 0.5
+    )
+
+    with pytest.raises(ValueError, match="model constants"):
+        restore_snapshot(path, {})
+
+
+def test_the_fingerprint_hashes_the_surrogate_coefficients(tmp_path, monkeypatch):
+    fingerprint = state_fingerprint()
+    surrogate_file = tmp_path / "surrogate.npz"
+    with open(snapshot.SURROGATE_FILE, "rb") as f:
+        surrogate_file.write_bytes(f.read() + b"\0")
+    monkeypatch.setattr(snapshot, "SURROGATE_FILE", str(surrogate_file))
+
+    assert state_fingerprint() != fingerprint
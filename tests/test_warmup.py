@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+from cachetools import LRUCache
+from cachetools.keys import hashkey
+
+import main
+from risk_calculation.concurrent_cache import ConcurrentCache
+from risk_calculation.mrt_calculation import (
+    MRT_CACHE_SIZE,
+    MRT_CACHE_TTL,
+    calculate_mrt,
+)
+from risk_calculation.warmup import (
+    count_risk_entries,
+    expand_schedule,
+    warm_up_mrt_cache,
+    warm_up_risk_cache,
+)
+
+SESSION = {
+    "venue": "sydney",
+    # rounded to -33.87 by the built-in round and to -33.86 by NumPy
+    "lat": -33.865,
+    "lon": 151.21,
+    "tz": "Australia/Sydney",
+    "sport_id": "soccer",
+    "start": "2024-02-01 15:00:00",
+    "end": "2024-02-01 15:45:00",
+    "tdb_min": 30.0,
+    "tdb_max": 30.2,
+    "rh_min": 50,
+    "rh_max": 52,
+}
+
+
+@pytest.fixture
+def live_caches():
+    yield
+    for function, maxsize, ttl in [
+        (calculate_mrt, MRT_CACHE_SIZE, MRT_CACHE_TTL),
+        (main.calculate_risk_value, main.RISK_CACHE_SIZE, main.RISK_CACHE_TTL),
+    ]:
+        function.cache.clear()
+        function.cache.resize(maxsize, ttl=ttl)
+
+
+def test_warm_up_from_schedule_serves_the_live_queries(tmp_path, live_caches):
+    path = tmp_path / "schedule.csv"
+    pd.DataFrame([SESSION]).to_csv(path, index=False)
+
+    entries = main.warm_up_from_schedule(str(path), ttl=7200)
+
+    # 3 tdb x 3 rh, with and without the default wind
+    assert entries == {"mrt": 1, "risk": 18}
+    assert main.calculate_risk_value.cache.maxsize >= main.RISK_CACHE_SIZE + 18
+    assert main.calculate_risk_value.cache.ttl == 7200
+    assert (
+        hashkey(
+            lat=-33.87, lon=151.21, tz="Australia/Sydney", time_stamp=SESSION["start"]
+        )
+        in calculate_mrt.cache
+    )
+    query = {key: SESSION[key] for key in ("lat", "lon", "tz", "sport_id")}
+    risk = main.calculate_risk_value(
+        **query, time_stamp=SESSION["start"], tdb=30.1, rh=51.0
+    )
+    assert main.calculate_risk_value.cache.stats()["misses"] == 0
+    assert risk == main.calculate_risk_value.__wrapped__(
+        **query, time_stamp=SESSION["start"], tdb=30.1, rh=51.0
+    )
+
+
+def test_warm_up_raises_if_the_envelope_does_not_fit():
+    sessions = expand_schedule(
+        pd.DataFrame([SESSION]).assign(
+            start=lambda df: pd.to_datetime(df["start"]),
+            end=lambda df: pd.to_datetime(df["end"]),
+            wind="low",
+        )
+    )
+    assert count_risk_entries(sessions) == 18
+    delta_mrt = warm_up_mrt_cache(sessions, LRUCache(maxsize=10))
+
+    with pytest.raises(ValueError, match="18 entries"):
+        warm_up_risk_cache(sessions, delta_mrt, LRUCache(maxsize=17), workers=1)
+
+    cache = LRUCache(maxsize=18)
+    assert warm_up_risk_cache(sessions, delta_mrt, cache, workers=1) == 18
+    assert np.isin(list(cache.values()), [0, 1, 2, 3]).all()
+
+
+def test_resize_keeps_the_entries():
+    cache = ConcurrentCache(maxsize=16, ttl=60, stripes=4)
+    for key in range(10):
+        cache[key] = key
+    cache.resize(1000, ttl=120)
+    assert cache.maxsize == 1000
+    assert cache.ttl == 120
+    assert dict(cache.items()) == {key: key for key in range(10)}